@@ -0,0 +1,63 @@
+""" Compare finding the forecasts covering an hour through the archive index and by reading every forecast.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_archive.py
+"""
+
+import datetime
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from clearDarkSkyArchive import ForecastArchive
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyWeb import parseForecast
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+# Hourly fetches over 30 days, each forecast shifted by an hour
+FETCHES = 30 * 24
+REPEAT = 20
+
+
+def shifted(frame, hours):
+    """ The same forecast, hours later. """
+    delta = datetime.timedelta(hours=hours)
+    return ForecastFrame.fromColumns([timestamp + delta for timestamp in frame.timestamps], frame.values,
+                                     frame.minimums, frame.maximums, frame.transparency, frame.darkness)
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        frame = parseForecast(f.read())
+    hour = frame.timestamps[0] + datetime.timedelta(hours=FETCHES // 2)
+    with tempfile.TemporaryDirectory() as directory:
+        archive = ForecastArchive(os.path.join(directory, 'archive'), retention=FETCHES * 3600)
+        pickles = []
+        start = time.perf_counter()
+        for i in range(FETCHES):
+            archive.append('AlbanyNY', shifted(frame, i), fetched=1000.0 + i * 3600)
+        appendSeconds = time.perf_counter() - start
+        for i in range(FETCHES):
+            pickles.append(zlib.compress(pickle.dumps(shifted(frame, i).toWeatherData())))
+        archived = sum(os.path.getsize(os.path.join(root, name))
+                       for root, _, names in os.walk(archive.directory) for name in names if name.endswith('.seg'))
+        print(f'{FETCHES} forecasts: {archived / 1024:.0f} KiB archived ({archived / FETCHES:.0f} B each), '
+              f'{sum(len(p) for p in pickles) / 1024:.0f} KiB as compressed pickles, '
+              f'append {appendSeconds / FETCHES * 1e3:.2f} ms each')
+
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            found = archive.covering('AlbanyNY', hour)
+        indexed = (time.perf_counter() - start) / REPEAT
+        start = time.perf_counter()
+        for _ in range(REPEAT):
+            scanned = [data for data in (pickle.loads(zlib.decompress(p)) for p in pickles) if hour in data]
+        scan = (time.perf_counter() - start) / REPEAT
+        print(f'covering one hour ({len(found)} of {FETCHES} forecasts): index {indexed * 1e3:.1f} ms, '
+              f'scan {scan * 1e3:.1f} ms ({scan / indexed:.1f}x)')
+        assert len(found) == len(scanned)
+        archive.close()
+
+
+if __name__ == '__main__':
+    main()
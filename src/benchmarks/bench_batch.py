@@ -0,0 +1,38 @@
+""" Compare per-profile checkForAlert with ProfileBatch over many profiles watching one location.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_batch.py
+"""
+
+import random
+import time
+
+from clearDarkSkyBatch import ProfileBatch
+from clearDarkSkyForecast import ForecastFrame
+from tests.sampleData import randomProfile, readSampleData
+
+PROFILES = 10000
+
+
+def main():
+    random.seed(0)
+    frame = ForecastFrame.fromWeatherData(readSampleData())
+    profiles = [randomProfile() for _ in range(PROFILES)]
+
+    started = time.perf_counter()
+    expected = [profile.checkForAlert(frame) for profile in profiles]
+    perProfile = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = ProfileBatch(profiles)
+    built = time.perf_counter()
+    results = batch.checkForAlerts(frame)
+    finished = time.perf_counter()
+
+    assert results == expected
+    print(f'{PROFILES} profiles x {len(frame)} hours')
+    print(f'per profile: {perProfile * 1000:.1f} ms ({PROFILES / perProfile:,.0f} profiles/s)')
+    print(f'batch:       {(finished - started) * 1000:.1f} ms ({PROFILES / (finished - started):,.0f} profiles/s), '
+          f'of which building thresholds {(built - started) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
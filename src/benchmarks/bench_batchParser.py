@@ -0,0 +1,43 @@
+""" Show how BatchParser scales with worker processes on a corpus of recorded pages.
+The corpus is the recorded sample page repeated, parsing cost does not depend on the location.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_batchParser.py
+"""
+
+import os
+import time
+
+import clearDarkSkyWeb as web
+from clearDarkSkyParallel import BatchParser
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+PAGES = 400
+CHUNK_SIZE = 8
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        content = f.read()
+    corpus = [content] * PAGES
+    start = time.perf_counter()
+    for page in corpus:
+        web.parseForecast(page)
+    serial = time.perf_counter() - start
+    print(f'{PAGES} pages, {os.cpu_count()} core(s)')
+    print(f'{"workers":>7} {"seconds":>8} {"pages/s":>8} {"speedup":>8} {"efficiency":>10}')
+    print(f'{"serial":>7} {serial:>8.2f} {PAGES / serial:>8.0f} {1.0:>8.2f} {1.0:>10.0%}')
+    counts = sorted({2 ** i for i in range(os.cpu_count().bit_length())} | {os.cpu_count()})
+    for workers in counts:
+        parser = BatchParser(workers=workers, chunkSize=CHUNK_SIZE)
+        # Start the workers before timing, spawning them is a one time cost
+        parser.parse([content] * workers)
+        start = time.perf_counter()
+        forecasts = parser.parse(corpus)
+        seconds = time.perf_counter() - start
+        parser.shutdown()
+        assert all(forecast is not None for forecast in forecasts)
+        print(f'{workers:>7} {seconds:>8.2f} {PAGES / seconds:>8.0f} {serial / seconds:>8.2f} '
+              f'{serial / seconds / workers:>10.0%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+""" Show how AlertProfile.checkForAlert scales with forecast length and profile count.
+Compares the previous implementation, which rebuilt the key list for every hour,
+with the single-pass run finder on dict forecasts and on ForecastFrame forecasts.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_checkForAlert.py
+"""
+
+import random
+import time
+
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyModel import AlertProfile
+from tests.sampleData import randomProfile, randomWeatherData
+
+HOURS = [48, 96, 192, 384]
+PROFILES = 2000
+LEGACY_PROFILES = 100
+
+
+def legacyCheckForAlert(profile, weatherData):
+    """ The quadratic checkForAlert loop this benchmark measures against. """
+    checkHour = profile._AlertProfile__checkHour
+    duration = profile.get(AlertProfile.DURATION)
+    matches = []
+    matching_num = 0
+    start = None
+    for h in range(0, len(weatherData)):
+        key = list(weatherData.keys())[h]
+        hour = weatherData[key]
+        isValid = checkHour(hour)
+        if isValid:
+            matching_num += 1
+            if matching_num == 1:
+                start = hour.timestamp
+        if not isValid and matching_num >= duration:
+            key = list(weatherData.keys())[h-1]
+            end = weatherData[key].timestamp
+            matches.append((start, end))
+            matching_num = 0
+        if h == len(weatherData) - 1 and matching_num >= duration:
+            end = weatherData[key].timestamp
+            matches.append((start, end))
+    return matches
+
+
+def perProfile(check, profiles, weatherData):
+    """ Return the mean microseconds to check one profile. """
+    started = time.perf_counter()
+    for profile in profiles:
+        check(profile, weatherData)
+    return (time.perf_counter() - started) / len(profiles) * 1e6
+
+
+def main():
+    random.seed(0)
+    profiles = [randomProfile() for _ in range(PROFILES)]
+    print(f'{"hours":>6} {"legacy us":>10} {"dict us":>10} {"frame us":>10} {"cycle s":>8}')
+    for hours in HOURS:
+        weatherData = randomWeatherData(hours)
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        legacy = perProfile(legacyCheckForAlert, profiles[:LEGACY_PROFILES], weatherData)
+        linear = perProfile(AlertProfile.checkForAlert, profiles, weatherData)
+        columnar = perProfile(AlertProfile.checkForAlert, profiles, frame)
+        print(f'{hours:>6} {legacy:>10.0f} {linear:>10.0f} {columnar:>10.0f} {columnar * PROFILES / 1e6:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+""" Compare memory and evaluation cost of dict-of-PointInTime and ForecastFrame forecasts.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_forecastFrame.py
+"""
+
+import os
+import random
+import timeit
+import tracemalloc
+
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyWeb import parseWeatherData
+from tests.sampleData import randomProfile
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+PROFILES = 1000
+
+
+def measureMemory(build):
+    """ Return the bytes still allocated by the object build returns. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        content = f.read()
+    weatherData = parseWeatherData(content)
+    dictBytes = measureMemory(lambda: parseWeatherData(content))
+    frameBytes = measureMemory(lambda: ForecastFrame.fromWeatherData(weatherData))
+    print(f'memory: dict {dictBytes / 1024:.1f} KiB, frame {frameBytes / 1024:.1f} KiB '
+          f'({dictBytes / frameBytes:.1f}x smaller)')
+
+    random.seed(0)
+    profiles = [randomProfile() for _ in range(PROFILES)]
+    frame = ForecastFrame.fromWeatherData(weatherData)
+    dictSeconds = timeit.timeit(lambda: [p.checkForAlert(weatherData) for p in profiles], number=1)
+    frameSeconds = timeit.timeit(lambda: [p.checkForAlert(frame) for p in profiles], number=1)
+    print(f'evaluate {PROFILES} profiles: dict {dictSeconds * 1000:.1f} ms, frame {frameSeconds * 1000:.1f} ms '
+          f'({dictSeconds / frameSeconds:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+""" Show how fast LocationIndex answers autocomplete queries with many keys.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_locationIndex.py
+"""
+
+import random
+import string
+import time
+
+from clearDarkSkyLocations import LocationIndex
+
+KEYS = [1000, 10000, 50000, 100000]
+QUERIES = 10000
+
+
+def randomKey():
+    """ A key shaped like a cleardarksky one, such as AlbanyNY or BttlRvr0AB. """
+    length = random.randint(4, 8)
+    return ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(length)) \
+        + ''.join(random.choice(string.ascii_uppercase) for _ in range(2))
+
+
+def main():
+    random.seed(0)
+    print(f'{"keys":>8} {"build ms":>10} {"suggest us":>11}')
+    for count in KEYS:
+        keys = [randomKey() for _ in range(count)]
+        start = time.perf_counter()
+        index = LocationIndex(keys)
+        build = time.perf_counter() - start
+        prefixes = [random.choice(keys)[:random.randint(0, 3)] for _ in range(QUERIES)]
+        start = time.perf_counter()
+        for prefix in prefixes:
+            index.suggest(prefix)
+        suggest = (time.perf_counter() - start) / QUERIES
+        print(f'{count:>8} {build * 1000:>10.1f} {suggest * 1e6:>11.2f}')
+
+
+if __name__ == '__main__':
+    main()
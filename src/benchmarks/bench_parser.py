@@ -0,0 +1,27 @@
+""" Benchmark the BeautifulSoup and fast forecast page parsers.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_parser.py
+"""
+
+import os
+import timeit
+
+from clearDarkSkyConstants import *
+import clearDarkSkyWeb as web
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+REPEAT = 50
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        content = f.read()
+    timings = dict()
+    for parser in [PARSER_SOUP, PARSER_FAST]:
+        seconds = timeit.timeit(lambda: web.parseWeatherData(content, parser), number=REPEAT)
+        timings[parser] = seconds / REPEAT * 1000
+        print(f'{parser:>5}: {timings[parser]:.2f} ms per page')
+    print(f'speedup: {timings[PARSER_SOUP] / timings[PARSER_FAST]:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+""" Compare the memory of 1k cached forecasts held as dict based and slotted PointInTime objects.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_pointInTime.py
+"""
+
+import os
+import pickle
+import tracemalloc
+
+from clearDarkSkyConstants import *
+from clearDarkSkyModel import PointInTime
+from clearDarkSkyWeb import parseWeatherData
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+LOCATIONS = 1000
+
+
+class LegacyPointInTime:
+    """ PointInTime as it was before slots, an instance dictionary plus a data dictionary. """
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.data = dict()
+
+    def add(self, attribute, value):
+        if attribute == WeatherAttribute.DARKNESS:
+            if attribute not in self.data:
+                self.data[attribute] = [value]
+            else:
+                self.data[attribute].append(value)
+        else:
+            self.data[attribute] = value
+
+
+def copyForecast(weatherData, cls):
+    """ Build a new forecast of cls hours with the values of weatherData, as parsing another page would. """
+    forecast = dict()
+    for timestamp, hour in weatherData.items():
+        copy = forecast[timestamp] = cls(timestamp)
+        for attribute, value in hour.data.items():
+            if attribute == WeatherAttribute.DARKNESS:
+                for darkness in value:
+                    copy.add(attribute, darkness)
+            else:
+                copy.add(attribute, value)
+    return forecast
+
+
+def measureMemory(build):
+    """ Return the bytes still allocated by the object build returns. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        weatherData = parseWeatherData(f.read())
+    print(f'{LOCATIONS} locations of {len(weatherData)} hours')
+    sizes = dict()
+    for name, cls in [('dict', LegacyPointInTime), ('slots', PointInTime)]:
+        sizes[name] = measureMemory(lambda: [copyForecast(weatherData, cls) for _ in range(LOCATIONS)])
+        pickled = len(pickle.dumps(copyForecast(weatherData, cls), protocol=pickle.HIGHEST_PROTOCOL))
+        print(f'{name:>5}: {sizes[name] / 1024 / 1024:.1f} MiB in memory, {pickled / 1024:.1f} KiB pickled per location')
+    print(f'{sizes["dict"] / sizes["slots"]:.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
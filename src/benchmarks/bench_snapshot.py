@@ -0,0 +1,52 @@
+""" Compare the size and load time of a forecast stored as a pickle and as a snapshot.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_snapshot.py
+"""
+
+import os
+import pickle
+import tempfile
+import timeit
+
+from clearDarkSkyConstants import *
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkySnapshot import Snapshot, writeSnapshot
+from clearDarkSkyWeb import parseWeatherData
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+REPEAT = 1000
+
+
+def loadPickle(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+def loadSnapshot(filename):
+    return Snapshot.open(filename).frame()
+
+
+def loadColumn(filename):
+    return Snapshot.open(filename).column(WeatherAttribute.CLOUD_COVER)
+
+
+def main():
+    with open(SAMPLE_PAGE, 'rb') as f:
+        weatherData = parseWeatherData(f.read())
+    frame = ForecastFrame.fromWeatherData(weatherData)
+    with tempfile.TemporaryDirectory() as directory:
+        files = [('pickle dict', os.path.join(directory, 'dict.pickle'), loadPickle),
+                 ('pickle frame', os.path.join(directory, 'frame.pickle'), loadPickle),
+                 ('snapshot', os.path.join(directory, 'frame.cdsf'), loadSnapshot),
+                 ('one column', os.path.join(directory, 'frame.cdsf'), loadColumn)]
+        for data, (_, filename, _) in zip([weatherData, frame], files):
+            with open(filename, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        writeSnapshot(files[2][1], frame, '2023-05-25 13:12:13')
+        print(f'{"format":>12} {"bytes":>7} {"load us":>8}')
+        for name, filename, load in files:
+            seconds = timeit.timeit(lambda: load(filename), number=REPEAT)
+            print(f'{name:>12} {os.path.getsize(filename):>7} {seconds / REPEAT * 1e6:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+""" Compare parsing every area title of a recorded page with and without the decode table and cache.
+Run from the repository root with: PYTHONPATH=src python src/benchmarks/bench_textToValue.py
+"""
+
+import os
+import timeit
+
+from clearDarkSkyConstants import *
+import clearDarkSkyHelpers as helpers
+import clearDarkSkyWeb as web
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'data', 'AlbanyNY.html')
+REPEAT = 200
+
+
+def readTitles():
+    """ Get the (attribute, text) of every area on the sample page, as the parser passes them. """
+    with open(SAMPLE_PAGE, 'rb') as f:
+        html = f.read().decode('utf-8', errors='replace')
+    titles = []
+    for title, coords in web.iterMapAreas(html):
+        parts = title.split(':', 2)
+        attribute = Y_CORD_TO_ATTRIBUTE[int(coords.split(',')[1])]
+        titles.append((attribute, parts[2].strip() if len(parts) == 3 else ''))
+    return titles
+
+
+def main():
+    titles = readTitles()
+    decoder = helpers.ValueDecoder()
+    for attribute, text in titles:
+        assert decoder.decode(attribute, text) == helpers.parseValue(attribute, text)
+    decoder.clear()
+    timings = dict()
+    for name, decode in [('parse', helpers.parseValue), ('decode', decoder.decode)]:
+        seconds = timeit.timeit(lambda: [decode(attribute, text) for attribute, text in titles], number=REPEAT)
+        timings[name] = seconds / REPEAT * 1000
+        print(f'{name:>6}: {timings[name]:.3f} ms per page of {len(titles)} titles')
+    print(f'speedup: {timings["parse"] / timings["decode"]:.1f}x')
+    print(f'table hits: {decoder.stats["tableHits"]}, cache hits: {decoder.stats["hits"]}, '
+          f'misses: {decoder.stats["misses"]}, hit rate: {decoder.hitRate():.1%}')
+
+
+if __name__ == '__main__':
+    main()
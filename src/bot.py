@@ -1,14 +1,19 @@
+import asyncio
 import os
 
 import discord
 from discord.ext import tasks as discordTasks
 from dotenv import load_dotenv
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-
 import clearDarkSkyModel as cds
 import clearDarkSkyWeb as cds_web
+import clearDarkSkyHelpers as helpers
+from clearDarkSkyCycle import AlertCycle
+from clearDarkSkyArchive import forecastArchive
+from clearDarkSkyCache import TtlLruCache, forecastCache, locationKeyCache
+from clearDarkSkyLocations import locationIndex
+from clearDarkSkyParallel import BatchParser
+from clearDarkSkySchedule import SchedulerManager, ShardedSchedule
 
 from clearDarkSkyConstants import *
 
@@ -28,9 +33,9 @@ async def on_ready():
     await tree.sync()
     print(f'{client.user} has connected to Discord!')
 
-    scheduler = AsyncIOScheduler()
-    scheduler.add_job(checkAlerts, CronTrigger(hour=7, minute=0, second=0))
-    scheduler.start()
+    # on_ready fires again after every gateway reconnect, the scheduler must only start once
+    if schedulerManager.start(checkShard, len(cds.AlertProfile.store.locations())):
+        print(f"Scheduled {alertSchedule.shards} alert shard(s).")
 
 
 # Classes
@@ -49,7 +54,7 @@ class UpdateAttribute(discord.ui.View):
     async def callback(self, interaction):
         profile = cds.AlertProfile(interaction.user.id, self.alert_profile_name)
         try:
-            profile.load()
+            await profile.aload()
         except FileNotFoundError:
             await interaction.response.send_message(f"Alert profile {self.alert_profile_name} does not exist!")
             return
@@ -62,7 +67,7 @@ class UpdateAttribute(discord.ui.View):
         elif self.attribute == WeatherAttribute.TEMPERATURE:
             temps = [float(x) for x in interaction.data['values']]
             profile.add(WeatherAttribute.TEMPERATURE, (min(temps), max(temps)))
-        profile.save()
+        await profile.asave()
         await interaction.response.send_message("Successfully updated!")
 
 class UpdateSelectAttribute(discord.ui.View):
@@ -86,26 +91,35 @@ class UpdateSelectAttribute(discord.ui.View):
 @discord.app_commands.describe(duration='min duration in hours')
 async def _createAlertProfile(interaction, location: str, alert_profile_name: str, duration: int):
     await interaction.response.defer()
-    if not cds_web.validateLocationKey(location):
+    if not await cds_web.validateLocationKeyAsync(location):
+        if cds_web.hostBreaker().isOpen():
+            await interaction.followup.send("Clear Dark Sky is not responding, please try again later.")
+            return
         await interaction.followup.send("Invalid location! (examples: AlbanyNY, BttlRvr0AB, NrthCpPE, etc)\n \
             Find you location key from the url of your location and try again.")
         return
 
+    locationIndex.add(location)
     profile = cds.AlertProfile(interaction.user.id, alert_profile_name, location)
     profile.setDuration(duration)
-    profile.save()
+    await profile.asave()
 
     response = f"Successfully created alert profile {alert_profile_name} for {location}!"
     response += f"\nUse the `update_alert` command to set alert profile attributes."
     await interaction.followup.send(response)
 
 
+@_createAlertProfile.autocomplete('location')
+async def _locationAutocomplete(interaction, current: str):
+    return [discord.app_commands.Choice(name=key, value=key) for key in locationIndex.suggest(current)]
+
+
 @tree.command(name = "update_alert", description = "Update an alert profile")
 @discord.app_commands.describe(alert_profile_name='alert profile name')
 async def _updateAlertProfile(interaction, alert_profile_name: str):
     profile = cds.AlertProfile(interaction.user.id, alert_profile_name)
     try:
-        profile.load()
+        await profile.aload()
     except FileNotFoundError:
         await interaction.response.send_message(f"Alert profile {alert_profile_name} does not exist!")
         return
@@ -119,7 +133,7 @@ async def _updateAlertProfile(interaction, alert_profile_name: str):
 @discord.app_commands.describe(alert_profile_name='alert profile name')
 async def _deleteAlertProfile(interaction, alert_profile_name: str):
     profile = cds.AlertProfile(interaction.user.id, alert_profile_name)
-    if profile.delete():
+    if await profile.adelete():
         await interaction.response.send_message(f"Successfully deleted alert profile {alert_profile_name}!")
     else:
         await interaction.response.send_message(f"Failed to delete alert profile {alert_profile_name}!")
@@ -127,7 +141,7 @@ async def _deleteAlertProfile(interaction, alert_profile_name: str):
 
 @tree.command(name = "list_alerts", description = "List all of your alert profiles")
 async def _listAlertProfile(interaction):
-    profiles = cds.AlertProfile.getAllForUser(interaction.user.id)
+    profiles = await cds.AlertProfile.agetAllForUser(interaction.user.id)
     if len(profiles) == 0:
         await interaction.response.send_message("You have no alert profiles!")
         return
@@ -143,73 +157,129 @@ async def _checkAlertProfile(interaction, alert_profile_name: str):
     await interaction.response.defer()
     profile = cds.AlertProfile(interaction.user.id, alert_profile_name)
     try:
-        profile.load()
+        await profile.aload()
     except FileNotFoundError:
         await interaction.followup.send(f"Alert profile {alert_profile_name} does not exist!")
         return
     location = profile.get(cds.AlertProfile.LOCATION)
-    weatherData = cds_web.extractWeatherData(location)
+    weatherData = await cds_web.extractWeatherDataAsync(location)
     if weatherData is None:
         await interaction.followup.send(f"Failed to get weather data for {location}!")
         return
-    response = f"For {location}..."
     result = profile.checkForAlert(weatherData)
-    if len(result) == 0:
-        response += "\nNo alerts!"
-    else:
-        response += "\nConditions met from "
-        for i in range(len(result)):
-            alert = result[i]
-            if i > 0 and (i != len(result) - 1 or len(result) > 2):
-                response += ", "
-            elif i > 0:
-                response += " and "
-            time1 = alert[0]
-            time2 = alert[1]
-            if time1.day == time2.day:
-                response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%H:%M')}"
-            else:
-                response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%B %d, %H:%M')}"
+    response = helpers.alertWindowsToText(location, result)
     await interaction.followup.send(response)
 
 
-async def checkAlerts():
+userCache = TtlLruCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+async def resolveUser(userId):
+    # The gateway cache and our own cache are free, fetch_user is a REST call
+    userId = int(userId)
+    user = client.get_user(userId)
+    if user is None:
+        user = userCache.get(userId)
+    if user is None:
+        user = await client.fetch_user(userId)
+        userCache.put(userId, user)
+    return user
+
+
+async def sendAlert(username, message):
+    user = await resolveUser(username)
+    await user.send(message)
+
+
+# Parsing runs on a process pool so a large cycle is not held to the event loop's core
+batchParser = BatchParser()
+alertCycle = AlertCycle(sendAlert, executor=batchParser.executor)
+alertSchedule = ShardedSchedule()
+schedulerManager = SchedulerManager(alertSchedule)
+cycleLock = None
+# Profiles skipped while Clear Dark Sky was down, and the one call_later handle that checks them again
+retryProfiles = dict()
+retryHandle = None
+
+
+async def checkAlerts(profiles=None):
+    global cycleLock
+    if cycleLock is None:
+        cycleLock = asyncio.Lock()
     print("Checking alerts...")
-    for profile in cds.AlertProfile.getAll():
-        try:
-            profile.load()
-            location = profile.get(cds.AlertProfile.LOCATION)
-            weatherData = cds_web.extractWeatherData(location)
-            print(f"Checking {location}...")
-            if weatherData is None:
-                continue
-            result = profile.checkForAlert(weatherData)
-            if len(result) == 0:
-                continue
-            response = f"For {location}..."
-            response += "\nConditions met from "
-            for i in range(len(result)):
-                alert = result[i]
-                if i > 0 and (i != len(result) - 1 or len(result) > 2):
-                    response += ", "
-                elif i > 0:
-                    response += " and "
-                time1 = alert[0]
-                time2 = alert[1]
-                if time1.day == time2.day:
-                    response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%H:%M')}"
-                else:
-                    response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%B %d, %H:%M')}"
-            userId = profile.username
-            print(f"Sending alert to {userId}...")
-            user = await client.fetch_user(userId)
-            await user.send(response)
-        except:
-            print(f"Failed to check {profile.name}!")
-            continue
+    if profiles is None:
+        profiles = cds.AlertProfile.getAll()
+    # Cycles share alertCycle and its stats, so overlapping ones take turns
+    async with cycleLock:
+        stats = await alertCycle.run(profiles)
+        skipped = list(alertCycle.skipped)
+    print(f"Checked {stats['profiles']} profile(s) across {stats['locations']} location(s), " \
+        f"avoided {stats['fetchesAvoided']} fetch(es), {stats['failedLocations']} location(s) failed, " \
+        f"sent {stats['matches']} alert(s) in {stats['alertsSent']} digest(s).")
+    print(f"Forecast cache: {forecastCache.stats}, hit rate {forecastCache.hitRate():.0%}.")
+    limiter = cds_web.sessions.limiter
+    print(f"Rate limiter: {limiter.stats['waited']} of {limiter.stats['requests']} request(s) waited, " \
+        f"average {limiter.averageWait():.2f}s, longest {limiter.stats['maxWait']:.2f}s.")
+    if len(skipped) > 0:
+        # Clear Dark Sky is down, so check the skipped profiles again once the breaker allows a probe
+        print(f"Skipped {stats['skippedLocations']} location(s), retrying in {stats['retryAfter']:.0f}s.")
+        _scheduleRetry(skipped, stats['retryAfter'])
+
+
+def _scheduleRetry(profiles, delay):
+    # Skipped profiles join the pending retry, which moves to the latest breaker estimate
+    global retryHandle
+    for profile in profiles:
+        retryProfiles[(profile.username, profile.name)] = profile
+    if retryHandle is not None:
+        retryHandle.cancel()
+    retryHandle = asyncio.get_running_loop().call_later(delay, lambda: asyncio.ensure_future(_retrySkipped()))
+
+
+async def _retrySkipped():
+    global retryHandle
+    retryHandle = None
+    profiles = list(retryProfiles.values())
+    retryProfiles.clear()
+    if len(profiles) > 0:
+        await checkAlerts(profiles)
+
+
+def _dropRetry(locations):
+    # A shard checking these locations covers their pending retry
+    global retryHandle
+    for key, profile in list(retryProfiles.items()):
+        if profile.get(cds.AlertProfile.LOCATION) in locations:
+            del retryProfiles[key]
+    if len(retryProfiles) == 0 and retryHandle is not None:
+        retryHandle.cancel()
+        retryHandle = None
+
+
+async def checkShard(shard):
+    # A shard still running when it fires again is joined rather than run twice
+    await schedulerManager.singleFlight.run(shard, _checkShard, shard)
+
+
+async def _checkShard(shard):
+    locations = alertSchedule.locationsFor(cds.AlertProfile.store.locations(), shard)
+    print(f"Checking shard {shard + 1} of {alertSchedule.shards} ({len(locations)} location(s))...")
+    if shard == 0:
+        # Resize tomorrow's window for the current number of locations
+        schedulerManager.resize(checkShard, len(cds.AlertProfile.store.locations()))
+        # Once a day, keep the forecast archive within its retention
+        compacted = await asyncio.get_running_loop().run_in_executor(None, forecastArchive.compact)
+        print(f"Forecast archive: {compacted['expired']} forecast(s) expired, {compacted['freed']} byte(s) freed.")
+    _dropRetry(set(locations))
+    profiles = [profile for location in locations for profile in cds.AlertProfile.getAllForLocation(location)]
+    await checkAlerts(profiles)
 
 
 def main():
+    cds.AlertProfile.store.refresh()
+    locationKeyCache.seed(cds.AlertProfile.store.locations())
+    locationIndex.load(LOCATION_CATALOG)
+    locationIndex.update(cds.AlertProfile.store.locations())
     client.run(TOKEN)
 
 
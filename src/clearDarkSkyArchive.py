@@ -0,0 +1,287 @@
+""" Append-only, compressed history of every fetched forecast. """
+
+import datetime
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from clearDarkSkyConstants import *
+import clearDarkSkyHelpers as helpers
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkySnapshot import EPOCH, SECOND, Snapshot, dumpSnapshot
+
+# Length and crc32 of the compressed snapshot that follows
+RECORD = struct.Struct('<II')
+SEGMENT_NAME = '%08d.seg'
+
+
+def _hourSeconds(timestamp):
+    """ Convert a forecast hour to whole seconds since EPOCH, as snapshots store it. """
+    return (timestamp - EPOCH) // SECOND
+
+
+class ForecastArchive:
+    """ Keeps every forecast fetched for a location, to study accuracy or replay cycles.
+    Each forecast is stored as a zlib compressed snapshot appended to the
+    location's current segment file, a new segment is started once it reaches
+    segmentSize. A SQLite index of fetch time and first and last forecast hour
+    answers queries without reading the segments. compact() drops forecasts
+    older than retention and deletes or rewrites segments that are mostly dropped.
+    Attributes:
+        directory (str): The directory segments and the index are kept in.
+        retention (float): Seconds a forecast is kept.
+        segmentSize (int): Bytes after which a new segment is started.
+        compactRatio (float): Rewrite a segment when less than this fraction of it is kept.
+        level (int): The zlib compression level.
+        stats (dict): Counters of forecasts appended and skipped as unchanged.
+    """
+
+    INDEX = 'index.db'
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS forecasts (location TEXT NOT NULL, fetched REAL NOT NULL, '
+        'lastUpdated TEXT, firstHour INTEGER NOT NULL, lastHour INTEGER NOT NULL, '
+        'segment INTEGER NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS forecasts_hours ON forecasts (location, firstHour, lastHour)',
+        'CREATE INDEX IF NOT EXISTS forecasts_fetched ON forecasts (location, fetched)',
+    ]
+
+    def __init__(self, directory=ARCHIVE_DIRECTORY, retention=ARCHIVE_RETENTION, segmentSize=ARCHIVE_SEGMENT_SIZE,
+                 compactRatio=ARCHIVE_COMPACT_RATIO, level=ARCHIVE_COMPRESSION_LEVEL):
+        """ Initialize the archive. Nothing is created on disk until the first append.
+        Parameters:
+            directory (str): The directory segments and the index are kept in.
+            retention (float): Seconds a forecast is kept.
+            segmentSize (int): Bytes after which a new segment is started.
+            compactRatio (float): Rewrite a segment when less than this fraction of it is kept.
+            level (int): The zlib compression level.
+        """
+        self.directory = directory
+        self.retention = retention
+        self.segmentSize = segmentSize
+        self.compactRatio = compactRatio
+        self.level = level
+        self.stats = {'appended': 0, 'unchanged': 0}
+        self.__lock = threading.RLock()
+        self.__connection = None
+
+    def __connect(self):
+        """ Get the index connection, creating the archive on first use. """
+        if self.__connection is None:
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            self.__connection = sqlite3.connect(os.path.join(self.directory, ForecastArchive.INDEX),
+                                                check_same_thread=False)
+            with self.__connection:
+                for statement in ForecastArchive.SCHEMA:
+                    self.__connection.execute(statement)
+        return self.__connection
+
+    def __query(self, sql, parameters=()):
+        """ Run a query and return all rows. """
+        with self.__lock:
+            return self.__connect().execute(sql, parameters).fetchall()
+
+    def __getFilename(self, location, segment):
+        """ Get the filename of a segment of a location.
+        Raises:
+            ValueError: If the location is not a well formed location key.
+        """
+        if not helpers.isLocationKey(location):
+            raise ValueError(f'Invalid location key {location!r}')
+        return os.path.join(self.directory, location, SEGMENT_NAME % segment)
+
+    def __currentSegment(self, location):
+        """ Get the segment to append to, starting a new one when the last is full. """
+        rows = self.__query('SELECT MAX(segment) FROM forecasts WHERE location = ?', (location,))
+        segment = rows[0][0] if rows[0][0] is not None else 0
+        filename = self.__getFilename(location, segment)
+        if os.path.exists(filename) and os.path.getsize(filename) >= self.segmentSize:
+            segment += 1
+        return segment
+
+    def append(self, location, forecast, lastUpdated=None, fetched=None):
+        """ Add a fetched forecast to the archive.
+        A forecast with the same "Last updated" stamp as the last one archived for
+        the location is the same forecast and is not stored again.
+        Parameters:
+            location (str): The location key.
+            forecast (ForecastFrame or dictionary): The forecast.
+            lastUpdated (str): The "Last updated" stamp of the page, optional.
+            fetched (float): When it was fetched in seconds since the epoch, now if not given.
+        Returns:
+            bool: True if the forecast was stored.
+        Raises:
+            ValueError: If the location is not a well formed location key.
+        """
+        # Rejects a malformed key before the index is asked about it
+        self.__getFilename(location, 0)
+        if not isinstance(forecast, ForecastFrame):
+            forecast = ForecastFrame.fromWeatherData(forecast)
+        if len(forecast.timestamps) == 0:
+            return False
+        fetched = time.time() if fetched is None else fetched
+        blob = zlib.compress(dumpSnapshot(forecast, lastUpdated), self.level)
+        with self.__lock:
+            if lastUpdated is not None:
+                rows = self.__query('SELECT lastUpdated FROM forecasts WHERE location = ? '
+                                    'ORDER BY fetched DESC LIMIT 1', (location,))
+                if len(rows) > 0 and rows[0][0] == lastUpdated:
+                    self.stats['unchanged'] += 1
+                    return False
+            segment = self.__currentSegment(location)
+            filename = self.__getFilename(location, segment)
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, 'ab') as f:
+                offset = f.tell()
+                f.write(RECORD.pack(len(blob), zlib.crc32(blob)) + blob)
+            with self.__connect() as connection:
+                connection.execute('INSERT INTO forecasts (location, fetched, lastUpdated, firstHour, lastHour, '
+                                   'segment, offset, length) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (location, fetched, lastUpdated, _hourSeconds(forecast.timestamps[0]),
+                                    _hourSeconds(forecast.timestamps[-1]), segment, offset, RECORD.size + len(blob)))
+            self.stats['appended'] += 1
+        return True
+
+    def __read(self, location, segment, offset, length):
+        """ Read one archived forecast.
+        Raises:
+            ValueError: If the record is damaged.
+        """
+        with open(self.__getFilename(location, segment), 'rb') as f:
+            f.seek(offset)
+            record = f.read(length)
+        size, crc = RECORD.unpack_from(record)
+        blob = record[RECORD.size:]
+        if len(blob) != size or zlib.crc32(blob) != crc:
+            raise ValueError(f'Damaged forecast in {location} segment {segment} at {offset}')
+        return Snapshot(zlib.decompress(blob)).frame()
+
+    def __forecasts(self, rows):
+        """ Read the forecasts of index rows of (location, fetched, segment, offset, length). """
+        with self.__lock:
+            return [(datetime.datetime.fromtimestamp(fetched), self.__read(location, segment, offset, length))
+                    for location, fetched, segment, offset, length in rows]
+
+    def covering(self, location, timestamp):
+        """ Get every archived forecast for a location that includes an hour.
+        Parameters:
+            location (str): The location key.
+            timestamp (datetime.datetime): The forecast hour.
+        Returns:
+            list: (fetched datetime.datetime, ForecastFrame) pairs, oldest fetch first.
+        """
+        hour = _hourSeconds(timestamp)
+        return self.__forecasts(self.__query(
+            'SELECT location, fetched, segment, offset, length FROM forecasts '
+            'WHERE location = ? AND firstHour <= ? AND lastHour >= ? ORDER BY fetched', (location, hour, hour)))
+
+    def hourHistory(self, location, timestamp):
+        """ Get how the forecast for one hour changed from fetch to fetch.
+        Parameters:
+            location (str): The location key.
+            timestamp (datetime.datetime): The forecast hour.
+        Returns:
+            list: (fetched datetime.datetime, PointInTime) pairs, oldest fetch first.
+        """
+        return [(fetched, frame[timestamp]) for fetched, frame in self.covering(location, timestamp)
+                if timestamp in frame]
+
+    def fetchedBetween(self, location, start, end):
+        """ Get the archived forecasts for a location fetched in a time range.
+        Parameters:
+            location (str): The location key.
+            start (datetime.datetime): The earliest fetch time, inclusive.
+            end (datetime.datetime): The latest fetch time, exclusive.
+        Returns:
+            list: (fetched datetime.datetime, ForecastFrame) pairs, oldest fetch first.
+        """
+        return self.__forecasts(self.__query(
+            'SELECT location, fetched, segment, offset, length FROM forecasts '
+            'WHERE location = ? AND fetched >= ? AND fetched < ? ORDER BY fetched',
+            (location, start.timestamp(), end.timestamp())))
+
+    def locations(self):
+        """ Get the locations with archived forecasts.
+        Returns:
+            list: The location keys, sorted.
+        """
+        return [row[0] for row in self.__query('SELECT DISTINCT location FROM forecasts ORDER BY location')]
+
+    def compact(self, now=None):
+        """ Drop forecasts older than retention and reclaim their space.
+        A segment nothing is kept from is deleted, one that keeps less than
+        compactRatio of its bytes is rewritten with only the kept forecasts.
+        Parameters:
+            now (float): The current time in seconds since the epoch, optional.
+        Returns:
+            dict: The number of forecasts expired, segments deleted and rewritten, and bytes freed.
+        """
+        now = time.time() if now is None else now
+        result = {'expired': 0, 'deleted': 0, 'rewritten': 0, 'freed': 0}
+        if not os.path.exists(os.path.join(self.directory, ForecastArchive.INDEX)):
+            return result
+        with self.__lock:
+            with self.__connect() as connection:
+                result['expired'] = connection.execute('DELETE FROM forecasts WHERE fetched < ?',
+                                                       (now - self.retention,)).rowcount
+            kept = {(location, segment): size for location, segment, size in self.__query(
+                'SELECT location, segment, SUM(length) FROM forecasts GROUP BY location, segment')}
+            for location in os.listdir(self.directory):
+                folder = os.path.join(self.directory, location)
+                if not os.path.isdir(folder):
+                    continue
+                for name in os.listdir(folder):
+                    if not name.endswith('.seg'):
+                        continue
+                    segment = int(name[:-len('.seg')])
+                    filename = os.path.join(folder, name)
+                    size = os.path.getsize(filename)
+                    if (location, segment) not in kept:
+                        os.remove(filename)
+                        result['deleted'] += 1
+                        result['freed'] += size
+                    elif kept[(location, segment)] < size * self.compactRatio:
+                        self.__rewrite(location, segment)
+                        result['rewritten'] += 1
+                        result['freed'] += size - kept[(location, segment)]
+                if len(os.listdir(folder)) == 0:
+                    os.rmdir(folder)
+        return result
+
+    def __rewrite(self, location, segment):
+        """ Copy the forecasts still in the index out of a segment into a new one.
+        The index moves to the new segment in one transaction once it is on disk,
+        only then is the old segment deleted. A crash before the move leaves the
+        index on the old segment and the new one unreferenced, a crash after it
+        leaves the old one unreferenced, and compact() deletes either.
+        """
+        rows = self.__query('SELECT rowid, offset, length FROM forecasts WHERE location = ? AND segment = ? '
+                            'ORDER BY offset', (location, segment))
+        newSegment = self.__query('SELECT MAX(segment) FROM forecasts WHERE location = ?', (location,))[0][0] + 1
+        while os.path.exists(self.__getFilename(location, newSegment)):
+            newSegment += 1
+        moved = []
+        with open(self.__getFilename(location, segment), 'rb') as source, \
+                open(self.__getFilename(location, newSegment), 'wb') as destination:
+            for rowid, offset, length in rows:
+                source.seek(offset)
+                moved.append((newSegment, destination.tell(), rowid))
+                destination.write(source.read(length))
+            destination.flush()
+            os.fsync(destination.fileno())
+        with self.__connect() as connection:
+            connection.executemany('UPDATE forecasts SET segment = ?, offset = ? WHERE rowid = ?', moved)
+        os.remove(self.__getFilename(location, segment))
+
+    def close(self):
+        """ Close the index. """
+        with self.__lock:
+            if self.__connection is not None:
+                self.__connection.close()
+                self.__connection = None
+
+
+forecastArchive = ForecastArchive()
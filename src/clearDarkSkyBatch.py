@@ -0,0 +1,115 @@
+""" Vectorized evaluation of many alert profiles against one forecast. """
+
+import numpy as np
+
+from clearDarkSkyConstants import *
+from clearDarkSkyForecast import DARKNESS_PER_HOUR, MISSING_CODE
+from clearDarkSkyModel import AlertProfile
+
+TRANSPARENCY_UNSET = np.iinfo(np.int8).max
+
+
+def _orDefault(value, default):
+    """ Return the value, or the default if it is None. """
+    return default if value is None else value
+
+
+class ProfileBatch:
+    """ The thresholds of many alert profiles as arrays.
+    An attribute a profile does not set gets a threshold every value passes,
+    so all profiles can be compared against a ForecastFrame in one pass.
+    Attributes:
+        profiles (list): The AlertProfile objects, in row order.
+        durations (numpy.ndarray): The minimum run length of each profile.
+    """
+
+    def __init__(self, profiles):
+        """ Initialize the batch from a list of alert profiles.
+        Parameters:
+            profiles (list): The AlertProfile objects to evaluate together.
+        """
+        self.profiles = list(profiles)
+        atMost = {attribute: [] for attribute in [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SMOKE,
+                                                  WeatherAttribute.WIND, WeatherAttribute.HUMIDITY]}
+        seeing, darkness, transparency, temperatureLow, temperatureHigh, durations = [], [], [], [], [], []
+        for profile in self.profiles:
+            for attribute, thresholds in atMost.items():
+                thresholds.append(_orDefault(profile.get(attribute), np.inf))
+            seeing.append(_orDefault(profile.get(WeatherAttribute.SEEING), -np.inf))
+            darkness.append(_orDefault(profile.get(WeatherAttribute.DARKNESS), -np.inf))
+            value = profile.get(WeatherAttribute.TRANSPARENCY)
+            transparency.append(Transparency(value).value if value is not None else TRANSPARENCY_UNSET)
+            value = profile.get(WeatherAttribute.TEMPERATURE)
+            temperatureLow.append(min(value) if value is not None else -np.inf)
+            temperatureHigh.append(max(value) if value is not None else np.inf)
+            durations.append(max(profile.get(AlertProfile.DURATION), 1))
+        self.__atMost = {attribute: np.array(thresholds, dtype=np.float64) for attribute, thresholds in atMost.items()}
+        self.__seeing = np.array(seeing, dtype=np.float64)
+        self.__darkness = np.array(darkness, dtype=np.float64)
+        self.__transparency = np.array(transparency, dtype=np.int8)
+        self.__temperatureLow = np.array(temperatureLow, dtype=np.float64)
+        self.__temperatureHigh = np.array(temperatureHigh, dtype=np.float64)
+        self.durations = np.array(durations, dtype=np.int64)
+
+    def matchMatrix(self, frame):
+        """ Check every hour against every profile.
+        Parameters:
+            frame (ForecastFrame): The forecast to check.
+        Returns:
+            numpy.ndarray: A profiles x hours bool matrix, True where the hour
+                           matches the profile.
+        """
+        hours = len(frame.timestamps)
+        matches = np.ones((len(self.profiles), hours), dtype=bool)
+        if hours == 0:
+            return matches
+
+        def column(values):
+            return np.frombuffer(values, dtype=np.float64)
+
+        for attribute in [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SMOKE]:
+            values = column(frame.values[attribute])
+            matches &= (values[None, :] <= self.__atMost[attribute][:, None]) | np.isnan(values)[None, :]
+        for attribute in [WeatherAttribute.WIND, WeatherAttribute.HUMIDITY]:
+            values = column(frame.minimums[attribute])
+            matches &= (values[None, :] <= self.__atMost[attribute][:, None]) | np.isnan(values)[None, :]
+
+        values = column(frame.values[WeatherAttribute.SEEING])
+        matches &= (values[None, :] >= self.__seeing[:, None]) | np.isnan(values)[None, :]
+
+        codes = np.frombuffer(frame.transparency, dtype=np.int8)
+        matches &= (codes[None, :] <= self.__transparency[:, None]) | (codes == MISSING_CODE)[None, :]
+
+        low = column(frame.minimums[WeatherAttribute.TEMPERATURE])
+        high = column(frame.maximums[WeatherAttribute.TEMPERATURE])
+        matches &= ((low[None, :] >= self.__temperatureLow[:, None]) & (high[None, :] <= self.__temperatureHigh[:, None])) \
+            | np.isnan(low)[None, :]
+
+        darkness = column(frame.darkness).reshape(hours, DARKNESS_PER_HOUR)
+        brightest = np.where(np.isnan(darkness), -np.inf, darkness).max(axis=1)
+        noDarkness = np.isnan(darkness).all(axis=1)
+        matches &= (brightest[None, :] >= self.__darkness[:, None]) | noDarkness[None, :]
+        return matches
+
+    def checkForAlerts(self, frame):
+        """ Find the matching windows of every profile.
+        Parameters:
+            frame (ForecastFrame): The forecast to check.
+        Returns:
+            list: For each profile, in order, the list of (start, end) tuples
+                  checkForAlert would return.
+        """
+        results = [[] for _ in self.profiles]
+        matches = self.matchMatrix(frame)
+        if matches.size == 0:
+            return results
+        # Runs start where a row steps from False to True and end where it steps back
+        padded = np.pad(matches, ((0, 0), (1, 1))).astype(np.int8)
+        steps = np.diff(padded, axis=1)
+        startRows, starts = np.nonzero(steps == 1)
+        _, ends = np.nonzero(steps == -1)
+        long = (ends - starts) >= self.durations[startRows]
+        timestamps = frame.timestamps
+        for row, start, end in zip(startRows[long].tolist(), starts[long].tolist(), ends[long].tolist()):
+            results[row].append((timestamps[start], timestamps[end - 1]))
+        return results
@@ -0,0 +1,304 @@
+""" On-disk cache of parsed forecasts for the clearDarkSky project. """
+
+import collections
+import os
+import pickle
+import threading
+import time
+
+from clearDarkSkyConstants import *
+import clearDarkSkyHelpers as helpers
+
+
+class ForecastCache:
+    """ A per-location cache of parsed weather data that survives restarts.
+    Each entry keeps the parsed forecast with the page's "Last updated" stamp
+    and the ETag/Last-Modified validators so a stale entry can be revalidated
+    with a conditional request instead of being refetched and reparsed.
+    A location key that is not letters and digits raises ValueError, so it
+    never names a file. Entries are read and written under a lock, so the async
+    paths can keep the disk off the event loop by calling it from a thread pool.
+    Attributes:
+        directory (str): The directory entries are stored in.
+        ttl (float): Seconds an entry is served without revalidation.
+        stats (dict): Hit and miss counters.
+    """
+
+    ETAG = 'ETag'
+    LAST_MODIFIED = 'Last-Modified'
+
+    def __init__(self, directory=FORECAST_CACHE_DIRECTORY, ttl=FORECAST_CACHE_TTL):
+        """ Initialize the cache.
+        Parameters:
+            directory (str): The directory entries are stored in.
+            ttl (float): Seconds an entry is served without revalidation.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.__entries = dict()
+        self.__lock = threading.RLock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'unchanged': 0, 'misses': 0}
+
+    def __getFilename(self, location):
+        """ Get the filename for a location's entry.
+        Raises:
+            ValueError: If the location is not a well formed location key.
+        """
+        if not helpers.isLocationKey(location):
+            raise ValueError(f'Invalid location key {location!r}')
+        return os.path.join(self.directory, location + '.pickle')
+
+    def __getEntry(self, location):
+        """ Get the entry for a location from memory or disk.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            dict: The entry, or None if there is no usable entry.
+        """
+        filename = self.__getFilename(location)
+        with self.__lock:
+            if location not in self.__entries:
+                try:
+                    with open(filename, 'rb') as f:
+                        self.__entries[location] = pickle.load(f)
+                except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                    return None
+            return self.__entries[location]
+
+    def __write(self, location, entry):
+        """ Write an entry to memory and disk. """
+        filename = self.__getFilename(location)
+        with self.__lock:
+            self.__entries[location] = entry
+            if not os.path.exists(self.directory):
+                os.makedirs(self.directory)
+            temporary = filename + '.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, filename)
+
+    def contains(self, location):
+        """ Check if a location has an entry, fresh or stale.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            bool: True if the location has been fetched before.
+        """
+        return self.__getEntry(location) is not None
+
+    def lookup(self, location):
+        """ Get a forecast that is still within its TTL.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            dictionary: The cached weather data, or None if missing or stale.
+        """
+        entry = self.__getEntry(location)
+        if entry is None or time.time() - entry['fetched'] > self.ttl:
+            return None
+        self.stats['hits'] += 1
+        return entry['data']
+
+    def conditionalHeaders(self, location):
+        """ Get the headers for a conditional request for a location.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            dict: If-None-Match and/or If-Modified-Since headers, possibly empty.
+        """
+        entry = self.__getEntry(location)
+        headers = dict()
+        if entry is None:
+            return headers
+        if entry[ForecastCache.ETAG] is not None:
+            headers['If-None-Match'] = entry[ForecastCache.ETAG]
+        if entry[ForecastCache.LAST_MODIFIED] is not None:
+            headers['If-Modified-Since'] = entry[ForecastCache.LAST_MODIFIED]
+        return headers
+
+    def revalidate(self, location):
+        """ Mark a stale entry as current after a 304 Not Modified response.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            dictionary: The cached weather data, or None if there is no entry.
+        """
+        entry = self.__getEntry(location)
+        if entry is None:
+            return None
+        entry['fetched'] = time.time()
+        self.__write(location, entry)
+        self.stats['revalidated'] += 1
+        return entry['data']
+
+    def reuse(self, location, lastUpdated, headers=None):
+        """ Get the cached forecast if a freshly fetched page has the same stamp.
+        Parameters:
+            location (str): The location key.
+            lastUpdated (str): The "Last updated" stamp of the fetched page.
+            headers (dict): The response headers of the fetched page, optional.
+        Returns:
+            dictionary: The cached weather data, or None if the page changed.
+        """
+        entry = self.__getEntry(location)
+        if entry is None or lastUpdated is None or entry['lastUpdated'] != lastUpdated:
+            return None
+        entry['fetched'] = time.time()
+        if headers is not None:
+            entry[ForecastCache.ETAG] = headers.get(ForecastCache.ETAG)
+            entry[ForecastCache.LAST_MODIFIED] = headers.get(ForecastCache.LAST_MODIFIED)
+        self.__write(location, entry)
+        self.stats['unchanged'] += 1
+        return entry['data']
+
+    def store(self, location, data, lastUpdated, headers=None):
+        """ Store a freshly parsed forecast.
+        Parameters:
+            location (str): The location key.
+            data (dictionary): The parsed weather data.
+            lastUpdated (str): The "Last updated" stamp of the page.
+            headers (dict): The response headers of the page, optional.
+        """
+        headers = headers if headers is not None else dict()
+        self.__write(location, {'fetched': time.time(), 'lastUpdated': lastUpdated, 'data': data,
+                                ForecastCache.ETAG: headers.get(ForecastCache.ETAG),
+                                ForecastCache.LAST_MODIFIED: headers.get(ForecastCache.LAST_MODIFIED)})
+        self.stats['misses'] += 1
+
+    def invalidate(self, location):
+        """ Remove a location's entry from memory and disk.
+        Parameters:
+            location (str): The location key.
+        """
+        filename = self.__getFilename(location)
+        with self.__lock:
+            self.__entries.pop(location, None)
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+    def hitRate(self):
+        """ Get the fraction of lookups served without parsing.
+        Returns:
+            float: The hit rate, 0.0 if nothing has been requested.
+        """
+        served = self.stats['hits'] + self.stats['revalidated'] + self.stats['unchanged']
+        total = served + self.stats['misses']
+        return served / total if total > 0 else 0.0
+
+
+class LocationKeyCache:
+    """ Remembers which location keys are known to be valid or invalid.
+    Valid keys are kept for much longer than invalid ones, so a site that
+    comes back is noticed soon. At most maxSize keys are kept, oldest first out.
+    Attributes:
+        validTtl (float): Seconds a valid key is remembered.
+        invalidTtl (float): Seconds an invalid key is remembered.
+        maxSize (int): The maximum number of keys kept.
+        stats (dict): Hit and miss counters.
+    """
+
+    def __init__(self, validTtl=LOCATION_KEY_VALID_TTL, invalidTtl=LOCATION_KEY_INVALID_TTL,
+                 maxSize=LOCATION_KEY_CACHE_SIZE):
+        """ Initialize the cache.
+        Parameters:
+            validTtl (float): Seconds a valid key is remembered.
+            invalidTtl (float): Seconds an invalid key is remembered.
+            maxSize (int): The maximum number of keys kept.
+        """
+        self.validTtl = validTtl
+        self.invalidTtl = invalidTtl
+        self.maxSize = maxSize
+        self.__entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def lookup(self, location):
+        """ Get what is known about a location key.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            bool: True if known valid, False if known invalid, None if unknown or expired.
+        """
+        entry = self.__entries.get(location)
+        if entry is None or entry[1] < time.monotonic():
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return entry[0]
+
+    def mark(self, location, valid):
+        """ Remember whether a location key is valid.
+        Parameters:
+            location (str): The location key.
+            valid (bool): True if the key is valid.
+        """
+        ttl = self.validTtl if valid else self.invalidTtl
+        self.__entries.pop(location, None)
+        self.__entries[location] = (valid, time.monotonic() + ttl)
+        while len(self.__entries) > self.maxSize:
+            self.__entries.popitem(last=False)
+
+    def seed(self, locations):
+        """ Mark location keys already in use as valid.
+        Parameters:
+            locations (iterable): The location keys.
+        """
+        for location in locations:
+            self.mark(location, True)
+
+
+class TtlLruCache:
+    """ A bounded in-memory cache whose entries also expire.
+    The least recently used entry is evicted when maxSize is reached.
+    Attributes:
+        maxSize (int): The maximum number of entries.
+        ttl (float): Seconds an entry is served.
+        stats (dict): Hit and miss counters.
+    """
+
+    def __init__(self, maxSize, ttl):
+        """ Initialize an empty cache.
+        Parameters:
+            maxSize (int): The maximum number of entries.
+            ttl (float): Seconds an entry is served.
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.__entries = collections.OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        """ Get a value that has not expired.
+        Parameters:
+            key: The key.
+        Returns:
+            The value, or None if missing or expired.
+        """
+        entry = self.__entries.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            self.__entries.pop(key, None)
+            self.stats['misses'] += 1
+            return None
+        self.__entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """ Store a value, evicting the least recently used entries if full.
+        Parameters:
+            key: The key.
+            value: The value.
+        """
+        self.__entries[key] = (value, time.monotonic() + self.ttl)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.maxSize:
+            self.__entries.popitem(last=False)
+
+    def __len__(self):
+        """ Return the number of entries, including expired ones not yet evicted. """
+        return len(self.__entries)
+
+
+forecastCache = ForecastCache()
+locationKeyCache = LocationKeyCache()
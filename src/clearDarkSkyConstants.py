@@ -4,8 +4,58 @@ import discord
 from clearDarkSkyEnums import *
 
 # Program parameters
-REQUEST_RETRY_COUNT = 20
+REQUEST_RETRY_COUNT = 4
 REQUEST_RETRY_DELAY = 2
+REQUEST_RETRY_MAX_DELAY = 8
+REQUEST_RETRY_MULTIPLIER = 2
+REQUEST_RETRY_DEADLINE = 15
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 5 * 60
+REQUEST_CONCURRENCY_LIMIT = 8
+REQUEST_TIMEOUT = 30
+REQUEST_CONNECT_TIMEOUT = 5
+REQUEST_POOL_SIZE = 10
+REQUEST_KEEPALIVE_TIMEOUT = 60
+REQUEST_RATE = 4
+REQUEST_BURST = 4
+ALERT_CYCLE_MAX_IN_FLIGHT = 8
+ALERT_CYCLE_PARSE_WORKERS = 4
+ALERT_CYCLE_SENDERS = 4
+PARSE_PROCESS_WORKERS = None
+PARSE_CHUNK_SIZE = 4
+PARSE_START_METHOD = 'spawn'
+DISCORD_MESSAGE_LIMIT = 2000
+USER_CACHE_SIZE = 1000
+USER_CACHE_TTL = 6 * 60 * 60
+ALERT_SHARDS = 12
+ALERT_START_HOUR = 7
+ALERT_START_MINUTE = 0
+ALERT_WINDOW = 60 * 60
+ALERT_WINDOW_HEADROOM = 1.5
+SCHEDULER_DATABASE = 'Scheduler.db'
+FORECAST_CACHE_DIRECTORY = 'ForecastCache'
+FORECAST_CACHE_TTL = 30 * 60
+ARCHIVE_DIRECTORY = 'ForecastArchive'
+ARCHIVE_RETENTION = 30 * 24 * 60 * 60
+ARCHIVE_SEGMENT_SIZE = 4 * 1024 * 1024
+ARCHIVE_COMPACT_RATIO = 0.5
+ARCHIVE_COMPRESSION_LEVEL = 6
+LOCATION_KEY_VALID_TTL = 7 * 24 * 60 * 60
+LOCATION_KEY_INVALID_TTL = 60 * 60
+LOCATION_KEY_CACHE_SIZE = 10000
+LOCATION_KEY_RETRY_COUNT = 2
+LOCATION_CATALOG = 'LocationCatalog.txt'
+LOCATION_SUGGESTION_LIMIT = 25
+PARSER_FAST = 'fast'
+PARSER_SOUP = 'soup'
+WEATHER_PARSER = PARSER_FAST
+VALUE_CACHE_SIZE = 4096
+PROFILE_STORE_JSON = 'json'
+PROFILE_STORE_SQLITE = 'sqlite'
+PROFILE_STORE_BACKEND = PROFILE_STORE_JSON
+PROFILE_DIRECTORY = 'AlertProfiles'
+PROFILE_DATABASE = 'AlertProfiles.db'
+PROFILE_REGISTRY_REFRESH_INTERVAL = 5
 
 # Help convert values to text
 SEEING_VALUE_TO_TEXT = {
@@ -0,0 +1,157 @@
+""" Parallel alert cycle for the clearDarkSky project. """
+
+import asyncio
+import concurrent.futures
+
+from clearDarkSkyConstants import *
+import clearDarkSkyHelpers as helpers
+import clearDarkSkyWeb as web
+from clearDarkSkyModel import AlertProfile
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyBatch import ProfileBatch
+
+
+class AlertCycle:
+    """ Check every alert profile against the forecast for its location.
+    Locations are fetched concurrently (at most maxInFlight at a time), parsed
+    on a worker pool unless the forecast cache already has them, and all of a
+    location's profiles are evaluated together as soon as it arrives. Once every
+    location is done, each user's matches are combined into one digest and the
+    digests are handed to a pool of sender tasks. While the site's circuit breaker
+    is open, locations are skipped and their profiles kept in skipped to be rescheduled.
+    Attributes:
+        send (coroutine function): Called with a username and a message, once per digest message.
+        maxInFlight (int): The maximum number of locations being fetched or parsed at once.
+        senders (int): The number of concurrent sender tasks.
+        executor (concurrent.futures.Executor): The pool parsing is run on, threads or processes.
+        stats (dict): Counters from the last run, matches counts profiles and alertsSent digests.
+        skipped (list): The AlertProfile objects not checked in the last run because the site was down.
+    """
+
+    def __init__(self, send, maxInFlight=ALERT_CYCLE_MAX_IN_FLIGHT, parseWorkers=ALERT_CYCLE_PARSE_WORKERS,
+                 senders=ALERT_CYCLE_SENDERS, executor=None):
+        """ Initialize the alert cycle.
+        Parameters:
+            send (coroutine function): Called with a username and a message, once per digest message.
+            maxInFlight (int): The maximum number of locations being fetched or parsed at once.
+            parseWorkers (int): The number of parse workers if no executor is given.
+            senders (int): The number of concurrent sender tasks.
+            executor (concurrent.futures.Executor): The pool to parse on, optional.
+        """
+        self.send = send
+        self.maxInFlight = maxInFlight
+        self.senders = senders
+        self.executor = executor if executor is not None \
+            else concurrent.futures.ThreadPoolExecutor(max_workers=parseWorkers)
+        self.stats = dict()
+        self.skipped = []
+
+    def breaker(self):
+        """ Get the circuit breaker guarding the forecast source. Override to change the source.
+        Returns:
+            CircuitBreaker: The breaker.
+        """
+        return web.hostBreaker()
+
+    async def loadWeatherData(self, location):
+        """ Get the forecast for a location. Override to change the source.
+        Parameters:
+            location (str): The location key to load.
+        Returns:
+            dictionary: The weather data, or None if it could not be loaded.
+        """
+        return await web.extractWeatherDataAsync(location, self.executor, web.parseForecast)
+
+    async def __checkLocation(self, location, profiles, semaphore, alerts):
+        """ Fetch, parse and evaluate one location, collecting any alerts.
+        Parameters:
+            location (str): The location key to check.
+            profiles (list): The AlertProfile objects for the location.
+            semaphore (asyncio.Semaphore): Limits the locations in flight.
+            alerts (dict): Username to a list of (profile name, location, windows) to add matches to.
+        """
+        try:
+            async with semaphore:
+                if self.breaker().isOpen():
+                    raise ValueError(f'Circuit open for {location}')
+                weatherData = await self.loadWeatherData(location)
+            if weatherData is None:
+                raise ValueError(f'No weather data for {location}')
+            if not isinstance(weatherData, ForecastFrame):
+                weatherData = ForecastFrame.fromWeatherData(weatherData)
+        except Exception:
+            if self.breaker().isOpen():
+                self.skipped.extend(profiles)
+                self.stats['skippedLocations'] += 1
+                return
+            print(f"Failed to get weather data for {location}!")
+            self.stats['failedLocations'] += 1
+            return
+        try:
+            results = ProfileBatch(profiles).checkForAlerts(weatherData)
+        except Exception:
+            results = [self.__checkProfile(profile, weatherData) for profile in profiles]
+        for profile, result in zip(profiles, results):
+            if len(result) > 0:
+                alerts.setdefault(profile.username, []).append((profile.name, location, result))
+                self.stats['matches'] += 1
+
+    def __checkProfile(self, profile, weatherData):
+        """ Check one profile on its own, for when the batch cannot be built.
+        Parameters:
+            profile (AlertProfile): The alert profile to check.
+            weatherData (ForecastFrame): The forecast to check.
+        Returns:
+            list: The matching windows, empty if the check failed.
+        """
+        try:
+            return profile.checkForAlert(weatherData)
+        except Exception:
+            print(f"Failed to check {profile.name}!")
+            return []
+
+    async def __sender(self, queue):
+        """ Deliver queued digests until cancelled.
+        Parameters:
+            queue (asyncio.Queue): The queue of (username, messages) to send.
+        """
+        while True:
+            username, messages = await queue.get()
+            try:
+                for message in messages:
+                    await self.send(username, message)
+                self.stats['alertsSent'] += 1
+            except Exception:
+                print(f"Failed to send alert to {username}!")
+                self.stats['failedSends'] += 1
+            finally:
+                queue.task_done()
+
+    async def run(self, profiles):
+        """ Run the cycle over a list of profiles.
+        Parameters:
+            profiles (list): The AlertProfile objects to check.
+        Returns:
+            dict: Counters for the run.
+        """
+        groups = AlertProfile.groupByLocation(profiles)
+        self.stats = {'profiles': len(profiles), 'locations': len(groups),
+                      'fetchesAvoided': len(profiles) - len(groups),
+                      'failedLocations': 0, 'skippedLocations': 0, 'matches': 0, 'alertsSent': 0, 'failedSends': 0}
+        self.skipped = []
+        semaphore = asyncio.Semaphore(self.maxInFlight)
+        alerts = dict()
+        await asyncio.gather(*[self.__checkLocation(location, group, semaphore, alerts)
+                               for location, group in groups.items()])
+        queue = asyncio.Queue()
+        for username, matches in alerts.items():
+            queue.put_nowait((username, helpers.alertDigestToText(matches)))
+        senders = [asyncio.create_task(self.__sender(queue)) for _ in range(self.senders)]
+        try:
+            await queue.join()
+        finally:
+            for sender in senders:
+                sender.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+        self.stats['retryAfter'] = self.breaker().retryAfter()
+        return self.stats
@@ -0,0 +1,200 @@
+""" Columnar forecast storage for the clearDarkSky project. """
+
+import math
+from array import array
+from collections.abc import Mapping
+
+from clearDarkSkyConstants import *
+from clearDarkSkyModel import PointInTime
+
+MISSING = math.nan
+MISSING_CODE = -1
+DARKNESS_PER_HOUR = 4
+
+RANGE_ATTRIBUTES = [WeatherAttribute.WIND, WeatherAttribute.HUMIDITY, WeatherAttribute.TEMPERATURE]
+INT_ATTRIBUTES = [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SMOKE]
+
+
+def _toNumber(value):
+    """ Convert a float read back from a column to the int textToValue produced, if it was one. """
+    return int(value) if value.is_integer() else value
+
+
+class ForecastFrame(Mapping):
+    """ A forecast stored as one typed array per weather attribute.
+    Hours share the timestamps index. Missing values are NaN (MISSING_CODE for
+    transparency). WIND, HUMIDITY and TEMPERATURE ranges are split into min and
+    max arrays and DARKNESS keeps DARKNESS_PER_HOUR slots per hour.
+    The frame is a read-only mapping of timestamps to PointInTime objects so it
+    can be used wherever a dictionary of weather data is expected.
+    Attributes:
+        timestamps (list): The datetime.datetime of each hour, in order.
+        values (dict): WeatherAttribute to array for single valued attributes.
+        minimums (dict): WeatherAttribute to array of range minimums.
+        maximums (dict): WeatherAttribute to array of range maximums.
+        transparency (array): Transparency codes per hour.
+        darkness (array): DARKNESS_PER_HOUR limiting magnitudes per hour.
+    """
+
+    def __init__(self, timestamps):
+        """ Initialize an empty frame for the given hours.
+        Parameters:
+            timestamps (list): The datetime.datetime of each hour, in order.
+        """
+        self.timestamps = list(timestamps)
+        self.__index = {timestamp: i for i, timestamp in enumerate(self.timestamps)}
+        hours = len(self.timestamps)
+        self.values = {attribute: array('d', [MISSING]) * hours for attribute in
+                       [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SEEING, WeatherAttribute.SMOKE]}
+        self.minimums = {attribute: array('d', [MISSING]) * hours for attribute in RANGE_ATTRIBUTES}
+        self.maximums = {attribute: array('d', [MISSING]) * hours for attribute in RANGE_ATTRIBUTES}
+        self.transparency = array('b', [MISSING_CODE]) * hours
+        self.darkness = array('d', [MISSING]) * (hours * DARKNESS_PER_HOUR)
+
+    @staticmethod
+    def fromWeatherData(weatherData):
+        """ Build a frame from a dictionary of PointInTime objects.
+        Parameters:
+            weatherData (dictionary): Keys are datetime.datetime objects and values
+                                      are PointInTime objects.
+        Returns:
+            ForecastFrame: The columnar forecast.
+        Raises:
+            ValueError: If an hour has more than DARKNESS_PER_HOUR darkness values.
+        """
+        frame = ForecastFrame(weatherData.keys())
+        for i, hour in enumerate(weatherData.values()):
+            for attribute, value in hour.data.items():
+                frame.__set(i, attribute, value)
+        return frame
+
+    @staticmethod
+    def fromColumns(timestamps, values, minimums, maximums, transparency, darkness):
+        """ Build a frame around existing columns without copying them.
+        Any buffer that indexes like an array works, such as a memoryview of a file.
+        Parameters:
+            timestamps (list): The datetime.datetime of each hour, in order.
+            values (dict): WeatherAttribute to column for CLOUD_COVER, SEEING and SMOKE.
+            minimums (dict): WeatherAttribute to column of range minimums.
+            maximums (dict): WeatherAttribute to column of range maximums.
+            transparency (buffer): Transparency codes per hour.
+            darkness (buffer): DARKNESS_PER_HOUR limiting magnitudes per hour.
+        Returns:
+            ForecastFrame: The forecast, sharing the given columns.
+        """
+        frame = ForecastFrame.__new__(ForecastFrame)
+        frame.timestamps = list(timestamps)
+        frame.__index = {timestamp: i for i, timestamp in enumerate(frame.timestamps)}
+        frame.values = dict(values)
+        frame.minimums = dict(minimums)
+        frame.maximums = dict(maximums)
+        frame.transparency = transparency
+        frame.darkness = darkness
+        return frame
+
+    def __set(self, i, attribute, value):
+        """ Store one attribute value for the hour at index i. """
+        if attribute in self.values:
+            self.values[attribute][i] = value
+        elif attribute in self.minimums:
+            self.minimums[attribute][i] = value[0]
+            self.maximums[attribute][i] = value[1]
+        elif attribute == WeatherAttribute.TRANSPARENCY:
+            self.transparency[i] = value.value
+        elif attribute == WeatherAttribute.DARKNESS:
+            if len(value) > DARKNESS_PER_HOUR:
+                raise ValueError(f'More than {DARKNESS_PER_HOUR} darkness values for {self.timestamps[i]}')
+            for j, darkness in enumerate(value):
+                self.darkness[i * DARKNESS_PER_HOUR + j] = darkness
+
+    def pointInTime(self, i):
+        """ Get the hour at index i as a PointInTime.
+        Parameters:
+            i (int): The index of the hour.
+        Returns:
+            PointInTime: The hour with the values it was built from.
+        """
+        hour = PointInTime(self.timestamps[i])
+        for attribute in WeatherAttribute:
+            if attribute in self.values:
+                value = self.values[attribute][i]
+                if not math.isnan(value):
+                    hour.add(attribute, _toNumber(value) if attribute in INT_ATTRIBUTES else value)
+            elif attribute in self.minimums:
+                low = self.minimums[attribute][i]
+                if not math.isnan(low):
+                    high = self.maximums[attribute][i]
+                    hour.add(attribute, (_toNumber(low), _toNumber(high)))
+            elif attribute == WeatherAttribute.TRANSPARENCY:
+                if self.transparency[i] != MISSING_CODE:
+                    hour.add(attribute, Transparency(self.transparency[i]))
+            elif attribute == WeatherAttribute.DARKNESS:
+                for darkness in self.darkness[i * DARKNESS_PER_HOUR:(i + 1) * DARKNESS_PER_HOUR]:
+                    if not math.isnan(darkness):
+                        hour.add(attribute, darkness)
+        return hour
+
+    def toWeatherData(self):
+        """ Convert the frame back to a dictionary of PointInTime objects.
+        Returns:
+            dictionary: Keys are datetime.datetime objects and values are PointInTime objects.
+        """
+        return {timestamp: self.pointInTime(i) for i, timestamp in enumerate(self.timestamps)}
+
+    def __getitem__(self, timestamp):
+        """ Get the hour at a timestamp as a PointInTime. """
+        return self.pointInTime(self.__index[timestamp])
+
+    def __iter__(self):
+        """ Iterate over the timestamps in order. """
+        return iter(self.timestamps)
+
+    def __len__(self):
+        """ Return the number of hours. """
+        return len(self.timestamps)
+
+    def __str__(self):
+        """ Return a string representation of the frame. """
+        if len(self.timestamps) == 0:
+            return 'Empty forecast'
+        return f'Forecast of {len(self.timestamps)} hours from {self.timestamps[0]} to {self.timestamps[-1]}'
+
+    def hourMask(self, profile):
+        """ Check every hour against an alert profile, one attribute at a time.
+        Only the attributes the profile sets are compared; a missing value
+        always passes, as it does for a PointInTime.
+        Parameters:
+            profile (AlertProfile): The alert profile to check.
+        Returns:
+            list: A bool per hour, True if the hour matches the alert profile.
+        """
+        mask = [True] * len(self.timestamps)
+        for attribute in [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SMOKE]:
+            threshold = profile.get(attribute)
+            if threshold is not None:
+                mask = [m and not v > threshold for m, v in zip(mask, self.values[attribute])]
+        threshold = profile.get(WeatherAttribute.SEEING)
+        if threshold is not None:
+            mask = [m and not v < threshold for m, v in zip(mask, self.values[WeatherAttribute.SEEING])]
+        threshold = profile.get(WeatherAttribute.TRANSPARENCY)
+        if threshold is not None:
+            threshold = Transparency(threshold).value
+            mask = [m and (v == MISSING_CODE or v <= threshold) for m, v in zip(mask, self.transparency)]
+        for attribute in [WeatherAttribute.WIND, WeatherAttribute.HUMIDITY]:
+            threshold = profile.get(attribute)
+            if threshold is not None:
+                mask = [m and not v > threshold for m, v in zip(mask, self.minimums[attribute])]
+        threshold = profile.get(WeatherAttribute.TEMPERATURE)
+        if threshold is not None:
+            low, high = min(threshold), max(threshold)
+            mask = [m and not (v < low or w > high) for m, v, w in
+                    zip(mask, self.minimums[WeatherAttribute.TEMPERATURE], self.maximums[WeatherAttribute.TEMPERATURE])]
+        threshold = profile.get(WeatherAttribute.DARKNESS)
+        if threshold is not None:
+            darkness = self.darkness
+            for i in range(len(mask)):
+                if mask[i]:
+                    slots = darkness[i * DARKNESS_PER_HOUR:(i + 1) * DARKNESS_PER_HOUR]
+                    # An hour without any darkness values passes
+                    mask[i] = all(math.isnan(v) for v in slots) or any(v >= threshold for v in slots)
+        return mask
@@ -1,8 +1,10 @@
 """ Standalone helper functions for clearDarkSky project. """
 
 import re
+import collections
 import datetime
 import math
+import threading
 
 from clearDarkSkyConstants import *
 
@@ -10,6 +12,19 @@ from clearDarkSkyConstants import *
 REGEX_INT = re.compile(r'\d+')
 REGEX_INT_NEG = re.compile(r'-?\d+')
 REGEX_DECIMAL = re.compile(r'-?\d+\.\d+')
+REGEX_LAST_UPDATED = re.compile(rb'Last updated (\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)')
+REGEX_LOCATION_KEY = re.compile(r'[A-Za-z0-9]+')
+
+def isLocationKey(location):
+    """ Check that a location key has only letters and digits, as the site's keys do.
+    Keys name cache and archive files, so anything else must never reach them.
+    Parameters:
+        location (str): The location key.
+    Returns:
+        bool: True if the key is well formed.
+    """
+    return isinstance(location, str) and REGEX_LOCATION_KEY.fullmatch(location) is not None
+
 
 def getDateFromText(text: str) -> datetime:
     """ Returns a datetime object from a string. """
@@ -17,8 +32,8 @@ def getDateFromText(text: str) -> datetime:
     return datetime.datetime(int(regex_date[0]), int(regex_date[1]), int(regex_date[2]))
 
 
-def textToValue(attribute, text):
-    """ Convert text to value based on attribute. 
+def parseValue(attribute, text):
+    """ Convert text to value based on attribute, without the decode table or cache.
     Parameters:
         attribute (WeatherAttribute): The attribute to convert text to value for.
         text (str): The text to convert to value.
@@ -78,6 +93,202 @@ def textToValue(attribute, text):
             except:
                 return (113, math.inf)
 
+
+def _knownPayloads():
+    """ Yield the (attribute, text) pairs cleardarksky.com is known to use in area titles. """
+    yield WeatherAttribute.CLOUD_COVER, 'Clear'
+    yield WeatherAttribute.CLOUD_COVER, 'Overcast'
+    for percent in range(0, 101):
+        yield WeatherAttribute.CLOUD_COVER, f'{percent}% covered'
+    for transparency in ['Transparent', 'Above Average', 'Average', 'Below Average', 'Poor',
+                         'Too cloudy to forecast']:
+        yield WeatherAttribute.TRANSPARENCY, transparency
+    for seeing in ['Excellent 5/5', 'Good 4/5', 'Average 3/5', 'Poor 2/5', 'Terrible 1/5',
+                   'Too cloudy to forecast']:
+        yield WeatherAttribute.SEEING, seeing
+    yield WeatherAttribute.SMOKE, 'No Smoke'
+    for smoke in [2, 5, 10, 20, 50, 100, 200, 500]:
+        yield WeatherAttribute.SMOKE, f'{smoke}ug/m^3'
+    for wind in ['0 to 5 mph', '6 to 11 mph', '12 to 16 mph', '17 to 28 mph', '29 to 45 mph', '>45 mph']:
+        yield WeatherAttribute.WIND, wind
+    yield WeatherAttribute.HUMIDITY, '<25%'
+    for humidity in range(25, 100, 5):
+        yield WeatherAttribute.HUMIDITY, f'{humidity}% to {humidity + 5}%'
+    temperatures = [-40, -30, -21, -12, -3, 5, 14, 23, 32, 41, 50, 59, 68, 77, 86, 95, 104, 113]
+    for low, high in zip(temperatures, temperatures[1:]):
+        yield WeatherAttribute.TEMPERATURE, f'{low}F to {high}F'
+    for temperature in ['<-40F', '< -40F', '>113F', '> 113F']:
+        yield WeatherAttribute.TEMPERATURE, temperature
+    yield WeatherAttribute.DARKNESS, 'Limiting Mag:-0.0'
+    for tenths in range(-80, 81):
+        yield WeatherAttribute.DARKNESS, f'Limiting Mag:{tenths / 10:.1f}'
+
+
+# Values of every known title, decoded once so most titles cost a single dict lookup
+DECODE_TABLE = {(attribute, text): parseValue(attribute, text) for attribute, text in _knownPayloads()}
+
+
+def payloadOf(attribute, text):
+    """ Get the part of an area title its value is decoded from.
+    Drops the forecast hour, like ' (00Z+13hr)', that ends most titles, and everything
+    after the limiting magnitude of a darkness title, like ', SunAlt: 2.1&deg;, ...'.
+    Parameters:
+        attribute (WeatherAttribute): The attribute of the title.
+        text (str): The text of the title after the time.
+    Returns:
+        str: The text to decode.
+    """
+    text = text.partition(' (')[0]
+    if attribute is WeatherAttribute.DARKNESS:
+        text = text.partition(',')[0]
+    return text
+
+
+class ValueDecoder:
+    """ Converts area title text to values through DECODE_TABLE and a bounded memo.
+    Titles not in the table are parsed once and kept in a least recently used cache.
+    Attributes:
+        maxSize (int): The most parsed values kept.
+        stats (dict): Counters of table hits, cache hits, misses and evictions.
+    """
+
+    def __init__(self, maxSize=VALUE_CACHE_SIZE, table=DECODE_TABLE):
+        """ Initialize an empty cache.
+        Parameters:
+            maxSize (int): The most parsed values kept.
+            table (dict): The precomputed values, keyed by (attribute, text).
+        """
+        self.maxSize = maxSize
+        self.table = table
+        self.stats = {'tableHits': 0, 'hits': 0, 'misses': 0, 'evictions': 0}
+        self.__cache = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def decode(self, attribute, text):
+        """ Convert text to value based on attribute.
+        Parameters:
+            attribute (WeatherAttribute): The attribute to convert text to value for.
+            text (str): The text to convert to value.
+        Returns:
+            int, float, tuple, or enum: The value of the text.
+        """
+        key = (attribute, payloadOf(attribute, text))
+        value = self.table.get(key)
+        if value is not None:
+            # Not locked, this is the hot path and a rare lost count under threads is harmless
+            self.stats['tableHits'] += 1
+            return value
+        with self.__lock:
+            value = self.__cache.get(key)
+            if value is not None:
+                self.__cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return value
+            self.stats['misses'] += 1
+        # Parsed outside the lock, two threads may parse the same text but get the same value
+        value = parseValue(attribute, key[1])
+        with self.__lock:
+            self.__cache[key] = value
+            if len(self.__cache) > self.maxSize:
+                self.__cache.popitem(last=False)
+                self.stats['evictions'] += 1
+        return value
+
+    def hitRate(self):
+        """ Get the fraction of cacheable lookups answered without parsing.
+        Returns:
+            float: From 0.0 to 1.0, 0.0 before any lookups.
+        """
+        hits = self.stats['tableHits'] + self.stats['hits']
+        total = hits + self.stats['misses']
+        return hits / total if total > 0 else 0.0
+
+    def clear(self):
+        """ Forget the parsed values and reset the stats. """
+        with self.__lock:
+            self.__cache.clear()
+            for stat in self.stats:
+                self.stats[stat] = 0
+
+    def __len__(self):
+        """ Return the number of parsed values kept. """
+        return len(self.__cache)
+
+
+valueDecoder = ValueDecoder()
+
+
+def textToValue(attribute, text):
+    """ Convert text to value based on attribute.
+    Parameters:
+        attribute (WeatherAttribute): The attribute to convert text to value for.
+        text (str): The text to convert to value.
+    Returns:
+        int, float, tuple, or enum: The value of the text.
+    """
+    return valueDecoder.decode(attribute, text)
+
+
+def alertWindowsToText(location, windows):
+    """ Convert matching alert windows to a message.
+    Parameters:
+        location (str): The location key the windows were found for.
+        windows (list): A list of tuples of datetime.datetime objects representing
+                        the start and end of the matching conditions.
+    Returns:
+        str: The text of the message.
+    """
+    response = f"For {location}..."
+    if len(windows) == 0:
+        return response + "\nNo alerts!"
+    response += "\nConditions met from "
+    for i in range(len(windows)):
+        if i > 0 and (i != len(windows) - 1 or len(windows) > 2):
+            response += ", "
+        elif i > 0:
+            response += " and "
+        time1, time2 = windows[i]
+        if time1.day == time2.day:
+            response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%H:%M')}"
+        else:
+            response += f"{time1.strftime('%B %d, %H:%M')} to {time2.strftime('%B %d, %H:%M')}"
+    return response
+
+
+def alertDigestToText(alerts, limit=DISCORD_MESSAGE_LIMIT):
+    """ Combine all of a user's matching alerts into as few messages as possible.
+    Parameters:
+        alerts (list): (profile name, location key, windows) tuples for one user.
+        limit (int): The longest message allowed.
+    Returns:
+        list: The texts of the messages, each at most limit characters.
+    """
+    if len(alerts) == 1:
+        sections = [alertWindowsToText(alerts[0][1], alerts[0][2])]
+    else:
+        sections = [f"{name}: {alertWindowsToText(location, windows)}" for name, location, windows in alerts]
+    messages = []
+    current = ""
+    for section in sections:
+        while len(section) > limit:
+            # A section too long for one message is split wherever the limit falls
+            if current != "":
+                messages.append(current)
+                current = ""
+            messages.append(section[:limit])
+            section = section[limit:]
+        if current == "":
+            current = section
+        elif len(current) + 2 + len(section) <= limit:
+            current += "\n\n" + section
+        else:
+            messages.append(current)
+            current = section
+    if current != "":
+        messages.append(current)
+    return messages
+
+
 def temperatureToTextRange(temp):
     """ Convert temperature to text range.
     Parameters:
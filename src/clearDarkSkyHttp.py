@@ -0,0 +1,212 @@
+""" Shared HTTP plumbing for requests to cleardarksky.com. """
+
+import asyncio
+import threading
+import time
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from clearDarkSkyConstants import *
+
+
+class TokenBucket:
+    """ Limits the rate of requests, allowing short bursts.
+    Tokens refill at rate per second up to burst. Each request takes one; when
+    none is left the request reserves the next one and waits for it, so
+    waiting requests are served in arrival order at exactly the allowed rate.
+    Works from threads and from any event loop.
+    Attributes:
+        rate (float): Requests per second.
+        burst (int): The most requests allowed back to back.
+        stats (dict): Counts of requests and of those that waited, and the total and longest wait.
+    """
+
+    def __init__(self, rate=REQUEST_RATE, burst=REQUEST_BURST):
+        """ Initialize a full bucket.
+        Parameters:
+            rate (float): Requests per second.
+            burst (int): The most requests allowed back to back.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+        self.stats = {'requests': 0, 'waited': 0, 'totalWait': 0.0, 'maxWait': 0.0}
+
+    def reserve(self):
+        """ Take a token, going into debt if none is left.
+        Returns:
+            float: Seconds to wait before making the request.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(float(self.burst), self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= 1
+            wait = max(0.0, -self.__tokens / self.rate)
+            self.stats['requests'] += 1
+            if wait > 0:
+                self.stats['waited'] += 1
+                self.stats['totalWait'] += wait
+                self.stats['maxWait'] = max(self.stats['maxWait'], wait)
+            return wait
+
+    def acquire(self):
+        """ Wait for a token, blocking the thread.
+        Returns:
+            float: The seconds waited.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquireAsync(self):
+        """ Wait for a token without blocking the event loop.
+        Returns:
+            float: The seconds waited.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def averageWait(self):
+        """ Get the mean queue wait per request.
+        Returns:
+            float: Seconds, 0.0 if nothing has been requested.
+        """
+        return self.stats['totalWait'] / self.stats['requests'] if self.stats['requests'] > 0 else 0.0
+
+
+class SessionManager:
+    """ Owns the pooled, keep-alive HTTP sessions used for every request.
+    A blocking requests.Session and an aiohttp.ClientSession are created lazily
+    and reused, so a cycle over many locations pays the connection handshake once.
+    Every request, sync or async, first takes a token from the shared limiter.
+    Attributes:
+        poolSize (int): The maximum number of pooled connections per host.
+        connectTimeout (float): Seconds to wait for a connection.
+        readTimeout (float): Seconds to wait for a response.
+        keepAliveTimeout (float): Seconds an idle async connection is kept open.
+        concurrencyLimit (int): The maximum number of concurrent async requests.
+        limiter (TokenBucket): The rate limit shared by all requests.
+    """
+
+    def __init__(self, poolSize=REQUEST_POOL_SIZE, connectTimeout=REQUEST_CONNECT_TIMEOUT,
+                 readTimeout=REQUEST_TIMEOUT, keepAliveTimeout=REQUEST_KEEPALIVE_TIMEOUT,
+                 concurrencyLimit=REQUEST_CONCURRENCY_LIMIT, limiter=None):
+        """ Initialize the session manager.
+        Parameters:
+            poolSize (int): The maximum number of pooled connections per host.
+            connectTimeout (float): Seconds to wait for a connection.
+            readTimeout (float): Seconds to wait for a response.
+            keepAliveTimeout (float): Seconds an idle async connection is kept open.
+            concurrencyLimit (int): The maximum number of concurrent async requests.
+            limiter (TokenBucket): The rate limit, a REQUEST_RATE/REQUEST_BURST bucket if not given.
+        """
+        self.poolSize = poolSize
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.keepAliveTimeout = keepAliveTimeout
+        self.concurrencyLimit = concurrencyLimit
+        self.limiter = limiter if limiter is not None else TokenBucket()
+        self.__session = None
+        self.__asyncSession = None
+        self.__asyncSemaphore = None
+        self.__asyncLoop = None
+        self.__closing = set()
+
+    def getSession(self):
+        """ Get the shared blocking session.
+        Returns:
+            requests.Session: The pooled session.
+        """
+        if self.__session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.poolSize, pool_maxsize=self.poolSize)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Connection'] = 'keep-alive'
+            self.__session = session
+        return self.__session
+
+    def get(self, url, headers=None):
+        """ Get a url through the shared blocking session.
+        Parameters:
+            url (str): The url to request.
+            headers (dict): Extra request headers, optional.
+        Returns:
+            requests.Response: The response.
+        """
+        self.limiter.acquire()
+        return self.getSession().get(url, headers=headers, timeout=(self.connectTimeout, self.readTimeout))
+
+    def close(self):
+        """ Close the shared blocking session, if one is open. """
+        if self.__session is not None:
+            self.__session.close()
+        self.__session = None
+
+    def __retireAsyncSession(self, loop):
+        """ Close the async session of another event loop before it is replaced.
+        It is closed on its own loop while that loop is open, whether running in
+        another thread or not yet, otherwise on the running loop.
+        Parameters:
+            loop (asyncio.AbstractEventLoop): The running event loop.
+        """
+        session = self.__asyncSession
+        if session is None or session.closed:
+            return
+        if not self.__asyncLoop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), self.__asyncLoop)
+            return
+        # Keep a reference, the loop only holds a weak one to its tasks
+        task = loop.create_task(session.close())
+        self.__closing.add(task)
+        task.add_done_callback(self.__closing.discard)
+
+    def getAsyncSession(self):
+        """ Get the shared async session.
+        The session is created on first use and recreated, closing the old one,
+        when it is used from a different event loop.
+        Returns:
+            aiohttp.ClientSession: The pooled session.
+        """
+        loop = asyncio.get_running_loop()
+        if self.__asyncSession is None or self.__asyncSession.closed or self.__asyncLoop is not loop:
+            self.__retireAsyncSession(loop)
+            self.__asyncLoop = loop
+            connector = aiohttp.TCPConnector(limit=self.poolSize, keepalive_timeout=self.keepAliveTimeout)
+            timeout = aiohttp.ClientTimeout(total=self.readTimeout, connect=self.connectTimeout)
+            self.__asyncSession = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self.__asyncSemaphore = asyncio.Semaphore(self.concurrencyLimit)
+        return self.__asyncSession
+
+    async def getAsync(self, url, headers=None):
+        """ Get a url through the shared async session.
+        Parameters:
+            url (str): The url to request.
+            headers (dict): Extra request headers, optional.
+        Returns:
+            tuple: The status code, the body and the headers of the response.
+        """
+        session = self.getAsyncSession()
+        await self.limiter.acquireAsync()
+        async with self.__asyncSemaphore:
+            async with session.get(url, headers=headers) as response:
+                return response.status, await response.read(), response.headers
+
+    async def closeAsync(self):
+        """ Close the shared async session, if one is open. """
+        if self.__asyncSession is not None and not self.__asyncSession.closed:
+            await self.__asyncSession.close()
+        self.__asyncSession = None
+        self.__asyncSemaphore = None
+        self.__asyncLoop = None
+
+
+sessions = SessionManager()
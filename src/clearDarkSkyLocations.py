@@ -0,0 +1,93 @@
+""" Prefix index of location keys for autocomplete. """
+
+import bisect
+
+from clearDarkSkyConstants import *
+
+
+class LocationIndex:
+    """ A sorted array of location keys searched with bisect.
+    Matching ignores case; suggestions keep the case of the key as it was added.
+    Attributes:
+        maxSuggestions (int): The most suggestions returned, Discord allows 25.
+    """
+
+    def __init__(self, keys=(), maxSuggestions=LOCATION_SUGGESTION_LIMIT):
+        """ Initialize the index.
+        Parameters:
+            keys (iterable): The location keys to start with.
+            maxSuggestions (int): The most suggestions returned.
+        """
+        self.maxSuggestions = maxSuggestions
+        self.__folded = []
+        self.__keys = []
+        self.update(keys)
+
+    def __len__(self):
+        """ Return the number of location keys. """
+        return len(self.__keys)
+
+    def __contains__(self, key):
+        """ Check if a location key is in the index, ignoring case. """
+        folded = key.casefold()
+        i = bisect.bisect_left(self.__folded, folded)
+        return i < len(self.__folded) and self.__folded[i] == folded
+
+    def add(self, key):
+        """ Add a location key, if it is not already in the index.
+        Parameters:
+            key (str): The location key.
+        """
+        key = key.strip()
+        if key == '' or key in self:
+            return
+        folded = key.casefold()
+        i = bisect.bisect_left(self.__folded, folded)
+        self.__folded.insert(i, folded)
+        self.__keys.insert(i, key)
+
+    def update(self, keys):
+        """ Add many location keys, rebuilding the arrays once.
+        Parameters:
+            keys (iterable): The location keys.
+        """
+        merged = {folded: key for folded, key in zip(self.__folded, self.__keys)}
+        for key in keys:
+            key = key.strip()
+            if key != '':
+                merged.setdefault(key.casefold(), key)
+        self.__folded = sorted(merged)
+        self.__keys = [merged[folded] for folded in self.__folded]
+
+    def suggest(self, prefix):
+        """ Get the location keys starting with a prefix, ignoring case.
+        Parameters:
+            prefix (str): What the user has typed so far.
+        Returns:
+            list: At most maxSuggestions location keys, in sorted order.
+        """
+        prefix = prefix.strip().casefold()
+        start = bisect.bisect_left(self.__folded, prefix)
+        # Every key with the prefix sorts before the prefix followed by the highest code point
+        limit = min(len(self.__folded), start + self.maxSuggestions)
+        end = bisect.bisect_left(self.__folded, prefix + '\U0010ffff', start, limit)
+        return self.__keys[start:end]
+
+    def load(self, filename):
+        """ Add the location keys from a catalog file, one per line.
+        A missing catalog is ignored.
+        Parameters:
+            filename (str): The catalog file.
+        Returns:
+            int: The number of location keys read.
+        """
+        try:
+            with open(filename, 'r') as f:
+                keys = [line for line in f.read().splitlines() if not line.startswith('#')]
+        except OSError:
+            return 0
+        self.update(keys)
+        return len(keys)
+
+
+locationIndex = LocationIndex()
@@ -6,19 +6,83 @@ import time
 import math
 import json
 import os
+from collections.abc import Mapping
 
 import requests
 from bs4 import BeautifulSoup
 
 from clearDarkSkyConstants import *
 import clearDarkSkyHelpers as helpers
+from clearDarkSkyStorage import AsyncProfileStore, ProfileRegistry, createProfileStore
+
+def _atMost(attribute, threshold):
+    """ Check that an attribute is missing or at most the threshold. """
+    field = PointInTime.FIELDS[attribute]
+    def check(hour):
+        value = getattr(hour, field)
+        return value is None or value <= threshold
+    return check
+
+
+def _atLeast(attribute, threshold):
+    """ Check that an attribute is missing or at least the threshold. """
+    field = PointInTime.FIELDS[attribute]
+    def check(hour):
+        value = getattr(hour, field)
+        return value is None or value >= threshold
+    return check
+
+
+def _transparencyAtMost(threshold):
+    """ Check that transparency is missing or its value is at most the threshold. """
+    def check(hour):
+        value = hour.transparency
+        return value is None or value.value <= threshold
+    return check
+
+
+def _anyAtLeast(attribute, threshold):
+    """ Check that a list attribute is missing or any of its values is at least the threshold. """
+    field = PointInTime.FIELDS[attribute]
+    def check(hour):
+        values = getattr(hour, field)
+        return values is None or any(value >= threshold for value in values)
+    return check
+
+
+def _minimumAtMost(attribute, threshold):
+    """ Check that a range attribute is missing or its minimum is at most the threshold. """
+    field = PointInTime.FIELDS[attribute]
+    def check(hour):
+        value = getattr(hour, field)
+        return value is None or min(value) <= threshold
+    return check
+
+
+def _withinRange(attribute, low, high):
+    """ Check that a range attribute is missing or lies within low and high. """
+    field = PointInTime.FIELDS[attribute]
+    def check(hour):
+        value = getattr(hour, field)
+        return value is None or (min(value) >= low and max(value) <= high)
+    return check
+
 
 class PointInTime:
-    """ A point in time with weather data. 
+    """ A point in time with weather data.
+    Each attribute has its own slot, so an hour is one small object instead of an
+    instance dictionary plus a data dictionary. Unset attributes are None.
     Attributes:
         timestamp (datetime.datetime): The date and time of of weather data.
-        data (dict): The weather data. Keys are WeatherAttribute enums and values 
-                     are ints, floats, tuples, or enums.
+        cloudCover (int): Percent of the sky covered.
+        transparency (Transparency): The transparency of the sky.
+        seeing (float): The seeing, from 0.0 to 1.0.
+        darkness (list): The limiting magnitudes, one per 15 minutes.
+        smoke (int): The smoke in ug/m^3.
+        wind (tuple): The wind speed range in mph.
+        humidity (tuple): The humidity range in percent.
+        temperature (tuple): The temperature range in F.
+        data (PointInTimeData): A read-only mapping of WeatherAttribute enums to the values set.
     Methods:
         __init__(self, timestamp): Initialize the point in time with a timestamp.
         __str__(self): Return a string representation of the point in time.
@@ -26,14 +90,28 @@ class PointInTime:
         add(self, attribute, text): Add a weather attribute and its value to the point in time.
     """
 
+    FIELDS = {
+        WeatherAttribute.CLOUD_COVER: 'cloudCover',
+        WeatherAttribute.TRANSPARENCY: 'transparency',
+        WeatherAttribute.SEEING: 'seeing',
+        WeatherAttribute.DARKNESS: 'darkness',
+        WeatherAttribute.SMOKE: 'smoke',
+        WeatherAttribute.WIND: 'wind',
+        WeatherAttribute.HUMIDITY: 'humidity',
+        WeatherAttribute.TEMPERATURE: 'temperature'
+    }
+
+    __slots__ = ('timestamp',) + tuple(FIELDS.values())
+
     def __init__(self, timestamp):
         """ Initialize the point in time with a timestamp.
         Parameters:
             timestamp (datetime.datetime): The date and time of of weather data.
         """
         self.timestamp = timestamp
-        self.data = dict()
-    
+        for field in PointInTime.FIELDS.values():
+            setattr(self, field, None)
+
     def __str__(self):
         """ Return a string representation of the point in time. """
         return f'{self.timestamp} with {len(self.data)} attributes'
@@ -41,10 +119,24 @@ class PointInTime:
     def __repr__(self):
         """ Return a string representation of the point in time. """
         output = f'{self.timestamp}\n'
-        for attribute in self.data:
-            output += f'{attribute}: {self.data[attribute]}\n'
+        for attribute, value in self.data.items():
+            output += f'{attribute}: {value}\n'
         return output
 
+    @property
+    def data(self):
+        """ Get the weather data as a mapping, like the dictionary it used to be. """
+        return PointInTimeData(self)
+
+    def get(self, attribute):
+        """ Get the value of a weather attribute.
+        Parameters:
+            attribute (WeatherAttribute): The attribute to get.
+        Returns:
+            int, float, enum, tuple or list: The value, None if not set.
+        """
+        return getattr(self, PointInTime.FIELDS[attribute])
+
     def add(self, attribute, value):
         """ Add a weather attribute and its value to the point in time.
         Parameters:
@@ -53,18 +145,71 @@ class PointInTime:
         """
         if attribute == WeatherAttribute.DARKNESS:
             # Darkness is a special because it is provide in 15 min increments 
-            if attribute not in self.data:
-                self.data[attribute] = [value]
+            if self.darkness is None:
+                self.darkness = [value]
             else:
-                self.data[attribute].append(value)
+                self.darkness.append(value)
         else:
-            self.data[attribute] = value
+            setattr(self, PointInTime.FIELDS[attribute], value)
+
+    def __getstate__(self):
+        """ Pickle as a tuple of the slots, much smaller than a dictionary. """
+        return tuple(getattr(self, field) for field in PointInTime.__slots__)
+
+    def __setstate__(self, state):
+        """ Unpickle the slots, or the dictionaries of a PointInTime pickled before it had slots. """
+        if isinstance(state, tuple):
+            for field, value in zip(PointInTime.__slots__, state):
+                setattr(self, field, value)
+            return
+        self.__init__(state['timestamp'])
+        for attribute, value in state['data'].items():
+            setattr(self, PointInTime.FIELDS[attribute], value)
+
+
+class PointInTimeData(Mapping):
+    """ A read-only view of the weather data of a PointInTime.
+    Keys are WeatherAttribute enums and values are ints, floats, tuples, or enums,
+    only the attributes that are set are present.
+    """
+
+    __slots__ = ('__hour',)
+
+    def __init__(self, hour):
+        """ Initialize the view.
+        Parameters:
+            hour (PointInTime): The point in time to view.
+        """
+        self.__hour = hour
+
+    def __getitem__(self, attribute):
+        """ Get the value of a weather attribute, KeyError if not set. """
+        value = getattr(self.__hour, PointInTime.FIELDS[attribute])
+        if value is None:
+            raise KeyError(attribute)
+        return value
+
+    def get(self, attribute, default=None):
+        """ Get the value of a weather attribute, default if not set. """
+        value = getattr(self.__hour, PointInTime.FIELDS[attribute])
+        return default if value is None else value
+
+    def __iter__(self):
+        """ Iterate over the set attributes in WeatherAttribute order. """
+        hour = self.__hour
+        return (attribute for attribute, field in PointInTime.FIELDS.items() if getattr(hour, field) is not None)
+
+    def __len__(self):
+        """ Return the number of set attributes. """
+        hour = self.__hour
+        return sum(1 for field in PointInTime.FIELDS.values() if getattr(hour, field) is not None)
 
 
 class AlertProfile:
     """ An alert profile for a user. """
 
-    DIRECTORY = 'AlertProfiles'
+    store = ProfileRegistry(createProfileStore())
+    __asyncStore = None
 
     LOCATION = 'LOCATION'
     DURATION = 'DURATION'
@@ -81,6 +226,7 @@ class AlertProfile:
         self.__attributes = dict()
         self.__attributes[AlertProfile.LOCATION] = location
         self.__attributes[AlertProfile.DURATION] = 0
+        self.__predicate = None
 
     def __str__(self):
         """ Return a string representation of the alert profile. """
@@ -114,6 +260,7 @@ class AlertProfile:
             value (int, float, enum or tuple): The value of the attribute.
         """
         self.__attributes[str(attribute)] = value
+        self.__predicate = None
 
     def remove(self, attribute):
         """ Remove an attribute from the alert profile.
@@ -121,6 +268,7 @@ class AlertProfile:
             attribute (WeatherAttribute): The attribute to remove.
         """
         del self.__attributes[str(attribute)]
+        self.__predicate = None
 
     def get(self, attribute):
         """ Get the value of an attribute.
@@ -134,186 +282,186 @@ class AlertProfile:
         except KeyError:
             return None
 
-    def __checkForCloudCoverage(self, hour):
-        """ Check if the cloud coverage matches the alert profile.
-        Parameters:
-            hour (PointInTime): The hour to check.
+    def __compile(self):
+        """ Compile the attributes set on the alert profile into a predicate.
+        Only the set attributes are checked; an attribute missing from an hour
+        always matches.
         Returns:
-            bool: True if the cloud coverage matches the alert profile, False otherwise.
+            function: Takes a PointInTime and returns True if it matches the alert profile.
         """
-        try:
-            return hour.data[WeatherAttribute.CLOUD_COVER] <= self.get(WeatherAttribute.CLOUD_COVER)
-        except:
+        checks = []
+        for attribute in [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SMOKE]:
+            if self.get(attribute) is not None:
+                checks.append(_atMost(attribute, self.get(attribute)))
+        if self.get(WeatherAttribute.TRANSPARENCY) is not None:
+            checks.append(_transparencyAtMost(Transparency(self.get(WeatherAttribute.TRANSPARENCY)).value))
+        if self.get(WeatherAttribute.SEEING) is not None:
+            checks.append(_atLeast(WeatherAttribute.SEEING, self.get(WeatherAttribute.SEEING)))
+        if self.get(WeatherAttribute.DARKNESS) is not None:
+            checks.append(_anyAtLeast(WeatherAttribute.DARKNESS, self.get(WeatherAttribute.DARKNESS)))
+        for attribute in [WeatherAttribute.WIND, WeatherAttribute.HUMIDITY]:
+            if self.get(attribute) is not None:
+                checks.append(_minimumAtMost(attribute, self.get(attribute)))
+        if self.get(WeatherAttribute.TEMPERATURE) is not None:
+            temperature = self.get(WeatherAttribute.TEMPERATURE)
+            checks.append(_withinRange(WeatherAttribute.TEMPERATURE, min(temperature), max(temperature)))
+
+        if len(checks) == 0:
+            return lambda hour: True
+
+        def predicate(hour):
+            for check in checks:
+                if not check(hour):
+                    return False
             return True
+        return predicate
 
-    def __checkForTransparency(self, hour):
-        """ Check if the transparency matches the alert profile.
+    def __checkHour(self, hour):
+        """ Check if the hour matches the alert profile.
         Parameters:
             hour (PointInTime): The hour to check.
         Returns:
-            bool: True if the transparency matches the alert profile, False otherwise.
+            bool: True if the hour matches the alert profile, False otherwise.
         """
-        try:
-            return hour.data[WeatherAttribute.TRANSPARENCY].value  <= self.get(WeatherAttribute.TRANSPARENCY).value
-        except:
-            return True
+        if self.__predicate is None:
+            self.__predicate = self.__compile()
+        return self.__predicate(hour)
 
-    def __checkForSeeing(self, hour):
-        """ Check if the seeing matches the alert profile.
+    @staticmethod
+    def findWindows(hours, duration):
+        """ Find runs of consecutive matching hours in a single pass.
         Parameters:
-            hour (PointInTime): The hour to check.
-        Returns:
-            bool: True if the seeing matches the alert profile, False otherwise.
+            hours (iterable): (datetime.datetime, bool) pairs in time order, True
+                              if the hour matches.
+            duration (int): The minimum number of hours in a run. Durations below
+                            one behave as one.
+        Yields:
+            tuple: The datetime.datetime start and end of each run, as soon as it ends.
         """
-        try:
-            return hour.data[WeatherAttribute.SEEING] >= self.get(WeatherAttribute.SEEING)
-        except:
-            return True
-
-    def __checkForDarkness(self, hour):
-        """ Check if the darkness matches the alert profile.
+        duration = max(duration, 1)
+        start = end = None
+        length = 0
+        for timestamp, isValid in hours:
+            if isValid:
+                if length == 0:
+                    start = timestamp
+                end = timestamp
+                length += 1
+            else:
+                if length >= duration:
+                    yield (start, end)
+                length = 0
+        if length >= duration:
+            yield (start, end)
+
+    def checkForAlertStream(self, hours):
+        """ Check hours of weather data as they arrive.
         Parameters:
-            hour (PointInTime): The hour to check.
-        Returns:
-            bool: True if the darkness matches the alert profile, False otherwise.
+            hours (iterable): PointInTime objects in time order.
+        Yields:
+            tuple: The datetime.datetime start and end of each matching run,
+                as soon as it ends.
         """
-        try:
-            for darkness in hour.data[WeatherAttribute.DARKNESS]:
-                if darkness >= self.get(WeatherAttribute.DARKNESS):
-                    return True
-            return False
-        except:
-            return True
+        if self.__predicate is None:
+            self.__predicate = self.__compile()
+        predicate = self.__predicate
+        return AlertProfile.findWindows(((hour.timestamp, predicate(hour)) for hour in hours),
+                                        self.__attributes[AlertProfile.DURATION])
 
-    def __checkForSmoke(self, hour):
-        """ Check if the smoke matches the alert profile.
+    def checkForAlert(self, weatherData):
+        """ Check if the weather data matches the alert profile.
         Parameters:
-            hour (PointInTime): The hour to check.
+            weatherData (dictionary or ForecastFrame): A dictionary of PointInTime
+                objects, or a columnar forecast.
         Returns:
-            bool: True if the smoke matches the alert profile, False otherwise.
+            list: A list of tuples datetime.datetime objects representing 
+                the start and end of the matching conditions.
         """
-        try:
-            return hour.data[WeatherAttribute.SMOKE] <= self.get(WeatherAttribute.SMOKE)
-        except:
-            return True
+        if hasattr(weatherData, 'hourMask'):
+            hours = zip(weatherData.timestamps, weatherData.hourMask(self))
+            return list(AlertProfile.findWindows(hours, self.__attributes[AlertProfile.DURATION]))
+        return list(self.checkForAlertStream(weatherData.values()))
+
+    def __serialize(self):
+        """ Get the attributes in a form the profile store can save. """
+        attributes = dict(self.__attributes)
+        transparency = self.get(WeatherAttribute.TRANSPARENCY)
+        if transparency is not None:
+            attributes[str(WeatherAttribute.TRANSPARENCY)] = Transparency(transparency).value
+        return attributes
+
+    def __deserialize(self, attributes):
+        """ Set the attributes from what the profile store loaded. """
+        self.__attributes = attributes
+        self.__predicate = None
+        transparency = self.get(WeatherAttribute.TRANSPARENCY)
+        if transparency is not None:
+            self.add(WeatherAttribute.TRANSPARENCY, Transparency(transparency))
 
-    def __checkForWind(self, hour):
-        """ Check if the wind matches the alert profile.
+    @staticmethod
+    def fromStored(username, name, attributes):
+        """ Build an alert profile from an entry of the profile store.
         Parameters:
-            hour (PointInTime): The hour to check.
+            username (str): The username of the alert profile.
+            name (str): The name of the alert profile.
+            attributes (dict): The stored attributes.
         Returns:
-            bool: True if the wind matches the alert profile, False otherwise.
+            AlertProfile: The alert profile.
         """
-        try:
-            return min(hour.data[WeatherAttribute.WIND]) <= self.get(WeatherAttribute.WIND)
-        except:
-            return True
+        profile = AlertProfile(username, name)
+        profile.__deserialize(attributes)
+        return profile
 
-    def __checkForHumidity(self, hour):
-        """ Check if the humidity matches the alert profile.
-        Parameters:
-            hour (PointInTime): The hour to check.
-        Returns:
-            bool: True if the humidity matches the alert profile, False otherwise.
-        """
-        try:
-            return min(hour.data[WeatherAttribute.HUMIDITY]) <= self.get(WeatherAttribute.HUMIDITY)
-        except:
-            return True
+    def save(self):
+        """ Save the alert profile to the profile store. """
+        AlertProfile.store.save(self.username, self.name, self.__serialize())
 
-    def __checkForTemperature(self, hour):
-        """ Check if the temperature matches the alert profile.
-        Parameters:
-            hour (PointInTime): The hour to check.
-        Returns:
-            bool: True if the temperature matches the alert profile, False otherwise.
+    def delete(self):
+        """ Delete the alert profile from the profile store. """
+        return AlertProfile.store.delete(self.username, self.name)
+
+    def load(self):
+        """ Load the alert profile from the profile store.
+        Raises:
+            FileNotFoundError: If the alert profile has not been saved.
         """
-        try:
-            min_pass = min(hour.data[WeatherAttribute.TEMPERATURE]) >= min(self.get(WeatherAttribute.TEMPERATURE))
-            max_pass = max(hour.data[WeatherAttribute.TEMPERATURE]) <= max(self.get(WeatherAttribute.TEMPERATURE))
-            return min_pass and max_pass
-        except:
-            return True
+        self.__deserialize(AlertProfile.store.load(self.username, self.name))
 
-    def __checkHour(self, hour):
-        """ Check if the hour matches the alert profile.
-        Parameters:
-            hour (PointInTime): The hour to check.
+    @staticmethod
+    def asyncStore():
+        """ Get the async wrapper of the current profile store.
         Returns:
-            bool: True if the hour matches the alert profile, False otherwise.
+            AsyncProfileStore: Shared by every alert profile so writes can be coalesced.
+        """
+        if AlertProfile.__asyncStore is None or AlertProfile.__asyncStore.store is not AlertProfile.store:
+            AlertProfile.__asyncStore = AsyncProfileStore(AlertProfile.store)
+        return AlertProfile.__asyncStore
+
+    async def asave(self):
+        """ Save the alert profile without blocking the event loop. """
+        await AlertProfile.asyncStore().save(self.username, self.name, self.__serialize())
+
+    async def adelete(self):
+        """ Delete the alert profile without blocking the event loop. """
+        return await AlertProfile.asyncStore().delete(self.username, self.name)
+
+    async def aload(self):
+        """ Load the alert profile without blocking the event loop.
+        Raises:
+            FileNotFoundError: If the alert profile has not been saved.
         """
-        conditions = [self.__checkForCloudCoverage(hour),
-                        self.__checkForTransparency(hour),
-                        self.__checkForSeeing(hour),
-                        self.__checkForDarkness(hour),
-                        self.__checkForSmoke(hour),
-                        self.__checkForWind(hour),
-                        self.__checkForHumidity(hour),
-                        self.__checkForTemperature(hour)]
-        return all(conditions)
+        self.__deserialize(await AlertProfile.asyncStore().load(self.username, self.name))
 
-    def checkForAlert(self, weatherData):
-        """ Check if the weather data matches the alert profile.
+    @staticmethod
+    async def agetAllForUser(username):
+        """ Get all alert profiles for a user without blocking the event loop.
         Parameters:
-            weatherData (dictionary): A dictionary of PointInTime objects.
+            username (string): The username of the user.
         Returns:
-            list: A list of tuples datetime.datetime objects representing 
-                the start and end of the matching conditions.
+            list: A list of AlertProfile objects.
         """
-        matches = []
-        matching_num = 0
-        start = None
-        for h in range(0, len(weatherData)):
-            key = list(weatherData.keys())[h]
-            hour = weatherData[key]
-            isValid = self.__checkHour(hour)
-            if isValid:
-                matching_num += 1
-                if matching_num == 1:
-                    start = hour.timestamp
-            if not isValid and matching_num >= self.__attributes[AlertProfile.DURATION]:
-                key = list(weatherData.keys())[h-1]
-                end = weatherData[key].timestamp
-                matches.append((start, end))
-                matching_num = 0
-            if h == len(weatherData) - 1 and matching_num >= self.__attributes[AlertProfile.DURATION]:
-                end = weatherData[key].timestamp
-                matches.append((start, end))
-        return matches
-
-    def __getFilename(self):
-        """ Get the filename for the alert profile. """
-        return AlertProfile.DIRECTORY + '/' + self.username + '-' + self.name + '.json'
-
-    def save(self):
-        """ Save the alert profile to file. """
-        if not os.path.exists(AlertProfile.DIRECTORY):
-            os.makedirs(AlertProfile.DIRECTORY)
-        with open(self.__getFilename(), 'w') as f:
-            transparency = self.get(WeatherAttribute.TRANSPARENCY)
-            if transparency is not None:
-                self.add(WeatherAttribute.TRANSPARENCY, transparency.value)
-            json.dump(self.__attributes, f)
-            if transparency is not None:
-                self.add(WeatherAttribute.TRANSPARENCY, transparency)
-
-    def delete(self):
-        """ Delete the alert profile from file. """
-        try:
-            if os.path.exists(self.__getFilename()):
-                os.remove(self.__getFilename())
-                return True
-        except:
-            return False
-        return False
-
-    def load(self):
-        """ Load the alert profile from file. """
-        with open(self.__getFilename(), 'r') as f:
-            self.__attributes = json.load(f)
-            transparency = self.get(WeatherAttribute.TRANSPARENCY)
-            if transparency is not None:
-                self.add(WeatherAttribute.TRANSPARENCY, Transparency(transparency))
+        entries = await AlertProfile.asyncStore().listForUser(str(username))
+        return [AlertProfile.fromStored(*entry) for entry in entries]
 
     @staticmethod
     def getAllForUser(username):    
@@ -323,27 +471,39 @@ class AlertProfile:
         Returns:
             list: A list of AlertProfile objects.
         """
-        username = str(username)
-        profiles = []
-        for filename in os.listdir(AlertProfile.DIRECTORY):
-            if filename.startswith(username):
-                profile = AlertProfile(username, filename.split('-')[1].split('.')[0])
-                profile.load()
-                profiles.append(profile)
-        return profiles
+        return [AlertProfile.fromStored(*entry) for entry in AlertProfile.store.listForUser(str(username))]
+
+    @staticmethod
+    def getAllForLocation(location):
+        """ Get all alert profiles for a location.
+        Parameters:
+            location (string): The location key.
+        Returns:
+            list: A list of AlertProfile objects.
+        """
+        return [AlertProfile.fromStored(*entry) for entry in AlertProfile.store.listForLocation(location)]
 
     @staticmethod
     def getAll():    
-        """ Get all alert profiles.
+        """ Get all alert profiles, with the profiles of a location next to each other.
         Returns:
             list: A list of AlertProfile objects.
         """
-        profiles = []
-        for filename in os.listdir(AlertProfile.DIRECTORY):
-            try: 
-                profile = AlertProfile(filename.split('-')[0], filename.split('-')[1].split('.')[0])
-                profile.load()
-                profiles.append(profile)
-            except:
-                pass
-        return profiles
+        return [AlertProfile.fromStored(*entry) for entry in AlertProfile.store.listAll()]
+
+    @staticmethod
+    def groupByLocation(profiles):
+        """ Group alert profiles by their location key.
+        Parameters:
+            profiles (list): A list of AlertProfile objects.
+        Returns:
+            dict: A dictionary of location keys to lists of AlertProfile objects,
+                  in the order each location was first seen.
+        """
+        groups = dict()
+        for profile in profiles:
+            location = profile.get(AlertProfile.LOCATION)
+            if location not in groups:
+                groups[location] = []
+            groups[location].append(profile)
+        return groups
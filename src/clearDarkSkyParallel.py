@@ -0,0 +1,140 @@
+""" Parse many location pages at once on a process pool. """
+
+import asyncio
+import concurrent.futures
+import multiprocessing
+
+from clearDarkSkyConstants import *
+import clearDarkSkyWeb as web
+
+
+def _parseChunk(pages):
+    """ Parse a chunk of pages in a worker.
+    Parameters:
+        pages (list): The html of each page.
+    Returns:
+        list: A ForecastFrame for each page, None for a page that could not be parsed.
+    """
+    forecasts = []
+    for content in pages:
+        try:
+            forecasts.append(web.parseForecast(content))
+        except Exception:
+            forecasts.append(None)
+    return forecasts
+
+
+class BatchParser:
+    """ Spreads the parsing of many pages over a process pool, so it is not held to one core.
+    Pages are sent to the workers chunkSize at a time to amortize the cost of
+    sending them. Forecasts come back as ForecastFrame objects, which pickle
+    as a few arrays.
+    Attributes:
+        workers (int): The number of worker processes, None for one per core.
+        chunkSize (int): The number of pages sent to a worker at once.
+        stats (dict): Counters of pages parsed, pages that failed and forecasts served from the cache.
+    """
+
+    def __init__(self, workers=PARSE_PROCESS_WORKERS, chunkSize=PARSE_CHUNK_SIZE, executor=None):
+        """ Initialize the parser. The pool is started on first use.
+        Parameters:
+            workers (int): The number of worker processes, None for one per core.
+            chunkSize (int): The number of pages sent to a worker at once.
+            executor (concurrent.futures.Executor): The pool to parse on instead of a new process pool, optional.
+        """
+        self.workers = workers
+        self.chunkSize = max(1, chunkSize)
+        self.stats = {'parsed': 0, 'failed': 0, 'cached': 0}
+        self.__executor = executor
+        self.__ownsExecutor = executor is None
+
+    @property
+    def executor(self):
+        """ Get the pool, creating it on first use. """
+        if self.__executor is None:
+            # Spawned rather than forked, forking a process that runs threads and an event loop is unsafe
+            self.__executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(PARSE_START_METHOD))
+        return self.__executor
+
+    def __chunks(self, pages):
+        """ Split pages into lists of chunkSize. """
+        pages = list(pages)
+        return [pages[i:i + self.chunkSize] for i in range(0, len(pages), self.chunkSize)]
+
+    def __collect(self, chunks):
+        """ Flatten parsed chunks and count the results. """
+        forecasts = [forecast for chunk in chunks for forecast in chunk]
+        failed = sum(1 for forecast in forecasts if forecast is None)
+        self.stats['parsed'] += len(forecasts) - failed
+        self.stats['failed'] += failed
+        return forecasts
+
+    def parse(self, pages):
+        """ Parse many pages, blocking until all are done.
+        Parameters:
+            pages (iterable): The html of each page, bytes or str.
+        Returns:
+            list: A ForecastFrame for each page in order, None for a page that could not be parsed.
+        """
+        return self.__collect(self.executor.map(_parseChunk, self.__chunks(pages)))
+
+    async def parseAsync(self, pages):
+        """ Parse many pages without blocking the event loop.
+        See parse.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*[loop.run_in_executor(self.executor, _parseChunk, chunk)
+                                        for chunk in self.__chunks(pages)])
+        return self.__collect(chunks)
+
+    async def extract(self, locations):
+        """ Get the forecasts of many locations, fetching the pages concurrently and
+        parsing the ones the forecast cache cannot answer in one batch.
+        Parameters:
+            locations (iterable): The location keys.
+        Returns:
+            dict: Location key to ForecastFrame, or None if it could not be fetched or parsed.
+        """
+        locations = list(locations)
+        loop = asyncio.get_running_loop()
+        # Cache lookups may read pickles from disk, so they run on the default thread pool
+        cached = await asyncio.gather(*[loop.run_in_executor(None, web.forecastCache.lookup, location)
+                                        for location in locations])
+        forecasts = dict(zip(locations, cached))
+        pending = []
+        for location in locations:
+            if forecasts[location] is not None:
+                self.stats['cached'] += 1
+            else:
+                pending.append(location)
+        responses = await asyncio.gather(*[web.fetchPageAsync(location, web.forecastCache.conditionalHeaders(location))
+                                           for location in pending])
+        toParse = []
+        for location, response in zip(pending, responses):
+            if response is None:
+                continue
+            status, content, headers = response
+            try:
+                data, lastUpdated = await loop.run_in_executor(None, web.cacheResponse, location, status, content, headers)
+            except ValueError:
+                continue
+            if data is not None:
+                forecasts[location] = data
+                self.stats['cached'] += 1
+            else:
+                toParse.append((location, content, lastUpdated, headers))
+        parsed = await self.parseAsync([content for _, content, _, _ in toParse])
+        stored = []
+        for (location, _, lastUpdated, headers), forecast in zip(toParse, parsed):
+            if forecast is not None:
+                stored.append(web.storeForecastAsync(location, forecast, lastUpdated, headers))
+            forecasts[location] = forecast
+        await asyncio.gather(*stored)
+        return forecasts
+
+    def shutdown(self):
+        """ Stop the worker processes, if this parser started them. """
+        if self.__ownsExecutor and self.__executor is not None:
+            self.__executor.shutdown(wait=True)
+            self.__executor = None
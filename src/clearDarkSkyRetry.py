@@ -0,0 +1,245 @@
+""" Retry policy and circuit breaker for requests to cleardarksky.com. """
+
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from clearDarkSkyConstants import *
+
+
+class CircuitOpenError(Exception):
+    """ Raised instead of making a request to a host whose circuit is open.
+    Attributes:
+        host (str): The host that is failing.
+        retryAfter (float): Seconds until the host will be probed again.
+    """
+
+    def __init__(self, host, retryAfter):
+        super().__init__(f'{host} is unavailable, retry in {retryAfter:.0f}s')
+        self.host = host
+        self.retryAfter = retryAfter
+
+
+class StatusError(ValueError):
+    """ Raised for a response worth retrying, such as a 503.
+    Unlike a connection error or timeout it shows the host is reachable, so it
+    counts against the circuit once per call that gives up, not per attempt.
+    Attributes:
+        status (int): The status code of the response.
+    """
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitBreaker:
+    """ Stops requests to a host after repeated failures.
+    After failureThreshold consecutive failures the circuit opens and requests
+    are refused for resetTimeout seconds. Then a single probe is let through:
+    success closes the circuit, failure opens it again.
+    Attributes:
+        host (str): The host this breaker guards.
+        failureThreshold (int): Consecutive failures that open the circuit.
+        resetTimeout (float): Seconds the circuit stays open before a probe.
+        state (str): CLOSED, OPEN or HALF_OPEN.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host, failureThreshold=CIRCUIT_FAILURE_THRESHOLD, resetTimeout=CIRCUIT_RESET_TIMEOUT):
+        """ Initialize a closed circuit.
+        Parameters:
+            host (str): The host this breaker guards.
+            failureThreshold (int): Consecutive failures that open the circuit.
+            resetTimeout (float): Seconds the circuit stays open before a probe.
+        """
+        self.host = host
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.__openedAt = 0.0
+        self.__lock = threading.Lock()
+
+    def retryAfter(self):
+        """ Get the seconds until a request will be allowed.
+        Returns:
+            float: 0.0 if the circuit is closed or due a probe.
+        """
+        if self.state == CircuitBreaker.CLOSED:
+            return 0.0
+        return max(0.0, self.__openedAt + self.resetTimeout - time.monotonic())
+
+    def isOpen(self):
+        """ Check if requests are currently being refused.
+        Returns:
+            bool: True while the circuit is open or a probe is in flight.
+        """
+        return self.retryAfter() > 0.0
+
+    def allow(self):
+        """ Claim permission to make a request.
+        Raises:
+            CircuitOpenError: If the circuit is open, or a probe is already in flight.
+        """
+        with self.__lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return
+            if self.retryAfter() == 0.0:
+                # Let one probe through; if it never reports back another goes after resetTimeout
+                self.state = CircuitBreaker.HALF_OPEN
+                self.__openedAt = time.monotonic()
+                return
+            raise CircuitOpenError(self.host, self.retryAfter())
+
+    def success(self):
+        """ Record a request that reached the host. """
+        with self.__lock:
+            self.state = CircuitBreaker.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        """ Record a request that failed because of the host. """
+        with self.__lock:
+            self.failures += 1
+            if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.failureThreshold:
+                self.state = CircuitBreaker.OPEN
+                self.__openedAt = time.monotonic()
+
+
+class CircuitBreakers:
+    """ One CircuitBreaker per host, created on first use. """
+
+    def __init__(self, failureThreshold=CIRCUIT_FAILURE_THRESHOLD, resetTimeout=CIRCUIT_RESET_TIMEOUT):
+        """ Initialize the registry.
+        Parameters:
+            failureThreshold (int): Consecutive failures that open a circuit.
+            resetTimeout (float): Seconds a circuit stays open before a probe.
+        """
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.__breakers = dict()
+
+    def forUrl(self, url):
+        """ Get the breaker for the host of a url.
+        Parameters:
+            url (str): The url about to be requested.
+        Returns:
+            CircuitBreaker: The breaker for its host.
+        """
+        host = urlsplit(url).netloc
+        if host not in self.__breakers:
+            self.__breakers[host] = CircuitBreaker(host, self.failureThreshold, self.resetTimeout)
+        return self.__breakers[host]
+
+
+class RetryPolicy:
+    """ Exponential backoff with full jitter and a total deadline.
+    Attempt n waits a random time between 0 and min(maxDelay, baseDelay * multiplier ** n)
+    before the next one. No attempt starts if its wait would pass the deadline.
+    Every attempt that fails to reach the host counts against the breaker, a
+    StatusError only once the call gives up.
+    Attributes:
+        attempts (int): The maximum number of attempts.
+        baseDelay (float): Seconds before the first retry, before jitter.
+        maxDelay (float): The longest wait between attempts.
+        multiplier (float): How much the wait grows each attempt.
+        deadline (float): Seconds all attempts together may take.
+    """
+
+    def __init__(self, attempts=REQUEST_RETRY_COUNT, baseDelay=REQUEST_RETRY_DELAY, maxDelay=REQUEST_RETRY_MAX_DELAY,
+                 multiplier=REQUEST_RETRY_MULTIPLIER, deadline=REQUEST_RETRY_DEADLINE):
+        """ Initialize the policy.
+        Parameters:
+            attempts (int): The maximum number of attempts.
+            baseDelay (float): Seconds before the first retry, before jitter.
+            maxDelay (float): The longest wait between attempts.
+            multiplier (float): How much the wait grows each attempt.
+            deadline (float): Seconds all attempts together may take.
+        """
+        self.attempts = attempts
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.multiplier = multiplier
+        self.deadline = deadline
+
+    def delay(self, attempt):
+        """ Get the wait after a failed attempt.
+        Parameters:
+            attempt (int): The number of the failed attempt, from 0.
+        Returns:
+            float: Seconds to wait.
+        """
+        return random.uniform(0, min(self.maxDelay, self.baseDelay * self.multiplier ** attempt))
+
+    def __nextDelay(self, error, attempt, deadline, breaker):
+        """ Record a failed attempt and get the wait before the next one, or None if there should not be one.
+        A probe of a half-open circuit is not retried, nor is a call once the circuit opens. """
+        reachedHost = isinstance(error, StatusError)
+        if breaker is not None and not reachedHost:
+            breaker.failure()
+        delay = self.delay(attempt)
+        if attempt + 1 >= self.attempts or (breaker is not None and breaker.state != CircuitBreaker.CLOSED) \
+                or time.monotonic() + delay > deadline:
+            # One failure per call that gave up, so one bad page cannot open the circuit for every page
+            if breaker is not None and reachedHost:
+                breaker.failure()
+            return None
+        return delay
+
+    def call(self, function, *args, breaker=None):
+        """ Call a function until it returns, retrying when it raises.
+        Parameters:
+            function (function): The function to call.
+            args: Its arguments.
+            breaker (CircuitBreaker): Records the outcome of the call and refuses attempts while open, optional.
+        Returns:
+            The result of the first successful call.
+        Raises:
+            CircuitOpenError: If the breaker refuses an attempt.
+            Exception: What the last attempt raised, once attempts or time run out.
+        """
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.allow()
+            try:
+                result = function(*args)
+            except Exception as error:
+                delay = self.__nextDelay(error, attempt, deadline, breaker)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.success()
+            return result
+
+    async def callAsync(self, function, *args, breaker=None):
+        """ Await a coroutine function until it returns, retrying when it raises.
+        See call.
+        """
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.allow()
+            try:
+                result = await function(*args)
+            except Exception as error:
+                delay = self.__nextDelay(error, attempt, deadline, breaker)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.success()
+            return result
@@ -0,0 +1,235 @@
+""" Sharded, staggered scheduling of the daily alert check. """
+
+import asyncio
+import math
+import zlib
+
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+
+from clearDarkSkyConstants import *
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def shardOf(location, shards):
+    """ Get the shard a location belongs to.
+    The hash is stable across processes, unlike hash(), so a location keeps its slot.
+    Parameters:
+        location (str): The location key.
+        shards (int): The number of shards.
+    Returns:
+        int: The shard, from 0 to shards - 1.
+    """
+    return zlib.crc32(str(location).encode('utf-8')) % shards
+
+
+class ShardedSchedule:
+    """ Spreads the daily alert check over a window, one job per shard.
+    Locations are split into shards by hash, so all profiles of a location are
+    checked together. Shard i starts i * window / shards seconds into the window.
+    The window grows when there are more locations than can be fetched in it
+    at REQUEST_RATE, so the cycle still finishes on time.
+    Attributes:
+        shards (int): The number of shards.
+        startHour (int): The hour the window opens.
+        startMinute (int): The minute the window opens.
+        window (float): The configured window length in seconds.
+        headroom (float): How much longer than the bare fetch time the window must be.
+        rate (float): Requests per second the fetches are limited to.
+    """
+
+    JOB_PREFIX = 'alerts-shard-'
+    JOB_ID = JOB_PREFIX + '%d'
+
+    def __init__(self, shards=ALERT_SHARDS, startHour=ALERT_START_HOUR, startMinute=ALERT_START_MINUTE,
+                 window=ALERT_WINDOW, headroom=ALERT_WINDOW_HEADROOM, rate=REQUEST_RATE):
+        """ Initialize the schedule.
+        Parameters:
+            shards (int): The number of shards.
+            startHour (int): The hour the window opens.
+            startMinute (int): The minute the window opens.
+            window (float): The window length in seconds.
+            headroom (float): How much longer than the bare fetch time the window must be.
+            rate (float): Requests per second the fetches are limited to.
+        """
+        self.shards = shards
+        self.startHour = startHour
+        self.startMinute = startMinute
+        self.window = window
+        self.headroom = headroom
+        self.rate = rate
+
+    def windowFor(self, locationCount):
+        """ Get the window length needed for a number of locations.
+        Parameters:
+            locationCount (int): The number of distinct locations.
+        Returns:
+            float: Seconds, at least the configured window and at most a day.
+        """
+        needed = math.ceil(locationCount / self.rate * self.headroom)
+        return min(max(self.window, needed), SECONDS_PER_DAY)
+
+    def startTimes(self, locationCount):
+        """ Get the time of day each shard starts.
+        Parameters:
+            locationCount (int): The number of distinct locations.
+        Returns:
+            list: (hour, minute, second) for each shard.
+        """
+        window = self.windowFor(locationCount)
+        start = self.startHour * 3600 + self.startMinute * 60
+        times = []
+        for shard in range(self.shards):
+            offset = int(start + shard * window / self.shards) % SECONDS_PER_DAY
+            times.append((offset // 3600, offset % 3600 // 60, offset % 60))
+        return times
+
+    def misfireGraceTime(self, locationCount):
+        """ Get how late a shard job may still run, one shard slot.
+        Parameters:
+            locationCount (int): The number of distinct locations.
+        Returns:
+            int: Seconds.
+        """
+        return max(1, int(self.windowFor(locationCount) / self.shards))
+
+    def install(self, scheduler, job, locationCount):
+        """ Add or replace a cron job per shard.
+        A shard that misses its time runs late if still within its slot,
+        missed runs are coalesced into one and a shard never overlaps itself.
+        Parameters:
+            scheduler (apscheduler.schedulers.base.BaseScheduler): The scheduler.
+            job (function): Called with the shard number.
+            locationCount (int): The number of distinct locations.
+        """
+        grace = self.misfireGraceTime(locationCount)
+        for shard, (hour, minute, second) in enumerate(self.startTimes(locationCount)):
+            trigger = CronTrigger(hour=hour, minute=minute, second=second)
+            existing = scheduler.get_job(ShardedSchedule.JOB_ID % shard)
+            if existing is not None and str(existing.trigger) == str(trigger) \
+                    and existing.misfire_grace_time == grace:
+                # Keep a persisted job as it is so a run missed while down is not lost
+                continue
+            scheduler.add_job(job, trigger, args=[shard],
+                              id=ShardedSchedule.JOB_ID % shard, replace_existing=True,
+                              misfire_grace_time=grace, coalesce=True, max_instances=1)
+        current = {ShardedSchedule.JOB_ID % shard for shard in range(self.shards)}
+        for existing in scheduler.get_jobs():
+            # Drop jobs left over from a configuration with more shards
+            if existing.id.startswith(ShardedSchedule.JOB_PREFIX) and existing.id not in current:
+                scheduler.remove_job(existing.id)
+
+    def locationsFor(self, locations, shard):
+        """ Get the locations in a shard.
+        Parameters:
+            locations (iterable): The location keys.
+            shard (int): The shard.
+        Returns:
+            list: The location keys in the shard.
+        """
+        return [location for location in locations if shardOf(location, self.shards) == shard]
+
+
+def createJobStore(path=SCHEDULER_DATABASE):
+    """ Create the job store the scheduler persists its jobs in, so they survive restarts.
+    Parameters:
+        path (str): The SQLite database file.
+    Returns:
+        SQLAlchemyJobStore: The job store.
+    """
+    return SQLAlchemyJobStore(url=f'sqlite:///{path}')
+
+
+class SingleFlight:
+    """ Runs at most one call per key at a time.
+    A caller arriving while a call for its key is running waits for that call
+    and gets its result instead of starting another.
+    """
+
+    def __init__(self):
+        """ Initialize with nothing in flight. """
+        self.__inFlight = dict()
+
+    def running(self, key):
+        """ Check if a call for a key is in flight.
+        Parameters:
+            key: The key.
+        Returns:
+            bool: True if a call is running.
+        """
+        return key in self.__inFlight
+
+    async def run(self, key, function, *args):
+        """ Run a coroutine function for a key, or join the call already running.
+        Parameters:
+            key: What identifies the call.
+            function (coroutine function): The function to run.
+            args: Its arguments.
+        Returns:
+            The result of the call.
+        """
+        future = self.__inFlight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(function(*args))
+            self.__inFlight[key] = future
+            future.add_done_callback(lambda _: self.__inFlight.pop(key, None))
+        # Shielded so one cancelled caller does not cancel the call for the others
+        return await asyncio.shield(future)
+
+
+class SchedulerManager:
+    """ Owns the one scheduler of the process.
+    start() may be called any number of times, from every on_ready, but only
+    the first creates and starts the scheduler. Jobs live in a SQLite job store
+    so a restart picks up the same jobs, and runs missed while down are made
+    up within their misfire grace time.
+    Attributes:
+        schedule (ShardedSchedule): The schedule of the alert check.
+        path (str): The job store database.
+        scheduler (AsyncIOScheduler): The scheduler, None until started.
+        singleFlight (SingleFlight): Keeps a shard from being checked twice at once.
+    """
+
+    def __init__(self, schedule, path=SCHEDULER_DATABASE):
+        """ Initialize the manager without starting anything.
+        Parameters:
+            schedule (ShardedSchedule): The schedule of the alert check.
+            path (str): The job store database.
+        """
+        self.schedule = schedule
+        self.path = path
+        self.scheduler = None
+        self.singleFlight = SingleFlight()
+
+    def start(self, job, locationCount):
+        """ Start the scheduler and install the shard jobs, once.
+        Parameters:
+            job (function): A module level coroutine function called with the shard number.
+            locationCount (int): The number of distinct locations.
+        Returns:
+            bool: True if this call started the scheduler, False if it was already running.
+        """
+        if self.scheduler is not None:
+            return False
+        self.scheduler = AsyncIOScheduler(jobstores={'default': createJobStore(self.path)})
+        # Started before installing so the persisted jobs can be compared with the schedule
+        self.scheduler.start()
+        self.schedule.install(self.scheduler, job, locationCount)
+        return True
+
+    def resize(self, job, locationCount):
+        """ Reinstall the shard jobs for a new number of locations.
+        Parameters:
+            job (function): A module level coroutine function called with the shard number.
+            locationCount (int): The number of distinct locations.
+        """
+        if self.scheduler is not None:
+            self.schedule.install(self.scheduler, job, locationCount)
+
+    def shutdown(self):
+        """ Stop the scheduler, if it was started. """
+        if self.scheduler is not None:
+            self.scheduler.shutdown(wait=False)
+            self.scheduler = None
@@ -0,0 +1,233 @@
+""" Versioned binary snapshots of a location's forecast. """
+
+import datetime
+import mmap
+import os
+import struct
+import sys
+import traceback
+from array import array
+
+from clearDarkSkyConstants import *
+from clearDarkSkyForecast import ForecastFrame, DARKNESS_PER_HOUR, RANGE_ATTRIBUTES
+
+MAGIC = b'CDSF'
+FORMAT_VERSION = 1
+ALIGNMENT = 8
+NO_DATE = -2 ** 63
+EPOCH = datetime.datetime(1970, 1, 1)
+SECOND = datetime.timedelta(seconds=1)
+
+# Magic, version, number of sections, hours, "Last updated" in seconds since EPOCH
+HEADER = struct.Struct('<4sHHIq4x')
+# Attribute, part (0 for a value or minimum, 1 for a maximum), array typecode, items, offset
+SECTION = struct.Struct('<BBcxIQ')
+VALUE = 0
+MAXIMUM = 1
+
+
+def _toSeconds(timestamp):
+    """ Convert a naive datetime.datetime to whole seconds since EPOCH. """
+    return (timestamp - EPOCH) // SECOND
+
+
+def _toDatetime(seconds):
+    """ Convert seconds since EPOCH to a naive datetime.datetime. """
+    return EPOCH + seconds * SECOND
+
+
+def _aligned(offset):
+    """ Round an offset up to ALIGNMENT. """
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _columns(frame):
+    """ List the (attribute, part, column) of a frame in Y_CORD_TO_ATTRIBUTE order. """
+    columns = []
+    for attribute in Y_CORD_TO_ATTRIBUTE.values():
+        if attribute == WeatherAttribute.TRANSPARENCY:
+            columns.append((attribute, VALUE, frame.transparency))
+        elif attribute == WeatherAttribute.DARKNESS:
+            columns.append((attribute, VALUE, frame.darkness))
+        elif attribute in RANGE_ATTRIBUTES:
+            columns.append((attribute, VALUE, frame.minimums[attribute]))
+            columns.append((attribute, MAXIMUM, frame.maximums[attribute]))
+        else:
+            columns.append((attribute, VALUE, frame.values[attribute]))
+    return columns
+
+
+def _littleEndian(column):
+    """ Get a column in the little-endian order of the format.
+    Arrays are in native byte order, so on a big-endian host this is a swapped copy.
+    Parameters:
+        column (memoryview): The column.
+    Returns:
+        memoryview: The column itself on a little-endian host, else a swapped copy.
+    """
+    if sys.byteorder == 'little' or column.itemsize == 1:
+        return column
+    swapped = array(column.format, column)
+    swapped.byteswap()
+    return memoryview(swapped)
+
+
+def dumpSnapshot(frame, lastUpdated=None):
+    """ Encode a forecast as a snapshot.
+    The layout is a header, a section table, the hour timestamps, then one packed
+    little-endian array per column, each starting on an 8 byte boundary.
+    Parameters:
+        frame (ForecastFrame): The forecast.
+        lastUpdated (datetime.datetime or str): The "Last updated" stamp of the page, optional.
+    Returns:
+        bytes: The snapshot.
+    """
+    if isinstance(lastUpdated, str):
+        lastUpdated = datetime.datetime.strptime(lastUpdated, '%Y-%m-%d %H:%M:%S')
+    hours = len(frame.timestamps)
+    timestamps = array('q', [_toSeconds(timestamp) for timestamp in frame.timestamps])
+    columns = [(0, VALUE, memoryview(timestamps))]
+    columns += [(attribute.value, part, memoryview(column)) for attribute, part, column in _columns(frame)]
+    offset = _aligned(HEADER.size + SECTION.size * len(columns))
+    sections = []
+    for attribute, part, column in columns:
+        sections.append((attribute, part, column.format.encode(), len(column), offset))
+        offset = _aligned(offset + column.nbytes)
+    buffer = bytearray(offset)
+    HEADER.pack_into(buffer, 0, MAGIC, FORMAT_VERSION, len(sections), hours,
+                     NO_DATE if lastUpdated is None else _toSeconds(lastUpdated))
+    for i, section in enumerate(sections):
+        SECTION.pack_into(buffer, HEADER.size + i * SECTION.size, *section)
+    for (_, _, _, _, start), (_, _, column) in zip(sections, columns):
+        buffer[start:start + column.nbytes] = _littleEndian(column).cast('B')
+    return bytes(buffer)
+
+
+def writeSnapshot(filename, frame, lastUpdated=None):
+    """ Write a forecast to a snapshot file, replacing it atomically.
+    Parameters:
+        filename (str): The file to write.
+        frame (ForecastFrame): The forecast.
+        lastUpdated (datetime.datetime or str): The "Last updated" stamp of the page, optional.
+    """
+    directory = os.path.dirname(filename)
+    if directory != '' and not os.path.exists(directory):
+        os.makedirs(directory)
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(dumpSnapshot(frame, lastUpdated))
+    os.replace(temporary, filename)
+
+
+class Snapshot:
+    """ A forecast snapshot read in place.
+    Columns are memoryviews of the underlying buffer, nothing is copied, so a
+    snapshot opened with open() only reads the pages of the file it touches.
+    The format is little-endian; a big-endian host reads swapped copies instead.
+    Attributes:
+        version (int): The format version of the snapshot.
+        hours (int): The number of hours.
+        lastUpdated (datetime.datetime): The "Last updated" stamp, None if unknown.
+    """
+
+    def __init__(self, buffer):
+        """ Read a snapshot from a buffer.
+        Parameters:
+            buffer (bytes-like): The snapshot, such as bytes or an mmap.
+        Raises:
+            ValueError: If the buffer is not a snapshot of a supported version, or is truncated.
+        """
+        self.__buffer = buffer
+        self.__view = memoryview(buffer)
+        if len(self.__view) < HEADER.size:
+            raise ValueError('Snapshot is truncated')
+        magic, self.version, sectionCount, self.hours, lastUpdated = HEADER.unpack_from(self.__view)
+        if magic != MAGIC:
+            raise ValueError('Not a forecast snapshot')
+        if self.version != FORMAT_VERSION:
+            raise ValueError(f'Unsupported snapshot version {self.version}')
+        self.lastUpdated = None if lastUpdated == NO_DATE else _toDatetime(lastUpdated)
+        if len(self.__view) < HEADER.size + sectionCount * SECTION.size:
+            raise ValueError('Snapshot is truncated')
+        self.__columns = dict()
+        for i in range(sectionCount):
+            attribute, part, typecode, items, offset = SECTION.unpack_from(self.__view, HEADER.size + i * SECTION.size)
+            itemSize = struct.calcsize(typecode.decode())
+            if offset + items * itemSize > len(self.__view):
+                raise ValueError('Snapshot is truncated')
+            column = self.__view[offset:offset + items * itemSize].cast(typecode.decode())
+            # Swapping the same way reads the file on a big-endian host, as a copy rather than a view
+            self.__columns[(attribute, part)] = _littleEndian(column)
+        self.__timestamps = None
+
+    @staticmethod
+    def open(filename):
+        """ Memory-map a snapshot file.
+        Parameters:
+            filename (str): The snapshot file.
+        Returns:
+            Snapshot: The snapshot, backed by the file.
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is not a snapshot of a supported version.
+        """
+        with open(filename, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return Snapshot(buffer)
+        except ValueError as error:
+            # The views the failed read took of the map live in the traceback's frames until cleared
+            traceback.clear_frames(error.__traceback__)
+            buffer.close()
+            raise
+
+    @property
+    def timestamps(self):
+        """ Get the datetime.datetime of each hour, in order. """
+        if self.__timestamps is None:
+            self.__timestamps = [_toDatetime(seconds) for seconds in self.__columns[(0, VALUE)]]
+        return self.__timestamps
+
+    def column(self, attribute, part=VALUE):
+        """ Get the packed array of an attribute without copying it.
+        Parameters:
+            attribute (WeatherAttribute): The attribute.
+            part (int): VALUE for a value or range minimum, MAXIMUM for a range maximum.
+        Returns:
+            memoryview: The column, 'd' doubles with NaN for missing values,
+                        'b' codes with MISSING_CODE for transparency.
+        Raises:
+            KeyError: If the snapshot has no such column.
+        """
+        return self.__columns[(attribute.value, part)]
+
+    def frame(self):
+        """ Get the forecast as a ForecastFrame whose columns are views of this snapshot.
+        Returns:
+            ForecastFrame: The forecast.
+        """
+        values = {attribute: self.column(attribute) for attribute in
+                  [WeatherAttribute.CLOUD_COVER, WeatherAttribute.SEEING, WeatherAttribute.SMOKE]}
+        minimums = {attribute: self.column(attribute) for attribute in RANGE_ATTRIBUTES}
+        maximums = {attribute: self.column(attribute, MAXIMUM) for attribute in RANGE_ATTRIBUTES}
+        darkness = self.column(WeatherAttribute.DARKNESS)
+        if len(darkness) != self.hours * DARKNESS_PER_HOUR:
+            raise ValueError(f'Snapshot darkness does not have {DARKNESS_PER_HOUR} values per hour')
+        return ForecastFrame.fromColumns(self.timestamps, values, minimums, maximums,
+                                         self.column(WeatherAttribute.TRANSPARENCY), darkness)
+
+    def close(self):
+        """ Release the buffer.
+        Raises:
+            BufferError: If a column or frame of a memory-mapped snapshot is still referenced.
+        """
+        self.__columns.clear()
+        self.__view.release()
+        if isinstance(self.__buffer, mmap.mmap):
+            self.__buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
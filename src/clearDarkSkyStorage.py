@@ -0,0 +1,550 @@
+""" Storage backends for alert profiles. """
+
+import abc
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from clearDarkSkyConstants import *
+
+LOCATION = 'LOCATION'
+
+
+class ProfileStore(abc.ABC):
+    """ Where alert profiles are kept.
+    Profiles are identified by username and name and stored as their attribute
+    dictionary, which must be JSON serializable.
+    """
+
+    @abc.abstractmethod
+    def save(self, username, name, attributes):
+        """ Save an alert profile, replacing any existing one.
+        Parameters:
+            username (str): The username of the alert profile.
+            name (str): The name of the alert profile.
+            attributes (dict): The attributes of the alert profile.
+        """
+
+    @abc.abstractmethod
+    def load(self, username, name):
+        """ Load an alert profile.
+        Parameters:
+            username (str): The username of the alert profile.
+            name (str): The name of the alert profile.
+        Returns:
+            dict: The attributes of the alert profile.
+        Raises:
+            FileNotFoundError: If there is no such alert profile.
+        """
+
+    @abc.abstractmethod
+    def delete(self, username, name):
+        """ Delete an alert profile.
+        Parameters:
+            username (str): The username of the alert profile.
+            name (str): The name of the alert profile.
+        Returns:
+            bool: True if the alert profile existed and was deleted, False otherwise.
+        """
+
+    @abc.abstractmethod
+    def listForUser(self, username):
+        """ Get all alert profiles for a user.
+        Parameters:
+            username (str): The username of the user.
+        Returns:
+            list: (username, name, attributes) tuples.
+        """
+
+    def listForLocation(self, location):
+        """ Get all alert profiles for a location.
+        Parameters:
+            location (str): The location key.
+        Returns:
+            list: (username, name, attributes) tuples.
+        """
+        return [entry for entry in self.listAll() if entry[2].get(LOCATION) == location]
+
+    @abc.abstractmethod
+    def listAll(self):
+        """ Get all alert profiles, grouped by location.
+        Returns:
+            list: (username, name, attributes) tuples.
+        """
+
+    def locations(self):
+        """ Get the distinct locations of all alert profiles.
+        Returns:
+            list: The location keys, sorted.
+        """
+        return sorted({entry[2].get(LOCATION) for entry in self.listAll()})
+
+    @abc.abstractmethod
+    def versions(self):
+        """ Get a version stamp for every stored alert profile without loading them.
+        A stamp changes whenever its alert profile is written, by this process or another.
+        Returns:
+            dict: (username, name) to version stamp.
+        """
+
+    def version(self, username, name):
+        """ Get the version stamp of one alert profile.
+        Parameters:
+            username (str): The username of the alert profile.
+            name (str): The name of the alert profile.
+        Returns:
+            The version stamp, or None if there is no such alert profile.
+        """
+        return self.versions().get((username, name))
+
+
+class JsonProfileStore(ProfileStore):
+    """ One JSON file per alert profile, named <username>-<name>.json. """
+
+    EXTENSION = '.json'
+
+    def __init__(self, directory):
+        """ Initialize the store.
+        Parameters:
+            directory (str): The directory the profile files are kept in.
+        """
+        self.directory = directory
+
+    def getFilename(self, username, name):
+        """ Get the filename for an alert profile. """
+        return self.directory + '/' + username + '-' + name + JsonProfileStore.EXTENSION
+
+    def save(self, username, name, attributes):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        with open(self.getFilename(username, name), 'w') as f:
+            json.dump(attributes, f)
+
+    def load(self, username, name):
+        with open(self.getFilename(username, name), 'r') as f:
+            return json.load(f)
+
+    def delete(self, username, name):
+        try:
+            if os.path.exists(self.getFilename(username, name)):
+                os.remove(self.getFilename(username, name))
+                return True
+        except OSError:
+            return False
+        return False
+
+    def __parse(self, filename):
+        """ Split a profile filename into username and name, or return None if it is not one. """
+        if not filename.endswith(JsonProfileStore.EXTENSION) or '-' not in filename:
+            return None
+        # Usernames are Discord ids and never contain '-', profile names may
+        return tuple(filename[:-len(JsonProfileStore.EXTENSION)].split('-', 1))
+
+    def __list(self, username=None):
+        """ Load the profiles in the directory, optionally only those of one user. """
+        entries = []
+        if not os.path.exists(self.directory):
+            return entries
+        for filename in sorted(os.listdir(self.directory)):
+            key = self.__parse(filename)
+            if key is None:
+                continue
+            owner, name = key
+            if username is not None and owner != username:
+                continue
+            try:
+                entries.append((owner, name, self.load(owner, name)))
+            except (OSError, ValueError):
+                pass
+        return entries
+
+    def listForUser(self, username):
+        return self.__list(username)
+
+    def listAll(self):
+        entries = self.__list()
+        entries.sort(key=lambda entry: str(entry[2].get(LOCATION)))
+        return entries
+
+    def versions(self):
+        stamps = dict()
+        if not os.path.exists(self.directory):
+            return stamps
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                key = self.__parse(entry.name)
+                if key is not None:
+                    stat = entry.stat()
+                    stamps[key] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def version(self, username, name):
+        try:
+            stat = os.stat(self.getFilename(username, name))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+
+class SqliteProfileStore(ProfileStore):
+    """ An embedded SQLite database of alert profiles, indexed by user and by location. """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS profiles (username TEXT NOT NULL, name TEXT NOT NULL, '
+        'location TEXT, attributes TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0, '
+        'PRIMARY KEY (username, name))',
+        'CREATE INDEX IF NOT EXISTS profiles_location ON profiles (location)',
+    ]
+
+    def __init__(self, path):
+        """ Initialize the store, creating the database if needed.
+        Parameters:
+            path (str): The database file, or ':memory:'.
+        """
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            for statement in SqliteProfileStore.SCHEMA:
+                self.__connection.execute(statement)
+            columns = [row[1] for row in self.__connection.execute('PRAGMA table_info(profiles)')]
+            if 'version' not in columns:
+                self.__connection.execute('ALTER TABLE profiles ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+    def __query(self, sql, parameters=()):
+        """ Run a query and return all rows. """
+        with self.__lock:
+            return self.__connection.execute(sql, parameters).fetchall()
+
+    def __write(self, sql, parameters=()):
+        """ Run a statement in a transaction and return the number of changed rows. """
+        with self.__lock, self.__connection:
+            return self.__connection.execute(sql, parameters).rowcount
+
+    def save(self, username, name, attributes):
+        # Every write takes the next version so readers can tell which rows changed
+        self.__write('INSERT OR REPLACE INTO profiles (username, name, location, attributes, version) '
+                     'VALUES (?, ?, ?, ?, (SELECT COALESCE(MAX(version), 0) + 1 FROM profiles))',
+                     (username, name, attributes.get(LOCATION), json.dumps(attributes)))
+
+    def load(self, username, name):
+        rows = self.__query('SELECT attributes FROM profiles WHERE username = ? AND name = ?', (username, name))
+        if len(rows) == 0:
+            raise FileNotFoundError(f'No alert profile {name} for {username}')
+        return json.loads(rows[0][0])
+
+    def delete(self, username, name):
+        return self.__write('DELETE FROM profiles WHERE username = ? AND name = ?', (username, name)) > 0
+
+    def __entries(self, rows):
+        """ Convert (username, name, attributes) rows to entries. """
+        return [(username, name, json.loads(attributes)) for username, name, attributes in rows]
+
+    def listForUser(self, username):
+        return self.__entries(self.__query(
+            'SELECT username, name, attributes FROM profiles WHERE username = ? ORDER BY name', (username,)))
+
+    def listForLocation(self, location):
+        return self.__entries(self.__query(
+            'SELECT username, name, attributes FROM profiles WHERE location = ? ORDER BY username, name', (location,)))
+
+    def listAll(self):
+        return self.__entries(self.__query(
+            'SELECT username, name, attributes FROM profiles ORDER BY location, username, name'))
+
+    def locations(self):
+        return [row[0] for row in self.__query('SELECT DISTINCT location FROM profiles ORDER BY location')]
+
+    def versions(self):
+        return {(username, name): version for username, name, version in
+                self.__query('SELECT username, name, version FROM profiles')}
+
+    def version(self, username, name):
+        rows = self.__query('SELECT version FROM profiles WHERE username = ? AND name = ?', (username, name))
+        return rows[0][0] if len(rows) > 0 else None
+
+    def close(self):
+        """ Close the database connection. """
+        self.__connection.close()
+
+
+class ProfileRegistry(ProfileStore):
+    """ A process-wide, in-memory view of a profile store.
+    Every alert profile is loaded once and reads are served from memory. Saves
+    and deletes write through to the store. Out-of-band edits are noticed by
+    comparing the store's version stamps (file mtimes for JSON), at most once
+    per refresh interval, and only the changed alert profiles are reloaded.
+    Attributes:
+        store (ProfileStore): The backing store.
+        refreshInterval (float): Seconds between checks for out-of-band edits.
+        stats (dict): Counters for loads and reloads.
+    """
+
+    def __init__(self, store, refreshInterval=PROFILE_REGISTRY_REFRESH_INTERVAL):
+        """ Initialize the registry. Nothing is loaded until the first read.
+        Parameters:
+            store (ProfileStore): The backing store.
+            refreshInterval (float): Seconds between checks for out-of-band edits.
+        """
+        self.store = store
+        self.refreshInterval = refreshInterval
+        self.stats = {'loaded': 0, 'reloaded': 0, 'dropped': 0}
+        self.__lock = threading.RLock()
+        self.__profiles = None
+        self.__versions = dict()
+        self.__byUser = dict()
+        self.__byLocation = dict()
+        self.__checked = 0.0
+
+    def __put(self, key, attributes, version):
+        """ Add or replace an alert profile in memory and in the indexes. """
+        self.__drop(key)
+        self.__profiles[key] = attributes
+        self.__versions[key] = version
+        self.__byUser.setdefault(key[0], set()).add(key)
+        self.__byLocation.setdefault(attributes.get(LOCATION), set()).add(key)
+
+    def __drop(self, key):
+        """ Remove an alert profile from memory and the indexes, if present. """
+        attributes = self.__profiles.pop(key, None)
+        self.__versions.pop(key, None)
+        if attributes is None:
+            return
+        self.__byUser[key[0]].discard(key)
+        if not self.__byUser[key[0]]:
+            del self.__byUser[key[0]]
+        location = attributes.get(LOCATION)
+        self.__byLocation[location].discard(key)
+        if not self.__byLocation[location]:
+            del self.__byLocation[location]
+
+    def refresh(self, force=False):
+        """ Load everything on first use, then reload alert profiles whose version changed.
+        Parameters:
+            force (bool): Check now even if the refresh interval has not passed.
+        """
+        with self.__lock:
+            now = time.monotonic()
+            if self.__profiles is not None and not force and now - self.__checked < self.refreshInterval:
+                return
+            self.__checked = now
+            versions = self.store.versions()
+            if self.__profiles is None:
+                self.__profiles = dict()
+                for username, name, attributes in self.store.listAll():
+                    self.__put((username, name), attributes, versions.get((username, name)))
+                    self.stats['loaded'] += 1
+                return
+            for key in [key for key in self.__profiles if key not in versions]:
+                self.__drop(key)
+                self.stats['dropped'] += 1
+            for key, version in versions.items():
+                if self.__versions.get(key, None) == version and key in self.__profiles:
+                    continue
+                try:
+                    self.__put(key, self.store.load(*key), version)
+                    self.stats['reloaded'] += 1
+                except (OSError, ValueError):
+                    self.__drop(key)
+
+    def __entries(self, keys):
+        """ Copy the alert profiles for keys into (username, name, attributes) entries. """
+        return [(username, name, dict(self.__profiles[(username, name)])) for username, name in keys]
+
+    def save(self, username, name, attributes):
+        with self.__lock:
+            self.refresh()
+            self.store.save(username, name, attributes)
+            self.__put((username, name), dict(attributes), self.store.version(username, name))
+
+    def load(self, username, name):
+        with self.__lock:
+            self.refresh()
+            attributes = self.__profiles.get((username, name))
+            if attributes is None:
+                # It may have been written out of band since the last check
+                attributes = self.store.load(username, name)
+                self.__put((username, name), attributes, self.store.version(username, name))
+            return dict(attributes)
+
+    def delete(self, username, name):
+        with self.__lock:
+            self.refresh()
+            self.__drop((username, name))
+            return self.store.delete(username, name)
+
+    def listForUser(self, username):
+        with self.__lock:
+            self.refresh()
+            return self.__entries(sorted(self.__byUser.get(username, ()), key=lambda key: key[1]))
+
+    def listForLocation(self, location):
+        with self.__lock:
+            self.refresh()
+            return self.__entries(sorted(self.__byLocation.get(location, ())))
+
+    def listAll(self):
+        with self.__lock:
+            self.refresh()
+            return self.__entries([key for location in sorted(self.__byLocation, key=str)
+                                   for key in sorted(self.__byLocation[location])])
+
+    def locations(self):
+        with self.__lock:
+            self.refresh()
+            return sorted(self.__byLocation, key=str)
+
+    def versions(self):
+        with self.__lock:
+            self.refresh()
+            return dict(self.__versions)
+
+
+class AsyncProfileStore:
+    """ Runs a profile store's I/O off the event loop.
+    Writes to the same alert profile are queued and applied in order. While one
+    is on disk, a save queued right behind another save replaces it, so the
+    writer only writes the newest attributes. Every caller waits for the write
+    that includes its change and gets that write's result or exception.
+    Reads see pending writes.
+    Attributes:
+        store (ProfileStore): The store to run operations on.
+        executor (concurrent.futures.Executor): The pool to run them on, None for the loop's default.
+        stats (dict): Counters for requested and performed writes.
+    """
+
+    SAVE = 'save'
+    DELETE = 'delete'
+
+    def __init__(self, store, executor=None):
+        """ Initialize the async store.
+        Parameters:
+            store (ProfileStore): The store to run operations on.
+            executor (concurrent.futures.Executor): The pool to run them on, optional.
+        """
+        self.store = store
+        self.executor = executor
+        self.stats = {'requested': 0, 'written': 0}
+        self.__pending = dict()
+        self.__writers = dict()
+
+    async def __run(self, function, *args):
+        """ Run a blocking store call on the executor. """
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def __apply(self, key, operation, attributes):
+        """ Run one operation on the store. """
+        if operation == AsyncProfileStore.SAVE:
+            return await self.__run(self.store.save, key[0], key[1], attributes)
+        return await self.__run(self.store.delete, key[0], key[1])
+
+    async def __writer(self, key):
+        """ Apply the pending operations for a key in order until none is left.
+        Each resolves the future its callers wait on, so a failed write only
+        fails its own callers and is not served by load afterwards.
+        """
+        queue = self.__pending[key]
+        current = None
+        try:
+            while len(queue) > 0:
+                current = queue.pop(0)
+                operation, attributes, future = current
+                try:
+                    result = await self.__apply(key, operation, attributes)
+                except Exception as error:
+                    future.set_exception(error)
+                else:
+                    self.stats['written'] += 1
+                    future.set_result(result)
+        finally:
+            del self.__writers[key]
+            del self.__pending[key]
+            # Only left behind if the writer itself was cancelled
+            for _, _, future in ([current] if current is not None else []) + queue:
+                if not future.done():
+                    future.cancel()
+
+    async def __write(self, key, operation, attributes=None):
+        """ Queue an operation for a key and wait for the write that includes it. """
+        self.stats['requested'] += 1
+        queue = self.__pending.setdefault(key, [])
+        if operation == AsyncProfileStore.SAVE and len(queue) > 0 and queue[-1][0] == AsyncProfileStore.SAVE:
+            # The newer attributes are written instead, for this caller and the ones already waiting
+            future = queue[-1][2]
+            queue[-1] = (operation, attributes, future)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            queue.append((operation, attributes, future))
+        if key not in self.__writers:
+            self.__writers[key] = asyncio.ensure_future(self.__writer(key))
+        # Shielded so a cancelled caller does not cancel a write others wait on
+        return await asyncio.shield(future)
+
+    async def save(self, username, name, attributes):
+        """ Save an alert profile. See ProfileStore.save. """
+        await self.__write((username, name), AsyncProfileStore.SAVE, dict(attributes))
+
+    async def delete(self, username, name):
+        """ Delete an alert profile. See ProfileStore.delete. """
+        return bool(await self.__write((username, name), AsyncProfileStore.DELETE))
+
+    async def load(self, username, name):
+        """ Load an alert profile. See ProfileStore.load. """
+        pending = self.__pending.get((username, name))
+        if pending:
+            operation, attributes, _ = pending[-1]
+            if operation == AsyncProfileStore.DELETE:
+                raise FileNotFoundError(f'No alert profile {name} for {username}')
+            return dict(attributes)
+        return await self.__run(self.store.load, username, name)
+
+    async def listForUser(self, username):
+        """ Get all alert profiles for a user. See ProfileStore.listForUser. """
+        return await self.__run(self.store.listForUser, username)
+
+
+def createProfileStore(backend=PROFILE_STORE_BACKEND):
+    """ Create the configured profile store.
+    Parameters:
+        backend (str): PROFILE_STORE_JSON or PROFILE_STORE_SQLITE.
+    Returns:
+        ProfileStore: The store.
+    """
+    if backend == PROFILE_STORE_SQLITE:
+        return SqliteProfileStore(PROFILE_DATABASE)
+    return JsonProfileStore(PROFILE_DIRECTORY)
+
+
+def migrate(source, destination):
+    """ Copy every alert profile from one store to another.
+    Parameters:
+        source (ProfileStore): The store to copy from.
+        destination (ProfileStore): The store to copy to.
+    Returns:
+        int: The number of alert profiles copied.
+    """
+    count = 0
+    for username, name, attributes in source.listAll():
+        destination.save(username, name, attributes)
+        count += 1
+    return count
+
+
+def main():
+    """ Migrate a directory of JSON alert profiles into a SQLite database. """
+    parser = argparse.ArgumentParser(description='Migrate JSON alert profiles to SQLite.')
+    parser.add_argument('--directory', default=PROFILE_DIRECTORY, help='directory of JSON alert profiles')
+    parser.add_argument('--database', default=PROFILE_DATABASE, help='SQLite database to write')
+    arguments = parser.parse_args()
+    destination = SqliteProfileStore(arguments.database)
+    count = migrate(JsonProfileStore(arguments.directory), destination)
+    destination.close()
+    print(f'Migrated {count} alert profile(s) from {arguments.directory} to {arguments.database}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,93 @@
+""" Fetching and parsing of cleardarksky.com location pages. """
 
+import asyncio
 import datetime
+import html as html_lib
+import re
 import time
 import math
 import json
 
-import requests
 from bs4 import BeautifulSoup
 
 from clearDarkSkyConstants import *
 import clearDarkSkyHelpers as helpers
+from clearDarkSkyHttp import sessions
+from clearDarkSkyCache import forecastCache, locationKeyCache
+from clearDarkSkyRetry import CircuitBreakers, RetryPolicy, StatusError
 from clearDarkSkyModel import AlertProfile, PointInTime
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyArchive import forecastArchive
+
+# Regex for scanning the image map without building a tree
+REGEX_MAP_OPEN = re.compile(r'<map\b[^>]*?(?<![-\w])name\s*=\s*["\']?(?-i:ckmap)["\'\s>/]', re.IGNORECASE)
+REGEX_MAP_CLOSE = re.compile(r'</map\s*>', re.IGNORECASE)
+REGEX_AREA = re.compile(r'<area\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.IGNORECASE)
+REGEX_ATTRIBUTE = re.compile(r'([^\s/>"\'=]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+REGEX_FONT_OPEN = re.compile(r'<font\b', re.IGNORECASE)
+REGEX_FONT_CLOSE = re.compile(r'</font\s*>', re.IGNORECASE)
+REGEX_TITLE_TIME = re.compile(r'(\d+)\D+(\d+)')
+
+NOT_FOUND_STATUSES = (404, 410)
+
+retryPolicy = RetryPolicy()
+validationPolicy = RetryPolicy(attempts=LOCATION_KEY_RETRY_COUNT)
+breakers = CircuitBreakers()
+
+
+def hostBreaker():
+    """ Get the circuit breaker for cleardarksky.com.
+    Returns:
+        CircuitBreaker: Open while the site is failing; check isOpen() and retryAfter().
+    """
+    return breakers.forUrl(BASE_URL)
+
+
+def _checkStatus(location, status):
+    """ Raise for a status that is worth retrying.
+    Parameters:
+        location (str): The location key that was requested.
+        status (int): The status code of the response.
+    Raises:
+        StatusError: If the status is not 200, 304 or one of NOT_FOUND_STATUSES.
+    """
+    if status not in (200, 304) and status not in NOT_FOUND_STATUSES:
+        raise StatusError(f'Unexpected status {status} for {location}', status)
+
+
+def fetchPage(location, headers=None, policy=None):
+    """ Fetch a location page, retrying with backoff while the host is reachable.
+    Parameters:
+        location (str): The location key to fetch the page for.
+        headers (dict): Extra request headers such as conditional validators, optional.
+        policy (RetryPolicy): How to retry, retryPolicy if not given.
+    Returns:
+        requests.Response: The response (200, 304 or one of NOT_FOUND_STATUSES),
+                           or None if it could not be fetched or the circuit is open.
+    """
+    url = BASE_URL % location
+
+    def attempt():
+        page = sessions.get(url, headers)
+        _checkStatus(location, page.status_code)
+        return page
+    try:
+        return (policy or retryPolicy).call(attempt, breaker=hostBreaker())
+    except Exception:
+        return None
 
 
 def validateLocationKey(location):
-    """ Validate the location key. Attempts up to 5 times.
+    """ Validate the location key.
     Parameters:
         location (str): The location key to validate.
     Returns:
         bool: True if the location key is valid, False otherwise.
     """
-    url = BASE_URL % location
-    attemps = 0
-    while True:
-        page = requests.get(url)
-        if page.status_code == 200:
-            return True
-        elif attemps == REQUEST_RETRY_COUNT:
-            return False
-        attemps += 1
-        time.sleep(REQUEST_RETRY_DELAY)
+    if not helpers.isLocationKey(location):
+        return False
+    page = fetchPage(location, policy=validationPolicy)
+    return page is not None and page.status_code == 200
 
 
 def extractDate(soup):
@@ -45,49 +104,373 @@ def extractDate(soup):
         return datetime.datetime(1970, 1, 1)
 
 
+def _buildWeatherData(start_date, areas):
+    """ Build weather data from the title and coords of each image map area.
+    Parameters:
+        start_date (datetime.datetime): The date of generation.
+        areas (iterable): (title, coords) pairs in page order.
+    Returns:
+        dictionary: A dictionary of weather data. Keys are datetime.datetime objects
+                    and values are PointInTime objects.
+    """
+    data = dict()
+    timestamps = dict()
+    for title, coords in areas:
+        coords = coords.split(',')
+        if int(coords[0]) == X_START_CORD:
+            day = 0
+        currentAttribute = Y_CORD_TO_ATTRIBUTE[int(coords[1])]
+        # Hour is the number the title starts with, minute is the number after it
+        match = REGEX_TITLE_TIME.match(title)
+        hour = int(match.group(1))
+        minute = int(match.group(2))
+        if hour == 0 and minute == 0:
+            day += 1
+        timestamp = timestamps.get((day, hour))
+        if timestamp is None:
+            timestamp = timestamps[(day, hour)] = start_date + datetime.timedelta(days=day, hours=hour)
+        pointInTime = data.get(timestamp)
+        if pointInTime is None:
+            pointInTime = data[timestamp] = PointInTime(timestamp)
+        parts = title.split(':', 2)
+        value = parts[2].strip() if len(parts) == 3 else ''
+        pointInTime.add(currentAttribute, helpers.textToValue(currentAttribute, value))
+    return data
+
+
+def parseWeatherDataSoup(content):
+    """ Parse weather data by building a BeautifulSoup tree of the whole page.
+    Parameters:
+        content (bytes or str): The html of the location page.
+    Returns:
+        dictionary: A dictionary of weather data. Keys are datetime.datetime objects
+                    and values are PointInTime objects.
+    Raises:
+        AttributeError: If the page does not contain the forecast image map.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    start_date = extractDate(soup)
+    details = soup.find(MAP_LABEL, MAP_DICT)
+    areas = details.find_all(AREA_LABEL)
+    return _buildWeatherData(start_date, ((area[TITLE_LABEL], area[COORDS_LABEL]) for area in areas \
+        if TITLE_LABEL in area.attrs and COORDS_LABEL in area.attrs))
+
+
+def _decode(content):
+    """ Decode raw html, falling back to windows-1252 for non utf-8 pages. """
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return content.decode('windows-1252', errors='replace')
+
+
+def extractDateFast(html):
+    """ Extract the date of generation by scanning for the first "Last updated"
+    text inside a font tag.
+    Parameters:
+        html (str): The html of the location page.
+    Returns:
+        datetime.datetime: The date of generation (0 hours, 0 min).
+    """
+    position = html.find(LAST_UPDATE_TEXT)
+    while position != -1:
+        prefix = html[:position]
+        depth = len(REGEX_FONT_OPEN.findall(prefix)) - len(REGEX_FONT_CLOSE.findall(prefix))
+        if depth > 0:
+            try:
+                return helpers.getDateFromText(html[position:position + 64])
+            except (IndexError, ValueError):
+                break
+        position = html.find(LAST_UPDATE_TEXT, position + 1)
+    return datetime.datetime(1970, 1, 1)
+
+
+def iterMapAreas(html):
+    """ Yield the title and coords of each area in the forecast image map
+    without building a document tree.
+    Parameters:
+        html (str): The html of the location page.
+    Yields:
+        tuple: The (title, coords) of each area that has both.
+    Raises:
+        AttributeError: If the page does not contain the forecast image map.
+    """
+    match = REGEX_MAP_OPEN.search(html)
+    if match is None:
+        raise AttributeError('No forecast image map')
+    end = REGEX_MAP_CLOSE.search(html, match.end())
+    end = end.start() if end is not None else len(html)
+    for attributes in REGEX_AREA.findall(html, match.end(), end):
+        title = coords = None
+        for name, doubleQuoted, singleQuoted, unquoted in REGEX_ATTRIBUTE.findall(attributes):
+            name = name.lower()
+            # Like BeautifulSoup, the last occurrence of a duplicated attribute wins
+            if name == TITLE_LABEL:
+                title = doubleQuoted or singleQuoted or unquoted
+            elif name == COORDS_LABEL:
+                coords = doubleQuoted or singleQuoted or unquoted
+        if title is not None and coords is not None:
+            if '&' in title:
+                title = html_lib.unescape(title)
+            if '&' in coords:
+                coords = html_lib.unescape(coords)
+            yield title, coords
+
+
+def parseWeatherDataFast(content):
+    """ Parse weather data by scanning only for the "Last updated" text and the
+    title and coords of the forecast image map areas.
+    Produces the same output as parseWeatherDataSoup.
+    Parameters:
+        content (bytes or str): The html of the location page.
+    Returns:
+        dictionary: A dictionary of weather data. Keys are datetime.datetime objects
+                    and values are PointInTime objects.
+    Raises:
+        AttributeError: If the page does not contain the forecast image map.
+    """
+    html = _decode(content)
+    return _buildWeatherData(extractDateFast(html), iterMapAreas(html))
+
+
+def parseWeatherData(content, parser=WEATHER_PARSER):
+    """ Parse weather data from website html.
+    Parameters:
+        content (bytes or str): The html of the location page.
+        parser (str): PARSER_FAST or PARSER_SOUP.
+    Returns:
+        dictionary: A dictionary of weather data. Keys are datetime.datetime objects
+                    and values are PointInTime objects.
+    Raises:
+        AttributeError: If the page does not contain the forecast image map.
+    """
+    if parser == PARSER_SOUP:
+        return parseWeatherDataSoup(content)
+    return parseWeatherDataFast(content)
+
+
+def parseForecast(content, parser=WEATHER_PARSER):
+    """ Parse weather data into a ForecastFrame, which is compact to store and to pickle.
+    Parameters:
+        content (bytes or str): The html of the location page.
+        parser (str): PARSER_FAST or PARSER_SOUP.
+    Returns:
+        ForecastFrame: The forecast.
+    Raises:
+        AttributeError: If the page does not contain the forecast image map.
+    """
+    return ForecastFrame.fromWeatherData(parseWeatherData(content, parser))
+
+
+def extractLastUpdated(content):
+    """ Extract the "Last updated" stamp from raw website html without parsing it.
+    Parameters:
+        content (bytes or str): The html of the location page.
+    Returns:
+        str: The stamp (for example "2023-05-25 13:12:13"), or None if not found.
+    """
+    if isinstance(content, str):
+        content = content.encode()
+    match = helpers.REGEX_LAST_UPDATED.search(content)
+    return match.group(1).decode() if match is not None else None
+
+
+def cacheResponse(location, status, content, headers):
+    """ Reconcile a fetched page with the forecast cache.
+    Parameters:
+        location (str): The location key the page was fetched for.
+        status (int): The status code of the response.
+        content (bytes): The html of the page.
+        headers (dict): The response headers.
+    Returns:
+        tuple: The cached weather data (None if the page must be parsed)
+               and the "Last updated" stamp of the page.
+    Raises:
+        ValueError: If the response is not usable.
+    """
+    if status == 304:
+        data = forecastCache.revalidate(location)
+        if data is None:
+            raise ValueError(f'Not modified but nothing cached for {location}')
+        return data, None
+    if status != 200:
+        raise ValueError(f'Unexpected status {status} for {location}')
+    lastUpdated = extractLastUpdated(content)
+    return forecastCache.reuse(location, lastUpdated, headers), lastUpdated
+
+
+def archiveForecast(location, data, lastUpdated):
+    """ Append a freshly parsed forecast to the forecast archive, if there is one.
+    Archiving is best effort: a forecast that cannot be archived is skipped, whatever the error.
+    Parameters:
+        location (str): The location key the page was fetched for.
+        data (dictionary or ForecastFrame): The weather data.
+        lastUpdated (str): The "Last updated" stamp of the page.
+    Returns:
+        bool: True if the forecast was archived.
+    """
+    if forecastArchive is None:
+        return False
+    try:
+        return forecastArchive.append(location, data, lastUpdated)
+    except Exception:
+        return False
+
+
+def storeForecast(location, data, lastUpdated, headers):
+    """ Store a freshly parsed forecast in the forecast cache and the forecast archive.
+    A forecast that cannot be archived is still cached and returned to the caller.
+    Parameters:
+        location (str): The location key the page was fetched for.
+        data (dictionary or ForecastFrame): The weather data.
+        lastUpdated (str): The "Last updated" stamp of the page.
+        headers (dict): The response headers.
+    """
+    forecastCache.store(location, data, lastUpdated, headers)
+    archiveForecast(location, data, lastUpdated)
+
+
 def extractWeatherData(location):
     """ Extract weather data from website html.
+    Served from the forecast cache when the page has not changed.
     Parameters:
         location (str): The location key to extract weather data for.
     Returns:
         dictionary: A dictionary of weather data. Keys are datetime.datetime objects
                     and values are PointInTime objects.
     """
-    # Create url
+    data = forecastCache.lookup(location)
+    if data is not None:
+        return data
+
+    page = fetchPage(location, forecastCache.conditionalHeaders(location))
+    if page is None:
+        return None
+    try:
+        data, lastUpdated = cacheResponse(location, page.status_code, page.content, page.headers)
+        if data is None:
+            data = parseWeatherData(page.content)
+            storeForecast(location, data, lastUpdated, page.headers)
+        return data
+    except Exception:
+        return None
+
+
+# Async fetch path
+
+async def closeAsyncSession():
+    """ Close the shared async client session, if one is open. """
+    await sessions.closeAsync()
+
+
+async def validateLocationKeyAsync(location, executor=None):
+    """ Validate the location key without blocking the event loop.
+    A malformed key is rejected before any cache or the site is asked. Known
+    keys are answered from the location key cache. Otherwise the page is
+    fetched once, with a few retries for network errors only, and a valid page
+    is parsed into the forecast cache so the next check of the location is free.
+    False is also returned while the circuit is open; check hostBreaker().
+    Parameters:
+        location (str): The location key to validate.
+        executor (concurrent.futures.Executor): The pool to parse on, optional.
+    Returns:
+        bool: True if the location key is valid, False otherwise.
+    """
+    if not helpers.isLocationKey(location):
+        return False
+    known = locationKeyCache.lookup(location)
+    if known is not None:
+        return known
+    loop = asyncio.get_running_loop()
+    # The forecast cache may read a pickle from disk, so it is asked from the default thread pool
+    if await loop.run_in_executor(None, forecastCache.contains, location):
+        locationKeyCache.mark(location, True)
+        return True
+    response = await fetchPageAsync(location, forecastCache.conditionalHeaders(location), validationPolicy)
+    if response is None:
+        # Could not reach the site, so say nothing about the key
+        return False
+    status, content, headers = response
+    if status in NOT_FOUND_STATUSES:
+        locationKeyCache.mark(location, False)
+        return False
+    locationKeyCache.mark(location, True)
+    try:
+        data, lastUpdated = await loop.run_in_executor(None, cacheResponse, location, status, content, headers)
+        if data is None:
+            data = await loop.run_in_executor(executor, parseWeatherData, content)
+            await storeForecastAsync(location, data, lastUpdated, headers)
+    except Exception:
+        pass
+    return True
+
+
+async def storeForecastAsync(location, data, lastUpdated, headers):
+    """ Store a freshly parsed forecast like storeForecast, on the default thread
+    pool so pickling, compressing and writing it does not block the event loop.
+    Parameters:
+        location (str): The location key the page was fetched for.
+        data (dictionary or ForecastFrame): The weather data.
+        lastUpdated (str): The "Last updated" stamp of the page.
+        headers (dict): The response headers.
+    """
+    await asyncio.get_running_loop().run_in_executor(None, storeForecast, location, data, lastUpdated, headers)
+
+
+async def fetchPageAsync(location, headers=None, policy=None):
+    """ Fetch the html of a location page without blocking the event loop.
+    Retries with backoff while the host is reachable; a page that does not
+    exist is not retried.
+    Parameters:
+        location (str): The location key to fetch the page for.
+        headers (dict): Extra request headers such as conditional validators, optional.
+        policy (RetryPolicy): How to retry, retryPolicy if not given.
+    Returns:
+        tuple: The status code (200, 304 or one of NOT_FOUND_STATUSES), the
+               html and the headers of the response, or None if the page
+               could not be fetched or the circuit is open.
+    """
     url = BASE_URL % location
 
-    # Get html from website
-    tries = 0
-    while True:
-        try:
-            page = requests.get(url)
-            soup = BeautifulSoup(page.content, "html.parser")
-            start_date = extractDate(soup)
-            details = soup.find(MAP_LABEL, MAP_DICT)
-            areas = details.find_all(AREA_LABEL)
-            break
-        except:
-            tries += 1
-            if tries == REQUEST_RETRY_COUNT:
-                return None
-            time.sleep(REQUEST_RETRY_DELAY)
+    async def attempt():
+        response = await sessions.getAsync(url, headers)
+        _checkStatus(location, response[0])
+        return response
+    try:
+        return await (policy or retryPolicy).callAsync(attempt, breaker=hostBreaker())
+    except Exception:
+        return None
 
-    data = dict()
-    for area in areas:
-        if TITLE_LABEL in area.attrs and COORDS_LABEL in area.attrs:
-            x_coord = int(area[COORDS_LABEL].split(',')[0])
-            y_coord = int(area[COORDS_LABEL].split(',')[1])
-            if x_coord == X_START_CORD:
-                day = 0
-            currentAttribute = Y_CORD_TO_ATTRIBUTE[int(y_coord)]
-            hour = int(helpers.REGEX_INT.match(area[TITLE_LABEL]).group(0))
-            minute = int(helpers.REGEX_INT.findall(area[TITLE_LABEL])[1])
-            if hour == 0 and minute == 0:
-                day += 1
-            timestamp = start_date + datetime.timedelta(days=day, hours=hour)
-            if timestamp not in data:
-                data[timestamp] = PointInTime(timestamp)
-            value = ':'.join(area[TITLE_LABEL].split(':')[2:]).strip()
-            data[timestamp].add(currentAttribute, helpers.textToValue(currentAttribute, value))
 
-    return data
+async def extractWeatherDataAsync(location, executor=None, parse=parseWeatherData):
+    """ Extract weather data from website html without blocking the event loop.
+    Served from the forecast cache when the page has not changed, otherwise
+    parsing runs on the given executor.
+    Parameters:
+        location (str): The location key to extract weather data for.
+        executor (concurrent.futures.Executor): The pool to parse on, optional.
+        parse (function): A module level function from html to weather data, so it
+                          can be sent to a process pool.
+    Returns:
+        dictionary: A dictionary of weather data. Keys are datetime.datetime objects
+                    and values are PointInTime objects.
+    """
+    loop = asyncio.get_running_loop()
+    # The forecast cache may read or write a pickle, so it is used from the default thread pool
+    data = await loop.run_in_executor(None, forecastCache.lookup, location)
+    if data is not None:
+        return data
+    response = await fetchPageAsync(location, forecastCache.conditionalHeaders(location))
+    if response is None:
+        return None
+    status, content, headers = response
+    try:
+        data, lastUpdated = await loop.run_in_executor(None, cacheResponse, location, status, content, headers)
+        if data is None:
+            data = await loop.run_in_executor(executor, parse, content)
+            await storeForecastAsync(location, data, lastUpdated, headers)
+        return data
+    except Exception:
+        return None
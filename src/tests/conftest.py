@@ -0,0 +1,50 @@
+import functools
+
+import pytest
+from aiohttp import web
+
+import clearDarkSkyWeb
+from clearDarkSkyCache import LocationKeyCache
+from clearDarkSkyHttp import TokenBucket
+from clearDarkSkyRetry import CircuitBreakers, RetryPolicy
+from tests.sampleData import readSamplePage
+
+async def runWithSampleServer(monkeypatch, coroutine, cache, requested=None, breakers=None, archive=None):
+    """ Serve the sample page on localhost while running the coroutine.
+    The locations requested are appended to requested, if given. The location
+    'down' answers 503. Forecasts are only archived to archive, if given. """
+    async def handler(request):
+        if requested is not None:
+            requested.append(request.match_info['location'])
+        if request.match_info['location'] == 'down':
+            return web.Response(status=503)
+        if request.match_info['location'] != 'AlbanyNY':
+            return web.Response(status=404)
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=readSamplePage(), content_type='text/html', headers={'ETag': '"v1"'})
+    app = web.Application()
+    app.router.add_get('/c/{location}key.html', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    monkeypatch.setattr(clearDarkSkyWeb, 'BASE_URL', f'http://127.0.0.1:{port}/c/%skey.html')
+    monkeypatch.setattr(clearDarkSkyWeb, 'retryPolicy', RetryPolicy(attempts=2, baseDelay=0))
+    monkeypatch.setattr(clearDarkSkyWeb, 'validationPolicy', RetryPolicy(attempts=2, baseDelay=0))
+    monkeypatch.setattr(clearDarkSkyWeb, 'breakers', breakers if breakers is not None else CircuitBreakers())
+    monkeypatch.setattr(clearDarkSkyWeb, 'forecastCache', cache)
+    monkeypatch.setattr(clearDarkSkyWeb, 'forecastArchive', archive)
+    monkeypatch.setattr(clearDarkSkyWeb, 'locationKeyCache', LocationKeyCache())
+    monkeypatch.setattr(clearDarkSkyWeb.sessions, 'limiter', TokenBucket(rate=1000, burst=1000))
+    try:
+        return await coroutine
+    finally:
+        await clearDarkSkyWeb.closeAsyncSession()
+        await runner.cleanup()
+
+@pytest.fixture
+def sampleServer(monkeypatch):
+    """ runWithSampleServer, undoing its patches of clearDarkSkyWeb after the test. """
+    return functools.partial(runWithSampleServer, monkeypatch)
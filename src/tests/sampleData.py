@@ -0,0 +1,136 @@
+""" Sample and random forecasts shared by the tests and the benchmarks. """
+
+import datetime
+import math
+import os
+import random
+
+from clearDarkSkyConstants import *
+from clearDarkSkyModel import AlertProfile, PointInTime
+from clearDarkSkyWeb import parseWeatherData
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), 'data', 'AlbanyNY.html')
+
+
+def readSamplePage():
+    """ Read the saved AlbanyNY location page.
+    Returns:
+        bytes: The html of the page.
+    """
+    with open(SAMPLE_PAGE, 'rb') as f:
+        return f.read()
+
+
+def readSampleData():
+    """ Parse the saved AlbanyNY location page.
+    Returns:
+        dictionary: Keys are datetime.datetime objects and values are PointInTime objects.
+    """
+    return parseWeatherData(readSamplePage())
+
+
+def randomWeatherData(hours=80):
+    """ Build a forecast of random values in the ranges the site uses.
+    Parameters:
+        hours (int): The number of hours.
+    Returns:
+        dictionary: Keys are datetime.datetime objects and values are PointInTime objects.
+    """
+    weatherData = dict()
+    startDay = datetime.datetime(2020, 1, 1, 12, 0, 0)
+    for i in range(0, hours):
+        timestamp = startDay + datetime.timedelta(hours=i)
+        pointInTime = PointInTime(timestamp)
+        pointInTime.add(WeatherAttribute.CLOUD_COVER, random.randint(0, 10) * 10)
+        pointInTime.add(WeatherAttribute.TRANSPARENCY, Transparency(random.randint(0, 5)))
+        pointInTime.add(WeatherAttribute.SEEING, random.randint(0, 5) / 5)
+        for j in range(0, random.randint(0, 4)):
+            pointInTime.add(WeatherAttribute.DARKNESS, random.randint(-4, 6))
+        if random.random() < 0.8:
+            pointInTime.add(WeatherAttribute.SMOKE, random.choice([0, 2, 5, 10, 20, 500]))
+        wind = random.randint(0, 45)
+        pointInTime.add(WeatherAttribute.WIND, (wind, wind + 5) if wind < 45 else (45, math.inf))
+        humidity = random.randint(25, 95)
+        pointInTime.add(WeatherAttribute.HUMIDITY, (humidity, humidity + 5))
+        temp = random.randint(-45, 115)
+        pointInTime.add(WeatherAttribute.TEMPERATURE, (temp, temp + 9) if -40 < temp < 113 else (113, math.inf))
+        weatherData[timestamp] = pointInTime
+    return weatherData
+
+
+def randomProfile():
+    """ Build an alert profile that sets a random half of the attributes.
+    Returns:
+        AlertProfile: The alert profile.
+    """
+    profile = AlertProfile('user', 'random')
+    profile.setDuration(random.randint(0, 4))
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.CLOUD_COVER, random.randint(0, 10) * 10)
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.TRANSPARENCY, Transparency(random.randint(0, 5)))
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.SEEING, random.randint(0, 5) / 5)
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.DARKNESS, random.randint(-4, 6) / 1)
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.SMOKE, random.choice([0.0, 5.0, 20.0, 500.0]))
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.WIND, random.choice([5.0, 16.0, 45.0, 100.0]))
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.HUMIDITY, random.randint(5, 20) * 5.0)
+    if random.random() < 0.5:
+        profile.add(WeatherAttribute.TEMPERATURE, (random.randint(-40, 40) * 1.0, random.randint(40, 120) * 1.0))
+    return profile
+
+
+def everyValueForm():
+    """ Build hours holding each form of value textToValue produces, and hours missing values.
+    Returns:
+        dictionary: Keys are datetime.datetime objects and values are PointInTime objects.
+    """
+    start = datetime.datetime(2023, 5, 25, 13, 0)
+    forms = [
+        [(WeatherAttribute.CLOUD_COVER, 0), (WeatherAttribute.TRANSPARENCY, Transparency.TRANSPARENT),
+         (WeatherAttribute.SEEING, 1.0), (WeatherAttribute.SMOKE, 0), (WeatherAttribute.WIND, (0, 5)),
+         (WeatherAttribute.HUMIDITY, (0, 25)), (WeatherAttribute.TEMPERATURE, (-math.inf, -40))],
+        [(WeatherAttribute.CLOUD_COVER, 100), (WeatherAttribute.TRANSPARENCY, Transparency.TOO_CLOUDY_TO_FORECAST),
+         (WeatherAttribute.SEEING, 0.0), (WeatherAttribute.SMOKE, 500), (WeatherAttribute.WIND, (45, math.inf)),
+         (WeatherAttribute.HUMIDITY, (95, 100)), (WeatherAttribute.TEMPERATURE, (113, math.inf))],
+        [(WeatherAttribute.CLOUD_COVER, 40), (WeatherAttribute.TRANSPARENCY, Transparency.BELOW_AVERAGE),
+         (WeatherAttribute.SEEING, 0.6), (WeatherAttribute.SMOKE, 20), (WeatherAttribute.WIND, (12, 16)),
+         (WeatherAttribute.HUMIDITY, (45, 50)), (WeatherAttribute.TEMPERATURE, (-12, -3))],
+        [],
+    ]
+    darkness = [[4.8, 5.2, -0.0, -4.0], [-4], [6.4, 6.4], []]
+    weatherData = dict()
+    for i, (values, magnitudes) in enumerate(zip(forms, darkness)):
+        hour = weatherData[start + datetime.timedelta(hours=i)] = PointInTime(start + datetime.timedelta(hours=i))
+        for attribute, value in values:
+            hour.add(attribute, value)
+        for magnitude in magnitudes:
+            hour.add(WeatherAttribute.DARKNESS, magnitude)
+    for transparency in Transparency:
+        timestamp = start + datetime.timedelta(hours=len(weatherData))
+        weatherData[timestamp] = PointInTime(timestamp)
+        weatherData[timestamp].add(WeatherAttribute.TRANSPARENCY, transparency)
+    return weatherData
+
+
+def sameForecast(first, second):
+    """ Check that two forecasts hold the same hours and values, of the same types.
+    Parameters:
+        first (dictionary or ForecastFrame): A forecast.
+        second (dictionary or ForecastFrame): Another forecast.
+    Returns:
+        bool: True if they are the same.
+    """
+    if list(first.keys()) != list(second.keys()):
+        return False
+    for timestamp in first:
+        if dict(first[timestamp].data) != dict(second[timestamp].data):
+            return False
+        for attribute, value in first[timestamp].data.items():
+            if type(second[timestamp].data[attribute]) != type(value):
+                return False
+    return True
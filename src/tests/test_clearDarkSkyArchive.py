@@ -0,0 +1,207 @@
+import datetime
+import os
+
+import pytest
+
+import clearDarkSkyArchive
+import clearDarkSkyWeb
+from clearDarkSkyArchive import ForecastArchive, RECORD
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyModel import PointInTime
+from clearDarkSkyEnums import WeatherAttribute
+from tests.sampleData import everyValueForm, readSamplePage, sameForecast
+
+START = datetime.datetime(2026, 10, 12, 13, 0)
+DAY = 24 * 60 * 60
+
+def forecastFrom(start, hours, cloudCover=0):
+    """ A forecast of consecutive hours with the same cloud cover. """
+    weatherData = dict()
+    for i in range(hours):
+        timestamp = start + datetime.timedelta(hours=i)
+        weatherData[timestamp] = PointInTime(timestamp)
+        weatherData[timestamp].add(WeatherAttribute.CLOUD_COVER, cloudCover)
+    return ForecastFrame.fromWeatherData(weatherData)
+
+@pytest.fixture
+def archive(tmp_path):
+    archive = ForecastArchive(str(tmp_path / 'archive'))
+    yield archive
+    archive.close()
+
+class TestAppend:
+    def test_nothing_on_disk_before_append(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'))
+        assert archive.compact() == {'expired': 0, 'deleted': 0, 'rewritten': 0, 'freed': 0}
+        assert not os.path.exists(tmp_path / 'archive')
+
+    def test_round_trip(self, archive):
+        weatherData = everyValueForm()
+        assert archive.append('AlbanyNY', weatherData, '2023-05-25 13:12:13', fetched=1000.0)
+        [(fetched, frame)] = archive.covering('AlbanyNY', next(iter(weatherData)))
+        assert fetched == datetime.datetime.fromtimestamp(1000.0)
+        assert sameForecast(weatherData, frame)
+
+    def test_parsed_page(self, archive):
+        content = readSamplePage()
+        forecast = clearDarkSkyWeb.parseForecast(content)
+        archive.append('AlbanyNY', forecast, clearDarkSkyWeb.extractLastUpdated(content))
+        [(_, frame)] = archive.covering('AlbanyNY', forecast.timestamps[-1])
+        assert sameForecast(forecast, frame)
+
+    def test_unchanged_forecast_is_skipped(self, archive):
+        assert archive.append('AlbanyNY', forecastFrom(START, 3), '2026-10-12 13:00:00', fetched=1000.0)
+        assert not archive.append('AlbanyNY', forecastFrom(START, 3), '2026-10-12 13:00:00', fetched=2000.0)
+        assert archive.append('AlbanyNY', forecastFrom(START, 3), '2026-10-12 14:00:00', fetched=3000.0)
+        assert archive.stats == {'appended': 2, 'unchanged': 1}
+
+    def test_empty_forecast_is_skipped(self, archive):
+        assert not archive.append('AlbanyNY', dict())
+        assert archive.locations() == []
+
+    def test_invalid_key(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'))
+        for location in ['../AlbanyNY', 'Albany/NY', '', None]:
+            with pytest.raises(ValueError):
+                archive.append(location, forecastFrom(START, 3))
+        assert not os.path.exists(tmp_path / 'archive')
+
+    def test_segments_roll_over(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'), segmentSize=1)
+        for i in range(3):
+            archive.append('AlbanyNY', forecastFrom(START, 3, i), fetched=1000.0 + i)
+        assert sorted(os.listdir(tmp_path / 'archive' / 'AlbanyNY')) == ['00000000.seg', '00000001.seg', '00000002.seg']
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [0, 1, 2]
+        archive.close()
+
+class TestQueries:
+    def test_covering(self, archive):
+        archive.append('AlbanyNY', forecastFrom(START, 10, 10), fetched=1000.0)
+        archive.append('AlbanyNY', forecastFrom(START + datetime.timedelta(hours=5), 10, 20), fetched=2000.0)
+        archive.append('AlbanyNY', forecastFrom(START + datetime.timedelta(hours=12), 10, 30), fetched=3000.0)
+        archive.append('OttawaON', forecastFrom(START, 10, 40), fetched=1000.0)
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [10]
+        hour = START + datetime.timedelta(hours=9)
+        assert [frame[hour].cloudCover for _, frame in archive.covering('AlbanyNY', hour)] == [10, 20]
+        assert archive.covering('AlbanyNY', START + datetime.timedelta(days=2)) == []
+        assert archive.covering('foo', START) == []
+
+    def test_hour_history(self, archive):
+        archive.append('AlbanyNY', forecastFrom(START, 10, 10), fetched=1000.0)
+        archive.append('AlbanyNY', forecastFrom(START, 10, 20), fetched=2000.0)
+        history = archive.hourHistory('AlbanyNY', START + datetime.timedelta(hours=2))
+        assert [(fetched.timestamp(), hour.cloudCover) for fetched, hour in history] == [(1000.0, 10), (2000.0, 20)]
+        # Not an hour of the forecast, although within its range
+        assert archive.hourHistory('AlbanyNY', START + datetime.timedelta(minutes=30)) == []
+
+    def test_fetched_between(self, archive):
+        for i in range(4):
+            archive.append('AlbanyNY', forecastFrom(START, 3, i), fetched=1000.0 * (i + 1))
+        found = archive.fetchedBetween('AlbanyNY', datetime.datetime.fromtimestamp(2000.0),
+                                       datetime.datetime.fromtimestamp(4000.0))
+        assert [frame[START].cloudCover for _, frame in found] == [1, 2]
+
+    def test_locations(self, archive):
+        archive.append('OttawaON', forecastFrom(START, 3), fetched=1000.0)
+        archive.append('AlbanyNY', forecastFrom(START, 3), fetched=1000.0)
+        assert archive.locations() == ['AlbanyNY', 'OttawaON']
+
+    def test_damaged_record(self, archive):
+        archive.append('AlbanyNY', forecastFrom(START, 3), fetched=1000.0)
+        filename = os.path.join(archive.directory, 'AlbanyNY', '00000000.seg')
+        with open(filename, 'r+b') as f:
+            f.seek(RECORD.size + 4)
+            byte = f.read(1)
+            f.seek(RECORD.size + 4)
+            f.write(bytes([byte[0] ^ 0xff]))
+        with pytest.raises(ValueError):
+            archive.covering('AlbanyNY', START)
+
+class TestCompact:
+    def test_expired_segment_is_deleted(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY, segmentSize=1)
+        archive.append('AlbanyNY', forecastFrom(START, 3, 1), fetched=1000.0)
+        archive.append('AlbanyNY', forecastFrom(START, 3, 2), fetched=1000.0 + DAY)
+        archive.append('OttawaON', forecastFrom(START, 3, 3), fetched=1000.0)
+        result = archive.compact(now=1500.0 + DAY)
+        assert result['expired'] == 2
+        assert result['deleted'] == 2
+        assert result['rewritten'] == 0
+        assert os.listdir(tmp_path / 'archive' / 'AlbanyNY') == ['00000001.seg']
+        assert not os.path.exists(tmp_path / 'archive' / 'OttawaON')
+        assert archive.locations() == ['AlbanyNY']
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [2]
+        archive.close()
+
+    def test_mostly_expired_segment_is_rewritten(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY)
+        for i in range(4):
+            archive.append('AlbanyNY', forecastFrom(START, 24, i), fetched=1000.0 + i * DAY)
+        folder = tmp_path / 'archive' / 'AlbanyNY'
+        size = os.path.getsize(folder / '00000000.seg')
+        result = archive.compact(now=1500.0 + 3 * DAY)
+        assert result['expired'] == 3
+        assert result['rewritten'] == 1
+        # The kept forecasts move to a new segment and the old one is deleted
+        assert os.listdir(folder) == ['00000001.seg']
+        assert os.path.getsize(folder / '00000001.seg') == size - result['freed']
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3]
+        # Appends continue after the rewritten records
+        archive.append('AlbanyNY', forecastFrom(START, 24, 4), fetched=1000.0 + 4 * DAY)
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3, 4]
+        archive.close()
+
+    def test_crash_before_index_moves(self, tmp_path, monkeypatch):
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY)
+        for i in range(4):
+            archive.append('AlbanyNY', forecastFrom(START, 24, i), fetched=1000.0 + i * DAY)
+        def crash(fd):
+            raise OSError('Crashed')
+        # The new segment is written but the index still points at the old one
+        monkeypatch.setattr(clearDarkSkyArchive.os, 'fsync', crash)
+        with pytest.raises(OSError):
+            archive.compact(now=1500.0 + 3 * DAY)
+        monkeypatch.undo()
+        archive.close()
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY)
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3]
+        archive.compact(now=1500.0 + 3 * DAY)
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3]
+        assert len(os.listdir(tmp_path / 'archive' / 'AlbanyNY')) == 1
+        archive.close()
+
+    def test_crash_after_index_moves(self, tmp_path, monkeypatch):
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY)
+        for i in range(4):
+            archive.append('AlbanyNY', forecastFrom(START, 24, i), fetched=1000.0 + i * DAY)
+        def crash(filename):
+            raise OSError('Crashed')
+        # The index points at the new segment but the old one is left behind
+        monkeypatch.setattr(clearDarkSkyArchive.os, 'remove', crash)
+        with pytest.raises(OSError):
+            archive.compact(now=1500.0 + 3 * DAY)
+        monkeypatch.undo()
+        archive.close()
+        archive = ForecastArchive(str(tmp_path / 'archive'), retention=DAY)
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3]
+        assert archive.compact(now=1500.0 + 3 * DAY)['deleted'] == 1
+        assert os.listdir(tmp_path / 'archive' / 'AlbanyNY') == ['00000001.seg']
+        assert [frame[START].cloudCover for _, frame in archive.covering('AlbanyNY', START)] == [3]
+        archive.close()
+
+    def test_mostly_kept_segment_is_left(self, archive):
+        for i in range(4):
+            archive.append('AlbanyNY', forecastFrom(START, 24, i), fetched=1000.0 + i)
+        archive.retention = 2.5
+        result = archive.compact(now=1003.0)
+        assert result == {'expired': 1, 'deleted': 0, 'rewritten': 0, 'freed': 0}
+        assert len(archive.covering('AlbanyNY', START)) == 3
+
+    def test_reopened_archive(self, tmp_path):
+        archive = ForecastArchive(str(tmp_path / 'archive'))
+        archive.append('AlbanyNY', forecastFrom(START, 3), '2026-10-12 13:00:00', fetched=1000.0)
+        archive.close()
+        archive = ForecastArchive(str(tmp_path / 'archive'))
+        assert not archive.append('AlbanyNY', forecastFrom(START, 3), '2026-10-12 13:00:00', fetched=2000.0)
+        assert len(archive.covering('AlbanyNY', START)) == 1
+        archive.close()
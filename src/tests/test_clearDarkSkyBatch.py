@@ -0,0 +1,41 @@
+import datetime
+import random
+
+from clearDarkSkyBatch import ProfileBatch
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyModel import AlertProfile, PointInTime
+from clearDarkSkyEnums import WeatherAttribute
+from tests.sampleData import randomProfile, randomWeatherData, readSampleData
+
+class TestProfileBatch:
+    def test_ProfileBatch_SameAsCheckForAlert(self):
+        random.seed(3)
+        for _ in range(10):
+            frame = ForecastFrame.fromWeatherData(randomWeatherData(random.randint(1, 120)))
+            profiles = [randomProfile() for _ in range(100)]
+            assert ProfileBatch(profiles).checkForAlerts(frame) == [p.checkForAlert(frame) for p in profiles]
+
+    def test_ProfileBatch_SameAsCheckForAlert_Sample(self):
+        random.seed(4)
+        weatherData = readSampleData()
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        profiles = [randomProfile() for _ in range(500)]
+        assert ProfileBatch(profiles).checkForAlerts(frame) == [p.checkForAlert(weatherData) for p in profiles]
+
+    def test_ProfileBatch_MatchMatrix(self):
+        start = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        weatherData = dict()
+        for i, cloudCover in enumerate([0, 50, 100]):
+            pointInTime = PointInTime(start + datetime.timedelta(hours=i))
+            pointInTime.add(WeatherAttribute.CLOUD_COVER, cloudCover)
+            weatherData[pointInTime.timestamp] = pointInTime
+        clear = AlertProfile('user', 'clear')
+        clear.add(WeatherAttribute.CLOUD_COVER, 50)
+        anything = AlertProfile('user', 'anything')
+        matrix = ProfileBatch([clear, anything]).matchMatrix(ForecastFrame.fromWeatherData(weatherData))
+        assert matrix.tolist() == [[True, True, False], [True, True, True]]
+
+    def test_ProfileBatch_Empty(self):
+        frame = ForecastFrame.fromWeatherData(randomWeatherData(5))
+        assert ProfileBatch([]).checkForAlerts(frame) == []
+        assert ProfileBatch([AlertProfile('user', 'any')]).checkForAlerts(ForecastFrame.fromWeatherData({})) == [[]]
@@ -0,0 +1,131 @@
+import datetime
+import os
+
+import pytest
+
+from clearDarkSkyCache import ForecastCache, LocationKeyCache, TtlLruCache
+from clearDarkSkyModel import PointInTime
+from clearDarkSkyEnums import WeatherAttribute, Transparency
+
+def sampleData():
+    timestamp = datetime.datetime(2023, 5, 25, 13, 0)
+    pointInTime = PointInTime(timestamp)
+    pointInTime.add(WeatherAttribute.CLOUD_COVER, 10)
+    pointInTime.add(WeatherAttribute.TRANSPARENCY, Transparency.POOR)
+    pointInTime.add(WeatherAttribute.DARKNESS, 4.8)
+    return {timestamp: pointInTime}
+
+class TestForecastCache:
+    def test_ForecastCache_Miss(self, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        assert cache.lookup('AlbanyNY') is None
+        assert cache.conditionalHeaders('AlbanyNY') == {}
+        assert cache.hitRate() == 0.0
+
+    def test_ForecastCache_StoreAndLookup(self, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        data = sampleData()
+        cache.store('AlbanyNY', data, '2023-05-25 13:12:13')
+        assert cache.lookup('AlbanyNY') is data
+        assert cache.stats['misses'] == 1
+        assert cache.stats['hits'] == 1
+        assert cache.hitRate() == 0.5
+
+    def test_ForecastCache_Expired(self, tmp_path):
+        cache = ForecastCache(str(tmp_path), ttl=-1)
+        cache.store('AlbanyNY', sampleData(), '2023-05-25 13:12:13')
+        assert cache.lookup('AlbanyNY') is None
+
+    def test_ForecastCache_SurvivesRestart(self, tmp_path):
+        ForecastCache(str(tmp_path)).store('AlbanyNY', sampleData(), '2023-05-25 13:12:13')
+        data = ForecastCache(str(tmp_path)).lookup('AlbanyNY')
+        hour = data[datetime.datetime(2023, 5, 25, 13, 0)]
+        assert hour.data[WeatherAttribute.TRANSPARENCY] == Transparency.POOR
+        assert hour.data[WeatherAttribute.DARKNESS] == [4.8]
+
+    def test_ForecastCache_ConditionalHeaders(self, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        cache.store('AlbanyNY', sampleData(), '2023-05-25 13:12:13',
+                    {'ETag': '"v1"', 'Last-Modified': 'Thu, 25 May 2023 13:12:13 GMT'})
+        assert cache.conditionalHeaders('AlbanyNY') == {'If-None-Match': '"v1"',
+                                                        'If-Modified-Since': 'Thu, 25 May 2023 13:12:13 GMT'}
+
+    def test_ForecastCache_Revalidate(self, tmp_path):
+        cache = ForecastCache(str(tmp_path), ttl=-1)
+        data = sampleData()
+        cache.store('AlbanyNY', data, '2023-05-25 13:12:13')
+        assert cache.revalidate('AlbanyNY') is data
+        assert cache.revalidate('BttlRvr0AB') is None
+        assert cache.stats['revalidated'] == 1
+
+    def test_ForecastCache_Reuse(self, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        data = sampleData()
+        cache.store('AlbanyNY', data, '2023-05-25 13:12:13')
+        assert cache.reuse('AlbanyNY', '2023-05-25 13:12:13') is data
+        assert cache.reuse('AlbanyNY', '2023-05-25 19:12:13') is None
+        assert cache.reuse('AlbanyNY', None) is None
+        assert cache.stats['unchanged'] == 1
+
+    def test_ForecastCache_Invalidate(self, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        cache.store('AlbanyNY', sampleData(), '2023-05-25 13:12:13')
+        cache.invalidate('AlbanyNY')
+        assert cache.lookup('AlbanyNY') is None
+        assert ForecastCache(str(tmp_path)).lookup('AlbanyNY') is None
+
+    def test_ForecastCache_InvalidKey(self, tmp_path):
+        cache = ForecastCache(str(tmp_path / 'cache'))
+        for location in ['../AlbanyNY', 'Albany/NY', '', 'AlbanyNY\n', None]:
+            with pytest.raises(ValueError):
+                cache.store(location, sampleData(), '2023-05-25 13:12:13')
+            with pytest.raises(ValueError):
+                cache.lookup(location)
+        assert not os.path.exists(tmp_path / 'cache')
+
+class TestLocationKeyCache:
+    def test_LocationKeyCache_Unknown(self):
+        assert LocationKeyCache().lookup('AlbanyNY') is None
+
+    def test_LocationKeyCache_Mark(self):
+        cache = LocationKeyCache()
+        cache.mark('AlbanyNY', True)
+        cache.mark('foo', False)
+        assert cache.lookup('AlbanyNY') is True
+        assert cache.lookup('foo') is False
+        assert cache.stats == {'hits': 2, 'misses': 0}
+
+    def test_LocationKeyCache_Expired(self):
+        cache = LocationKeyCache(invalidTtl=-1)
+        cache.mark('foo', False)
+        assert cache.lookup('foo') is None
+
+    def test_LocationKeyCache_Seed(self):
+        cache = LocationKeyCache(maxSize=2)
+        cache.seed(['AlbanyNY', 'BttlRvr0AB', 'NrthCpPE'])
+        assert cache.lookup('AlbanyNY') is None
+        assert cache.lookup('NrthCpPE') is True
+
+class TestTtlLruCache:
+    def test_TtlLruCache_PutAndGet(self):
+        cache = TtlLruCache(2, 60)
+        cache.put(1, 'user1')
+        assert cache.get(1) == 'user1'
+        assert cache.get(2) is None
+        assert cache.stats == {'hits': 1, 'misses': 1}
+
+    def test_TtlLruCache_EvictsLeastRecentlyUsed(self):
+        cache = TtlLruCache(2, 60)
+        cache.put(1, 'user1')
+        cache.put(2, 'user2')
+        cache.get(1)
+        cache.put(3, 'user3')
+        assert cache.get(2) is None
+        assert cache.get(1) == 'user1'
+        assert len(cache) == 2
+
+    def test_TtlLruCache_Expired(self):
+        cache = TtlLruCache(2, -1)
+        cache.put(1, 'user1')
+        assert cache.get(1) is None
+        assert len(cache) == 0
@@ -0,0 +1,96 @@
+import asyncio
+
+from clearDarkSkyCycle import AlertCycle
+from clearDarkSkyModel import AlertProfile
+from clearDarkSkyWeb import parseWeatherData
+from clearDarkSkyEnums import WeatherAttribute
+from clearDarkSkyRetry import CircuitBreaker
+from tests.sampleData import readSamplePage
+
+class FakeCycle(AlertCycle):
+    def __init__(self, send, pages, **kwargs):
+        super().__init__(send, **kwargs)
+        self.pages = pages
+        self.fetched = []
+        self.circuit = CircuitBreaker('test', failureThreshold=1, resetTimeout=60)
+
+    def breaker(self):
+        return self.circuit
+
+    async def loadWeatherData(self, location):
+        self.fetched.append(location)
+        page = self.pages[location]
+        if isinstance(page, Exception):
+            raise page
+        if page is None:
+            return None
+        return parseWeatherData(page)
+
+def runCycle(profiles, pages, failSends=False, hostDown=False, **kwargs):
+    sent = []
+    async def send(username, message):
+        if failSends:
+            raise RuntimeError('send failed')
+        sent.append((username, message))
+    cycle = FakeCycle(send, pages, **kwargs)
+    if hostDown:
+        cycle.circuit.failure()
+    stats = asyncio.run(cycle.run(profiles))
+    return cycle, stats, sent
+
+class TestAlertCycle:
+    def test_AlertCycle_SendsMatches(self):
+        profiles = [AlertProfile('user1', 'any', 'AlbanyNY'), AlertProfile('user2', 'any', 'AlbanyNY')]
+        cycle, stats, sent = runCycle(profiles, {'AlbanyNY': readSamplePage()})
+        assert cycle.fetched == ['AlbanyNY']
+        assert stats['fetchesAvoided'] == 1
+        assert stats['alertsSent'] == 2
+        assert sorted(username for username, _ in sent) == ['user1', 'user2']
+        assert sent[0][1].startswith('For AlbanyNY...\nConditions met from May 25, 13:00')
+
+    def test_AlertCycle_OneDigestPerUser(self):
+        profiles = [AlertProfile('user1', 'near', 'AlbanyNY'), AlertProfile('user1', 'far', 'BttlRvr0AB')]
+        _, stats, sent = runCycle(profiles, {'AlbanyNY': readSamplePage(), 'BttlRvr0AB': readSamplePage()})
+        assert stats['matches'] == 2
+        assert stats['alertsSent'] == 1
+        assert len(sent) == 1
+        assert 'near: For AlbanyNY...' in sent[0][1]
+        assert 'far: For BttlRvr0AB...' in sent[0][1]
+
+    def test_AlertCycle_NoMatches(self):
+        profile = AlertProfile('user1', 'never', 'AlbanyNY')
+        profile.setDuration(1)
+        profile.add(WeatherAttribute.TEMPERATURE, (200, 300))
+        _, stats, sent = runCycle([profile], {'AlbanyNY': readSamplePage()})
+        assert stats['alertsSent'] == 0
+        assert sent == []
+
+    def test_AlertCycle_FailedLocationDoesNotStall(self):
+        profiles = [AlertProfile('user1', 'any', 'Broken'), AlertProfile('user2', 'any', 'Missing'),
+                    AlertProfile('user3', 'any', 'Garbage'), AlertProfile('user4', 'any', 'AlbanyNY')]
+        pages = {'Broken': ConnectionError('down'), 'Missing': None,
+                 'Garbage': b'<html></html>', 'AlbanyNY': readSamplePage()}
+        _, stats, sent = runCycle(profiles, pages, maxInFlight=1)
+        assert stats['failedLocations'] == 3
+        assert [username for username, _ in sent] == ['user4']
+
+    def test_AlertCycle_FailedSend(self):
+        profiles = [AlertProfile('user1', 'any', 'AlbanyNY')]
+        _, stats, _ = runCycle(profiles, {'AlbanyNY': readSamplePage()}, failSends=True)
+        assert stats['alertsSent'] == 0
+        assert stats['failedSends'] == 1
+
+    def test_AlertCycle_Empty(self):
+        _, stats, sent = runCycle([], {})
+        assert stats['locations'] == 0
+        assert sent == []
+
+    def test_AlertCycle_SkipsWhileCircuitOpen(self):
+        profiles = [AlertProfile('user1', 'any', 'AlbanyNY'), AlertProfile('user2', 'any', 'BttlRvr0AB')]
+        cycle, stats, sent = runCycle(profiles, {}, hostDown=True)
+        assert cycle.fetched == []
+        assert stats['skippedLocations'] == 2
+        assert stats['failedLocations'] == 0
+        assert stats['retryAfter'] > 0
+        assert cycle.skipped == profiles
+        assert sent == []
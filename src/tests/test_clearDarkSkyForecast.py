@@ -0,0 +1,84 @@
+import datetime
+import random
+
+import pytest
+
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyModel import AlertProfile, PointInTime
+from clearDarkSkyEnums import WeatherAttribute, Transparency
+from tests.sampleData import randomProfile, randomWeatherData, readSampleData
+
+class TestForecastFrame:
+    def test_ForecastFrame_RoundTrip_Sample(self):
+        weatherData = readSampleData()
+        roundTrip = ForecastFrame.fromWeatherData(weatherData).toWeatherData()
+        assert list(roundTrip.keys()) == list(weatherData.keys())
+        for timestamp in weatherData:
+            assert repr(roundTrip[timestamp]) == repr(weatherData[timestamp])
+
+    def test_ForecastFrame_RoundTrip_Random(self):
+        weatherData = randomWeatherData()
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        for timestamp in weatherData:
+            assert frame[timestamp].data == weatherData[timestamp].data
+
+    def test_ForecastFrame_Mapping(self):
+        weatherData = randomWeatherData(10)
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        assert len(frame) == 10
+        assert list(frame) == list(weatherData.keys())
+        assert list(frame.keys()) == list(weatherData.keys())
+        assert str(frame) == 'Forecast of 10 hours from 2020-01-01 12:00:00 to 2020-01-01 21:00:00'
+
+    def test_ForecastFrame_Missing(self):
+        timestamp = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        pointInTime = PointInTime(timestamp)
+        pointInTime.add(WeatherAttribute.SEEING, 0.6)
+        frame = ForecastFrame.fromWeatherData({timestamp: pointInTime})
+        assert frame[timestamp].data == {WeatherAttribute.SEEING: 0.6}
+
+    def test_ForecastFrame_TooMuchDarkness(self):
+        timestamp = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        pointInTime = PointInTime(timestamp)
+        for i in range(5):
+            pointInTime.add(WeatherAttribute.DARKNESS, 1.0)
+        with pytest.raises(ValueError):
+            ForecastFrame.fromWeatherData({timestamp: pointInTime})
+
+    def test_ForecastFrame_CheckForAlert_SameAsDict(self):
+        random.seed(1)
+        for _ in range(20):
+            weatherData = randomWeatherData()
+            frame = ForecastFrame.fromWeatherData(weatherData)
+            for _ in range(25):
+                profile = randomProfile()
+                assert profile.checkForAlert(frame) == profile.checkForAlert(weatherData)
+
+    def test_ForecastFrame_CheckForAlert_Sample(self):
+        random.seed(2)
+        weatherData = readSampleData()
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        for _ in range(200):
+            profile = randomProfile()
+            assert profile.checkForAlert(frame) == profile.checkForAlert(weatherData)
+
+    def test_ForecastFrame_CheckForAlert_IntTransparency(self):
+        weatherData = readSampleData()
+        frame = ForecastFrame.fromWeatherData(weatherData)
+        for transparency in Transparency:
+            profile = AlertProfile('user', 'name of profile')
+            profile.setDuration(1)
+            profile.add(WeatherAttribute.TRANSPARENCY, transparency)
+            expected = profile.checkForAlert(weatherData)
+            # A threshold set directly or loaded from an older profile may be the plain value
+            profile.add(WeatherAttribute.TRANSPARENCY, transparency.value)
+            assert profile.checkForAlert(frame) == expected
+            assert profile.checkForAlert(weatherData) == expected
+
+    def test_ForecastFrame_CheckForAlert_NoAttributes(self):
+        weatherData = randomWeatherData()
+        profile = AlertProfile('user', 'name of profile')
+        profile.setDuration(1)
+        start = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        assert profile.checkForAlert(ForecastFrame.fromWeatherData(weatherData)) == \
+            [(start, start + datetime.timedelta(hours=79))]
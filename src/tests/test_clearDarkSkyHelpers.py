@@ -3,7 +3,8 @@ import math
 
 from clearDarkSkyEnums import WeatherAttribute, Transparency
 from clearDarkSkyHelpers import getDateFromText, textToValue, \
-    temperatureToTextRange, valueToText
+    temperatureToTextRange, valueToText, alertWindowsToText, alertDigestToText, \
+    parseValue, payloadOf, ValueDecoder, DECODE_TABLE
 
 class TestGetDateFromText:
     def test_getDateFromText_Simple(self):
@@ -98,6 +99,69 @@ class TestTextToValue:
     def test_textToValue_Temperature_Invalid(self):
         assert textToValue(WeatherAttribute.TEMPERATURE, 'foo') == (113, math.inf)
 
+class TestValueDecoder:
+    def test_ValueDecoder_TableMatchesParse(self):
+        for (attribute, text), value in DECODE_TABLE.items():
+            assert value == parseValue(attribute, text)
+
+    def test_ValueDecoder_TableHit(self):
+        decoder = ValueDecoder()
+        assert decoder.decode(WeatherAttribute.WIND, '29 to 45 mph (00Z+13hr)') == (29, 45)
+        assert decoder.stats['tableHits'] == 1
+        assert len(decoder) == 0
+
+    def test_ValueDecoder_CachesUnknown(self):
+        decoder = ValueDecoder(table={})
+        assert decoder.decode(WeatherAttribute.SMOKE, '7ug/m^3 (00Z+13hr)') == 7
+        assert decoder.decode(WeatherAttribute.SMOKE, '7ug/m^3 (00Z+14hr)') == 7
+        assert decoder.stats == {'tableHits': 0, 'hits': 1, 'misses': 1, 'evictions': 0}
+        assert decoder.hitRate() == 0.5
+
+    def test_ValueDecoder_Evicts(self):
+        decoder = ValueDecoder(maxSize=1, table={})
+        decoder.decode(WeatherAttribute.SMOKE, '7ug/m^3')
+        decoder.decode(WeatherAttribute.SMOKE, '8ug/m^3')
+        decoder.decode(WeatherAttribute.SMOKE, '7ug/m^3')
+        assert decoder.stats['evictions'] == 2
+        assert decoder.stats['misses'] == 3
+        assert len(decoder) == 1
+
+    def test_ValueDecoder_Darkness(self):
+        text = 'Limiting Mag:-2.6, SunAlt: -41.8&deg;, MoonAlt -11.1&deg;, MoonIllum 1%'
+        assert payloadOf(WeatherAttribute.DARKNESS, text) == 'Limiting Mag:-2.6'
+        assert ValueDecoder().decode(WeatherAttribute.DARKNESS, text) == parseValue(WeatherAttribute.DARKNESS, text)
+
+class TestAlertWindowsToText:
+    def test_alertWindowsToText_None(self):
+        assert alertWindowsToText('AlbanyNY', []) == 'For AlbanyNY...\nNo alerts!'
+
+    def test_alertWindowsToText_SameDay(self):
+        start = datetime.datetime(2023, 5, 25, 13, 0)
+        windows = [(start, start + datetime.timedelta(hours=3))]
+        assert alertWindowsToText('AlbanyNY', windows) == 'For AlbanyNY...\nConditions met from May 25, 13:00 to 16:00'
+
+    def test_alertWindowsToText_Two(self):
+        start = datetime.datetime(2023, 5, 25, 13, 0)
+        windows = [(start, start + datetime.timedelta(hours=3)),
+                   (start + datetime.timedelta(hours=5), start + datetime.timedelta(hours=12))]
+        assert alertWindowsToText('AlbanyNY', windows) == \
+            'For AlbanyNY...\nConditions met from May 25, 13:00 to 16:00 and May 25, 18:00 to May 26, 01:00'
+
+class TestAlertDigestToText:
+    def test_alertDigestToText_Single(self):
+        assert alertDigestToText([('profile 1', 'AlbanyNY', [])]) == ['For AlbanyNY...\nNo alerts!']
+
+    def test_alertDigestToText_Multiple(self):
+        alerts = [('profile 1', 'AlbanyNY', []), ('profile 2', 'BttlRvr0AB', [])]
+        assert alertDigestToText(alerts) == \
+            ['profile 1: For AlbanyNY...\nNo alerts!\n\nprofile 2: For BttlRvr0AB...\nNo alerts!']
+
+    def test_alertDigestToText_Split(self):
+        alerts = [('profile %d' % i, 'AlbanyNY', []) for i in range(3)]
+        messages = alertDigestToText(alerts, limit=70)
+        assert messages == ['profile %d: For AlbanyNY...\nNo alerts!' % i for i in range(3)]
+        assert all(len(message) <= 70 for message in alertDigestToText(alerts, limit=10))
+
 class TestTemperatureToTextRange:
     def test_temperatureToTextRange_Min(self):
         assert temperatureToTextRange(-41) == '< -40F'
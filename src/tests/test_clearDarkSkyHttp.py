@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from clearDarkSkyHttp import SessionManager, TokenBucket
+
+class CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.clientPorts.add(self.client_address[1])
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def startServer():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CountingHandler)
+    server.clientPorts = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/'
+
+class TestSessionManager:
+    def test_SessionManager_SameSession(self):
+        manager = SessionManager()
+        assert manager.getSession() is manager.getSession()
+        manager.close()
+
+    def test_SessionManager_PoolSize(self):
+        manager = SessionManager(poolSize=3)
+        adapter = manager.getSession().get_adapter('https://www.cleardarksky.com/')
+        assert adapter._pool_maxsize == 3
+        manager.close()
+
+    def test_SessionManager_KeepAlive(self):
+        server, url = startServer()
+        manager = SessionManager()
+        for _ in range(5):
+            assert manager.get(url).status_code == 200
+        manager.close()
+        server.shutdown()
+        assert len(server.clientPorts) == 1
+
+    def test_SessionManager_KeepAlive_Async(self):
+        server, url = startServer()
+        manager = SessionManager()
+        async def run():
+            results = [(await manager.getAsync(url))[:2] for _ in range(5)]
+            await manager.closeAsync()
+            return results
+        assert asyncio.run(run()) == [(200, b'ok')] * 5
+        server.shutdown()
+        assert len(server.clientPorts) == 1
+
+    def test_SessionManager_NewLoopClosesOldSession(self):
+        server, url = startServer()
+        manager = SessionManager()
+        async def get():
+            await manager.getAsync(url)
+            return manager.getAsyncSession()
+        first = asyncio.run(get())
+        assert not first.closed
+        async def getAgain():
+            second = await get()
+            await asyncio.sleep(0)
+            await manager.closeAsync()
+            return second
+        assert asyncio.run(getAgain()) is not first
+        assert first.closed
+        server.shutdown()
+
+    def test_SessionManager_OtherThreadLoopClosesOldSession(self):
+        manager = SessionManager()
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        async def get():
+            return manager.getAsyncSession()
+        first = asyncio.run_coroutine_threadsafe(get(), loop).result()
+        async def getHere():
+            second = await get()
+            await manager.closeAsync()
+            return second
+        assert asyncio.run(getHere()) is not first
+        # Closed on the loop it belongs to
+        asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result()
+        assert first.closed
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+class TestTokenBucket:
+    def test_TokenBucket_Burst(self):
+        bucket = TokenBucket(rate=10, burst=3)
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+        waits = [bucket.reserve() for _ in range(2)]
+        assert 0.09 < waits[0] <= 0.1
+        assert 0.19 < waits[1] <= 0.2
+        assert bucket.stats['requests'] == 5
+        assert bucket.stats['waited'] == 2
+        assert bucket.stats['maxWait'] == waits[1]
+
+    def test_TokenBucket_Refills(self):
+        bucket = TokenBucket(rate=100, burst=1)
+        bucket.reserve()
+        time.sleep(0.02)
+        assert bucket.reserve() == 0.0
+
+    def test_TokenBucket_AsyncRate(self):
+        bucket = TokenBucket(rate=50, burst=1)
+        async def acquireAll():
+            started = time.monotonic()
+            await asyncio.gather(*[bucket.acquireAsync() for _ in range(6)])
+            return time.monotonic() - started
+        assert asyncio.run(acquireAll()) >= 0.09
+        assert 0.0 < bucket.averageWait() < 0.1
+
+    def test_SessionManager_Limited(self):
+        server, url = startServer()
+        manager = SessionManager(limiter=TokenBucket(rate=5, burst=1))
+        manager.get(url)
+        manager.get(url)
+        manager.close()
+        server.shutdown()
+        assert manager.limiter.stats['requests'] == 2
+        assert manager.limiter.stats['waited'] == 1
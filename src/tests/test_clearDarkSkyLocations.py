@@ -0,0 +1,34 @@
+from clearDarkSkyLocations import LocationIndex
+
+class TestLocationIndex:
+    def test_LocationIndex_Suggest(self):
+        index = LocationIndex(['AlbanyNY', 'BttlRvr0AB', 'AlbnyAirNY', 'NrthCpPE'])
+        assert index.suggest('Alb') == ['AlbanyNY', 'AlbnyAirNY']
+        assert index.suggest('albn') == ['AlbnyAirNY']
+        assert index.suggest('x') == []
+
+    def test_LocationIndex_Empty(self):
+        assert LocationIndex().suggest('Alb') == []
+        assert LocationIndex(['AlbanyNY']).suggest('') == ['AlbanyNY']
+
+    def test_LocationIndex_Limit(self):
+        index = LocationIndex([f'Site{i:03}' for i in range(100)], maxSuggestions=25)
+        assert len(index.suggest('site')) == 25
+        assert index.suggest('Site09') == [f'Site{i:03}' for i in range(90, 100)]
+
+    def test_LocationIndex_Add(self):
+        index = LocationIndex(['BttlRvr0AB'])
+        index.add('AlbanyNY')
+        index.add('albanyny')
+        index.add(' ')
+        assert len(index) == 2
+        assert 'ALBANYNY' in index
+        assert index.suggest('a') == ['AlbanyNY']
+
+    def test_LocationIndex_Load(self, tmp_path):
+        catalog = tmp_path / 'catalog.txt'
+        catalog.write_text('# cleardarksky keys\nAlbanyNY\nBttlRvr0AB\n\n')
+        index = LocationIndex()
+        assert index.load(str(catalog)) == 3
+        assert len(index) == 2
+        assert index.load(str(tmp_path / 'missing.txt')) == 0
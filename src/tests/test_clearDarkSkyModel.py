@@ -1,7 +1,10 @@
 import datetime
+import pickle
 import random
 import os
 
+import pytest
+
 from clearDarkSkyModel import AlertProfile, PointInTime
 from clearDarkSkyEnums import WeatherAttribute, Transparency
 
@@ -37,6 +40,43 @@ class TestPointInTime:
         pointInTime.add(WeatherAttribute.DARKNESS, -4.8)
         assert pointInTime.data[WeatherAttribute.DARKNESS] == [4.8, -4.8]
 
+    def test_PointInTime_Slots(self):
+        pointInTime = PointInTime(datetime.datetime(2020, 1, 1, 12, 0, 0))
+        pointInTime.add(WeatherAttribute.WIND, (6, 11))
+        assert not hasattr(pointInTime, '__dict__')
+        assert pointInTime.wind == (6, 11)
+        assert pointInTime.get(WeatherAttribute.WIND) == (6, 11)
+        assert pointInTime.get(WeatherAttribute.SMOKE) is None
+
+    def test_PointInTime_DataView(self):
+        pointInTime = PointInTime(datetime.datetime(2020, 1, 1, 12, 0, 0))
+        pointInTime.add(WeatherAttribute.HUMIDITY, (25, 30))
+        pointInTime.add(WeatherAttribute.CLOUD_COVER, 0)
+        data = pointInTime.data
+        assert list(data) == [WeatherAttribute.CLOUD_COVER, WeatherAttribute.HUMIDITY]
+        assert len(data) == 2
+        assert data.get(WeatherAttribute.SMOKE) is None
+        assert WeatherAttribute.SMOKE not in data
+        with pytest.raises(KeyError):
+            data[WeatherAttribute.SMOKE]
+        with pytest.raises(TypeError):
+            data[WeatherAttribute.SMOKE] = 0
+
+    def test_PointInTime_Pickle(self):
+        pointInTime = PointInTime(datetime.datetime(2020, 1, 1, 12, 0, 0))
+        pointInTime.add(WeatherAttribute.TRANSPARENCY, Transparency.POOR)
+        pointInTime.add(WeatherAttribute.DARKNESS, 4.8)
+        loaded = pickle.loads(pickle.dumps(pointInTime))
+        assert loaded.timestamp == pointInTime.timestamp
+        assert dict(loaded.data) == dict(pointInTime.data)
+
+    def test_PointInTime_UnpickleDictState(self):
+        timestamp = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        pointInTime = PointInTime.__new__(PointInTime)
+        pointInTime.__setstate__({'timestamp': timestamp, 'data': {WeatherAttribute.DARKNESS: [4.8]}})
+        assert pointInTime.timestamp == timestamp
+        assert pointInTime.data == {WeatherAttribute.DARKNESS: [4.8]}
+
 class TestAlertProfile:
     def test_AlertProfile_String(self):
         alertProfile = AlertProfile('user', 'name of profile')
@@ -251,3 +291,84 @@ class TestAlertProfile:
         assert len(AlertProfile.getAllForUser('userAll')) == 2
         os.remove('AlertProfiles/userAll-profile 1.json')
         os.remove('AlertProfiles/userAll-profile 2.json')
+
+    def test_AlertProfile_GroupByLocation(self):
+        profiles = [AlertProfile('user1', 'profile 1', 'AlbanyNY'),
+                    AlertProfile('user2', 'profile 2', 'BttlRvr0AB'),
+                    AlertProfile('user3', 'profile 3', 'AlbanyNY')]
+        groups = AlertProfile.groupByLocation(profiles)
+        assert list(groups.keys()) == ['AlbanyNY', 'BttlRvr0AB']
+        assert [p.name for p in groups['AlbanyNY']] == ['profile 1', 'profile 3']
+        assert [p.name for p in groups['BttlRvr0AB']] == ['profile 2']
+
+    def test_AlertProfile_GroupByLocation_Empty(self):
+        assert AlertProfile.groupByLocation([]) == {}
+
+    def test_AlertProfile_FindWindows(self):
+        start = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        hours = [(start + datetime.timedelta(hours=i), valid) for i, valid in
+                 enumerate([True, True, False, True, False, True, True, True])]
+        assert list(AlertProfile.findWindows(hours, 2)) == [
+            (start, start + datetime.timedelta(hours=1)),
+            (start + datetime.timedelta(hours=5), start + datetime.timedelta(hours=7))]
+
+    def test_AlertProfile_FindWindows_ShortRunDoesNotCarryOver(self):
+        start = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        hours = [(start + datetime.timedelta(hours=i), valid) for i, valid in
+                 enumerate([True, False, True, True, False])]
+        assert list(AlertProfile.findWindows(hours, 3)) == []
+
+    def test_AlertProfile_FindWindows_ZeroDuration(self):
+        start = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        hours = [(start + datetime.timedelta(hours=i), valid) for i, valid in enumerate([False, True, False])]
+        assert list(AlertProfile.findWindows(hours, 0)) == [(start + datetime.timedelta(hours=1),) * 2]
+
+    def test_AlertProfile_CheckForAlertStream(self):
+        startDay = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        def hours():
+            for i in range(0, 10):
+                pointInTime = PointInTime(startDay + datetime.timedelta(hours=i))
+                pointInTime.add(WeatherAttribute.CLOUD_COVER, 100 if i == 4 else 0)
+                yield pointInTime
+        alertProfile = AlertProfile('user', 'name of profile')
+        alertProfile.setDuration(2)
+        alertProfile.add(WeatherAttribute.CLOUD_COVER, 50)
+        stream = alertProfile.checkForAlertStream(hours())
+        assert next(stream) == (startDay, startDay + datetime.timedelta(hours=3))
+        assert next(stream) == (startDay + datetime.timedelta(hours=5), startDay + datetime.timedelta(hours=9))
+        assert list(stream) == []
+
+    def test_AlertProfile_CheckForAlert_RecompilesOnChange(self):
+        startDay = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        weatherData = dict()
+        for i in range(0, 4):
+            pointInTime = PointInTime(startDay + datetime.timedelta(hours=i))
+            pointInTime.add(WeatherAttribute.CLOUD_COVER, 30)
+            pointInTime.add(WeatherAttribute.TEMPERATURE, (50, 59))
+            weatherData[pointInTime.timestamp] = pointInTime
+        window = [(startDay, startDay + datetime.timedelta(hours=3))]
+        alertProfile = AlertProfile('user', 'name of profile')
+        alertProfile.setDuration(1)
+        assert alertProfile.checkForAlert(weatherData) == window
+        alertProfile.add(WeatherAttribute.CLOUD_COVER, 20)
+        assert alertProfile.checkForAlert(weatherData) == []
+        alertProfile.remove(WeatherAttribute.CLOUD_COVER)
+        alertProfile.add(WeatherAttribute.TEMPERATURE, (41, 59))
+        assert alertProfile.checkForAlert(weatherData) == window
+        alertProfile.save()
+        alertProfile.add(WeatherAttribute.TEMPERATURE, (60, 70))
+        assert alertProfile.checkForAlert(weatherData) == []
+        alertProfile.load()
+        assert alertProfile.checkForAlert(weatherData) == window
+        os.remove('AlertProfiles/user-name of profile.json')
+
+    def test_AlertProfile_CheckForAlert_MissingAttributeMatches(self):
+        startDay = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        pointInTime = PointInTime(startDay)
+        pointInTime.add(WeatherAttribute.SEEING, 0.8)
+        alertProfile = AlertProfile('user', 'name of profile')
+        alertProfile.setDuration(1)
+        alertProfile.add(WeatherAttribute.TRANSPARENCY, Transparency.AVERAGE)
+        alertProfile.add(WeatherAttribute.DARKNESS, 4.0)
+        alertProfile.add(WeatherAttribute.WIND, 16)
+        assert alertProfile.checkForAlert({startDay: pointInTime}) == [(startDay, startDay)]
@@ -0,0 +1,40 @@
+import asyncio
+import concurrent.futures
+
+import clearDarkSkyWeb
+from clearDarkSkyCache import ForecastCache
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyParallel import BatchParser
+from tests.sampleData import readSamplePage
+
+class TestBatchParser:
+    def test_BatchParser_ProcessPool(self):
+        parser = BatchParser(workers=2, chunkSize=1)
+        try:
+            forecasts = parser.parse([readSamplePage(), b'<html></html>', readSamplePage()])
+        finally:
+            parser.shutdown()
+        assert isinstance(forecasts[0], ForecastFrame)
+        assert forecasts[1] is None
+        assert forecasts[0].timestamps == clearDarkSkyWeb.parseForecast(readSamplePage()).timestamps
+        assert parser.stats == {'parsed': 2, 'failed': 1, 'cached': 0}
+
+    def test_BatchParser_KeepsOrderAcrossChunks(self):
+        parser = BatchParser(chunkSize=2, executor=concurrent.futures.ThreadPoolExecutor(max_workers=2))
+        pages = [readSamplePage() if i % 2 == 0 else '' for i in range(5)]
+        forecasts = asyncio.run(parser.parseAsync(pages))
+        assert [forecast is not None for forecast in forecasts] == [True, False, True, False, True]
+
+    def test_BatchParser_Empty(self):
+        parser = BatchParser(executor=concurrent.futures.ThreadPoolExecutor(max_workers=1))
+        assert parser.parse([]) == []
+
+    def test_BatchParser_Extract(self, tmp_path, sampleServer):
+        cache = ForecastCache(str(tmp_path))
+        parser = BatchParser(executor=concurrent.futures.ThreadPoolExecutor(max_workers=2))
+        forecasts = asyncio.run(sampleServer(parser.extract(['AlbanyNY', 'foo']), cache))
+        assert isinstance(forecasts['AlbanyNY'], ForecastFrame)
+        assert forecasts['foo'] is None
+        assert cache.lookup('AlbanyNY') is forecasts['AlbanyNY']
+        forecasts = asyncio.run(sampleServer(parser.extract(['AlbanyNY']), cache))
+        assert parser.stats == {'parsed': 1, 'failed': 0, 'cached': 1}
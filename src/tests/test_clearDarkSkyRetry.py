@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from clearDarkSkyRetry import CircuitBreaker, CircuitBreakers, CircuitOpenError, RetryPolicy, StatusError
+
+class Flaky:
+    def __init__(self, failures, error=lambda: ConnectionError('down')):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return 'page'
+
+def unavailable():
+    return StatusError('Unexpected status 503', 503)
+
+class TestRetryPolicy:
+    def test_RetryPolicy_Delay(self):
+        policy = RetryPolicy(baseDelay=1, maxDelay=5, multiplier=2)
+        for attempt in range(10):
+            assert 0 <= policy.delay(attempt) <= min(5, 2 ** attempt)
+
+    def test_RetryPolicy_RetriesUntilSuccess(self):
+        flaky = Flaky(2)
+        assert RetryPolicy(attempts=3, baseDelay=0).call(flaky) == 'page'
+        assert flaky.calls == 3
+
+    def test_RetryPolicy_GivesUp(self):
+        flaky = Flaky(5)
+        with pytest.raises(ConnectionError):
+            RetryPolicy(attempts=3, baseDelay=0).call(flaky)
+        assert flaky.calls == 3
+
+    def test_RetryPolicy_Deadline(self):
+        flaky = Flaky(5)
+        with pytest.raises(ConnectionError):
+            RetryPolicy(attempts=5, baseDelay=10, multiplier=1, deadline=0).call(flaky)
+        assert flaky.calls == 1
+
+    def test_RetryPolicy_Async(self):
+        flaky = Flaky(1)
+        async def attempt():
+            return flaky()
+        assert asyncio.run(RetryPolicy(attempts=2, baseDelay=0).callAsync(attempt)) == 'page'
+        assert flaky.calls == 2
+
+class TestCircuitBreaker:
+    def test_CircuitBreaker_OpensOnTransportFailures(self):
+        breaker = CircuitBreaker('host', failureThreshold=3, resetTimeout=60)
+        flaky = Flaky(100)
+        with pytest.raises(ConnectionError):
+            RetryPolicy(attempts=5, baseDelay=0).call(flaky, breaker=breaker)
+        # Every attempt that does not reach the host counts, and the call stops once the circuit opens
+        assert flaky.calls == 3
+        assert breaker.isOpen()
+        assert breaker.retryAfter() > 0
+        with pytest.raises(CircuitOpenError):
+            RetryPolicy(attempts=5, baseDelay=0).call(flaky, breaker=breaker)
+        assert flaky.calls == 3
+
+    def test_CircuitBreaker_OpensOnStatusErrors(self):
+        breaker = CircuitBreaker('host', failureThreshold=2, resetTimeout=60)
+        flaky = Flaky(100, unavailable)
+        with pytest.raises(StatusError):
+            RetryPolicy(attempts=5, baseDelay=0).call(flaky, breaker=breaker)
+        # The attempts of one call that reached the host count as one failure
+        assert flaky.calls == 5
+        assert breaker.failures == 1
+        assert not breaker.isOpen()
+        with pytest.raises(StatusError):
+            RetryPolicy(attempts=5, baseDelay=0).call(flaky, breaker=breaker)
+        assert flaky.calls == 10
+        assert breaker.isOpen()
+
+    def test_CircuitBreaker_ProbeNotRetried(self):
+        for error in (lambda: ConnectionError('down'), unavailable):
+            breaker = CircuitBreaker('host', failureThreshold=1, resetTimeout=0)
+            breaker.failure()
+            flaky = Flaky(100, error)
+            with pytest.raises(Exception):
+                RetryPolicy(attempts=5, baseDelay=0).call(flaky, breaker=breaker)
+            assert flaky.calls == 1
+            assert breaker.state == CircuitBreaker.OPEN
+
+    def test_CircuitBreaker_SuccessAfterRetries(self):
+        breaker = CircuitBreaker('host', failureThreshold=3, resetTimeout=60)
+        assert RetryPolicy(attempts=5, baseDelay=0).call(Flaky(2), breaker=breaker) == 'page'
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.failures == 0
+        assert RetryPolicy(attempts=5, baseDelay=0).call(Flaky(4, unavailable), breaker=breaker) == 'page'
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.failures == 0
+
+    def test_CircuitBreaker_Probe(self):
+        breaker = CircuitBreaker('host', failureThreshold=1, resetTimeout=0)
+        breaker.failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        breaker.allow()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        breaker.failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        breaker.allow()
+        breaker.success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert not breaker.isOpen()
+
+    def test_CircuitBreaker_OneProbeAtATime(self):
+        breaker = CircuitBreaker('host', failureThreshold=1, resetTimeout=60)
+        breaker.failure()
+        breaker._CircuitBreaker__openedAt -= 60
+        breaker.allow()
+        with pytest.raises(CircuitOpenError):
+            breaker.allow()
+
+    def test_CircuitBreakers_PerHost(self):
+        breakers = CircuitBreakers()
+        first = breakers.forUrl('https://www.cleardarksky.com/c/AlbanyNYkey.html')
+        assert breakers.forUrl('https://www.cleardarksky.com/c/BttlRvr0ABkey.html') is first
+        assert breakers.forUrl('http://127.0.0.1:8080/c/AlbanyNYkey.html') is not first
@@ -0,0 +1,143 @@
+import asyncio
+import datetime
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.date import DateTrigger
+
+from clearDarkSkySchedule import SchedulerManager, ShardedSchedule, SingleFlight, createJobStore, shardOf
+
+def job(shard):
+    pass
+
+async def asyncJob(shard):
+    pass
+
+def startScheduler(path):
+    scheduler = BackgroundScheduler(jobstores={'default': createJobStore(path)})
+    scheduler.start(paused=True)
+    return scheduler
+
+class TestShardOf:
+    def test_shardOf_Stable(self):
+        assert shardOf('AlbanyNY', 12) == shardOf('AlbanyNY', 12)
+        assert all(0 <= shardOf(f'Site{i}', 12) < 12 for i in range(100))
+
+    def test_shardOf_Spread(self):
+        counts = [0] * 4
+        for i in range(1000):
+            counts[shardOf(f'Site{i}', 4)] += 1
+        assert min(counts) > 200
+
+class TestShardedSchedule:
+    def test_ShardedSchedule_StartTimes(self):
+        schedule = ShardedSchedule(shards=4, startHour=7, startMinute=0, window=3600, rate=4)
+        assert schedule.startTimes(10) == [(7, 0, 0), (7, 15, 0), (7, 30, 0), (7, 45, 0)]
+
+    def test_ShardedSchedule_WindowGrows(self):
+        schedule = ShardedSchedule(shards=2, startHour=23, startMinute=0, window=3600, headroom=1.5, rate=1)
+        assert schedule.windowFor(100) == 3600
+        assert schedule.windowFor(4800) == 7200
+        assert schedule.startTimes(4800) == [(23, 0, 0), (0, 0, 0)]
+        assert schedule.windowFor(10 ** 6) == 24 * 60 * 60
+
+    def test_ShardedSchedule_Install(self):
+        scheduler = BackgroundScheduler()
+        scheduler.start(paused=True)
+        schedule = ShardedSchedule(shards=3, window=3600)
+        schedule.install(scheduler, job, 10)
+        schedule.install(scheduler, job, 10)
+        jobs = sorted(scheduler.get_jobs(), key=lambda job: job.id)
+        scheduler.shutdown()
+        assert [job.id for job in jobs] == ['alerts-shard-0', 'alerts-shard-1', 'alerts-shard-2']
+        assert [job.args for job in jobs] == [(0,), (1,), (2,)]
+        assert all(job.misfire_grace_time == 1200 and job.coalesce for job in jobs)
+
+    def test_ShardedSchedule_LocationsFor(self):
+        schedule = ShardedSchedule(shards=3)
+        locations = [f'Site{i}' for i in range(30)]
+        shards = [schedule.locationsFor(locations, shard) for shard in range(3)]
+        assert sorted(sum(shards, [])) == sorted(locations)
+
+    def test_ShardedSchedule_DropsExtraShards(self):
+        scheduler = BackgroundScheduler()
+        scheduler.start(paused=True)
+        ShardedSchedule(shards=4).install(scheduler, job, 10)
+        ShardedSchedule(shards=2).install(scheduler, job, 10)
+        ids = sorted(job.id for job in scheduler.get_jobs())
+        scheduler.shutdown()
+        assert ids == ['alerts-shard-0', 'alerts-shard-1']
+
+class TestJobStore:
+    def test_JobStore_SurvivesRestart(self, tmp_path):
+        path = str(tmp_path / 'Scheduler.db')
+        scheduler = startScheduler(path)
+        ShardedSchedule(shards=2).install(scheduler, job, 10)
+        before = {job.id: job.next_run_time for job in scheduler.get_jobs()}
+        scheduler.shutdown()
+        scheduler = startScheduler(path)
+        ShardedSchedule(shards=2).install(scheduler, job, 10)
+        after = {job.id: job.next_run_time for job in scheduler.get_jobs()}
+        scheduler.shutdown()
+        assert after == before
+
+    def test_JobStore_KeepsMissedRun(self, tmp_path):
+        path = str(tmp_path / 'Scheduler.db')
+        scheduler = startScheduler(path)
+        ShardedSchedule(shards=1).install(scheduler, job, 10)
+        scheduler.shutdown()
+        # Edited through the store, a running scheduler could fire the missed run while shutting down
+        store = createJobStore(path)
+        store.start(BackgroundScheduler(), 'default')
+        missed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)
+        stored = store.lookup_job('alerts-shard-0')
+        stored.next_run_time = missed
+        store.update_job(stored)
+        store.shutdown()
+        scheduler = startScheduler(path)
+        ShardedSchedule(shards=1).install(scheduler, job, 10)
+        assert scheduler.get_job('alerts-shard-0').next_run_time == missed
+        scheduler.shutdown()
+
+    def test_JobStore_Operations(self, tmp_path):
+        scheduler = startScheduler(str(tmp_path / 'Scheduler.db'))
+        runAt = datetime.datetime(2100, 1, 1, tzinfo=datetime.timezone.utc)
+        scheduler.add_job(job, DateTrigger(runAt), args=[1], id='later')
+        store = scheduler._lookup_jobstore('default')
+        assert store.lookup_job('later').args == (1,)
+        assert store.get_next_run_time() == runAt
+        assert store.get_due_jobs(runAt)[0].id == 'later'
+        assert store.get_due_jobs(runAt - datetime.timedelta(seconds=1)) == []
+        scheduler.remove_job('later')
+        assert store.lookup_job('later') is None
+        assert store.get_next_run_time() is None
+        scheduler.shutdown()
+
+class TestSchedulerManager:
+    def test_SchedulerManager_StartsOnce(self, tmp_path):
+        async def run():
+            manager = SchedulerManager(ShardedSchedule(shards=3), str(tmp_path / 'Scheduler.db'))
+            assert manager.start(asyncJob, 10)
+            scheduler = manager.scheduler
+            assert not manager.start(asyncJob, 10)
+            assert manager.scheduler is scheduler
+            assert len(scheduler.get_jobs()) == 3
+            manager.shutdown()
+        asyncio.run(run())
+
+class TestSingleFlight:
+    def test_SingleFlight_JoinsRunningCall(self):
+        calls = []
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+        async def run():
+            flight = SingleFlight()
+            results = await asyncio.gather(flight.run('a', work, 1), flight.run('a', work, 1), flight.run('b', work, 2))
+            assert not flight.running('a')
+            again = await flight.run('a', work, 3)
+            return results, again
+        results, again = asyncio.run(run())
+        assert results == [2, 2, 4]
+        assert again == 6
+        assert calls == [1, 2, 3]
@@ -0,0 +1,102 @@
+import datetime
+import math
+import struct
+
+import pytest
+
+import clearDarkSkySnapshot
+import clearDarkSkyWeb
+from clearDarkSkyForecast import ForecastFrame
+from clearDarkSkyEnums import WeatherAttribute
+from clearDarkSkySnapshot import Snapshot, dumpSnapshot, writeSnapshot, HEADER, MAXIMUM
+from tests.sampleData import everyValueForm, randomProfile, readSamplePage, sameForecast
+
+class TestSnapshot:
+    def test_Snapshot_RoundTripEveryValueForm(self):
+        weatherData = everyValueForm()
+        snapshot = Snapshot(dumpSnapshot(ForecastFrame.fromWeatherData(weatherData)))
+        assert sameForecast(weatherData, snapshot.frame())
+        assert snapshot.lastUpdated is None
+
+    def test_Snapshot_RoundTripSample(self, tmp_path):
+        frame = clearDarkSkyWeb.parseForecast(readSamplePage())
+        filename = str(tmp_path / 'AlbanyNY.cdsf')
+        writeSnapshot(filename, frame, '2023-05-25 13:12:13')
+        snapshot = Snapshot.open(filename)
+        loaded = snapshot.frame()
+        assert sameForecast(frame, loaded)
+        assert snapshot.lastUpdated == datetime.datetime(2023, 5, 25, 13, 12, 13)
+        assert snapshot.hours == 84
+        del loaded
+        snapshot.close()
+
+    def test_Snapshot_ColumnsAreViews(self, tmp_path):
+        frame = ForecastFrame.fromWeatherData(everyValueForm())
+        filename = str(tmp_path / 'forecast.cdsf')
+        writeSnapshot(filename, frame)
+        with Snapshot.open(filename) as snapshot:
+            wind = snapshot.column(WeatherAttribute.WIND, MAXIMUM)
+            assert isinstance(wind, memoryview) and wind.readonly
+            assert list(wind[:2]) == [5.0, math.inf]
+            del wind
+
+    def test_Snapshot_LittleEndian(self):
+        frame = ForecastFrame.fromWeatherData(everyValueForm())
+        data = dumpSnapshot(frame)
+        seconds = int((frame.timestamps[0] - datetime.datetime(1970, 1, 1)).total_seconds())
+        assert struct.pack('<q', seconds) in data
+        assert struct.pack('<4d', 4.8, 5.2, -0.0, -4.0) in data
+
+    def test_Snapshot_BigEndianHost(self, monkeypatch):
+        weatherData = everyValueForm()
+        native = dumpSnapshot(ForecastFrame.fromWeatherData(weatherData))
+        monkeypatch.setattr(clearDarkSkySnapshot.sys, 'byteorder', 'big')
+        # Pretending the host is big-endian swaps both ways, so only the round trip can be checked here
+        swapped = dumpSnapshot(ForecastFrame.fromWeatherData(weatherData))
+        assert swapped != native
+        assert sameForecast(weatherData, Snapshot(swapped).frame())
+
+    def test_Snapshot_CheckForAlert(self):
+        frame = clearDarkSkyWeb.parseForecast(readSamplePage())
+        loaded = Snapshot(dumpSnapshot(frame)).frame()
+        for _ in range(20):
+            profile = randomProfile()
+            assert profile.checkForAlert(loaded) == profile.checkForAlert(frame)
+
+    def test_Snapshot_Empty(self):
+        snapshot = Snapshot(dumpSnapshot(ForecastFrame([])))
+        assert len(snapshot.frame()) == 0
+
+    def test_Snapshot_BadMagic(self):
+        data = bytearray(dumpSnapshot(ForecastFrame.fromWeatherData(everyValueForm())))
+        data[0:4] = b'XXXX'
+        with pytest.raises(ValueError):
+            Snapshot(bytes(data))
+
+    def test_Snapshot_UnsupportedVersion(self):
+        data = bytearray(dumpSnapshot(ForecastFrame.fromWeatherData(everyValueForm())))
+        data[4] = 99
+        with pytest.raises(ValueError):
+            Snapshot(bytes(data))
+
+    def test_Snapshot_OpenInvalidClosesMap(self, tmp_path, monkeypatch):
+        maps = []
+        class RecordingMap(clearDarkSkySnapshot.mmap.mmap):
+            def __init__(self, *args, **kwargs):
+                maps.append(self)
+        monkeypatch.setattr(clearDarkSkySnapshot.mmap, 'mmap', RecordingMap)
+        data = dumpSnapshot(ForecastFrame.fromWeatherData(everyValueForm()))
+        for damaged in [b'XXXX' + data[4:], data[:len(data) - 8]]:
+            filename = tmp_path / 'damaged.cdsf'
+            filename.write_bytes(damaged)
+            with pytest.raises(ValueError):
+                Snapshot.open(str(filename))
+            assert maps[-1].closed
+        assert len(maps) == 2
+
+    def test_Snapshot_Truncated(self):
+        data = dumpSnapshot(ForecastFrame.fromWeatherData(everyValueForm()))
+        with pytest.raises(ValueError):
+            Snapshot(data[:len(data) - 8])
+        with pytest.raises(ValueError):
+            Snapshot(data[:HEADER.size - 1])
@@ -0,0 +1,263 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from clearDarkSkyStorage import ProfileStore, JsonProfileStore, SqliteProfileStore, ProfileRegistry, AsyncProfileStore, \
+    migrate
+from clearDarkSkyModel import AlertProfile
+from clearDarkSkyEnums import WeatherAttribute, Transparency
+
+def jsonStore(tmp_path):
+    return JsonProfileStore(str(tmp_path / 'AlertProfiles'))
+
+def sqliteStore(tmp_path):
+    return SqliteProfileStore(str(tmp_path / 'AlertProfiles.db'))
+
+def registry(tmp_path):
+    return ProfileRegistry(jsonStore(tmp_path))
+
+@pytest.fixture(params=[jsonStore, sqliteStore, registry], ids=['json', 'sqlite', 'registry'])
+def store(request, tmp_path):
+    return request.param(tmp_path)
+
+def attributes(location):
+    return {'LOCATION': location, 'DURATION': 2}
+
+class TestProfileStore:
+    def test_ProfileStore_Abstract(self):
+        class PartialStore(ProfileStore):
+            def save(self, username, name, attributes):
+                pass
+        with pytest.raises(TypeError):
+            ProfileStore()
+        with pytest.raises(TypeError):
+            PartialStore()
+
+    def test_ProfileStore_SaveAndLoad(self, store):
+        store.save('123', 'profile 1', attributes('AlbanyNY'))
+        assert store.load('123', 'profile 1') == attributes('AlbanyNY')
+
+    def test_ProfileStore_Load_NotFound(self, store):
+        with pytest.raises(FileNotFoundError):
+            store.load('123', 'profile 1')
+
+    def test_ProfileStore_SaveReplaces(self, store):
+        store.save('123', 'profile 1', attributes('AlbanyNY'))
+        store.save('123', 'profile 1', attributes('BttlRvr0AB'))
+        assert store.load('123', 'profile 1') == attributes('BttlRvr0AB')
+        assert len(store.listAll()) == 1
+
+    def test_ProfileStore_Delete(self, store):
+        store.save('123', 'profile 1', attributes('AlbanyNY'))
+        assert store.delete('123', 'profile 1')
+        assert not store.delete('123', 'profile 1')
+        assert store.listAll() == []
+
+    def test_ProfileStore_ListForUser_PrefixUsername(self, store):
+        store.save('12', 'profile 1', attributes('AlbanyNY'))
+        store.save('123', 'profile 2', attributes('AlbanyNY'))
+        assert [name for _, name, _ in store.listForUser('12')] == ['profile 1']
+
+    def test_ProfileStore_NameWithSeparators(self, store):
+        store.save('123', 'dark-sky v1.5', attributes('AlbanyNY'))
+        assert [name for _, name, _ in store.listForUser('123')] == ['dark-sky v1.5']
+
+    def test_ProfileStore_ListAll_GroupedByLocation(self, store):
+        store.save('1', 'a', attributes('BttlRvr0AB'))
+        store.save('2', 'b', attributes('AlbanyNY'))
+        store.save('3', 'c', attributes('BttlRvr0AB'))
+        assert [entry[2]['LOCATION'] for entry in store.listAll()] == ['AlbanyNY', 'BttlRvr0AB', 'BttlRvr0AB']
+        assert [name for _, name, _ in store.listForLocation('BttlRvr0AB')] == ['a', 'c']
+        assert store.locations() == ['AlbanyNY', 'BttlRvr0AB']
+
+    def test_ProfileStore_Versions(self, store):
+        store.save('123', 'profile 1', attributes('AlbanyNY'))
+        assert set(store.versions()) == {('123', 'profile 1')}
+        assert store.version('123', 'profile 1') == store.versions()[('123', 'profile 1')]
+        assert store.version('123', 'profile 2') is None
+
+class TestProfileRegistry:
+    def test_ProfileRegistry_ServesFromMemory(self, tmp_path):
+        backing = jsonStore(tmp_path)
+        backing.save('123', 'profile 1', attributes('AlbanyNY'))
+        registry = ProfileRegistry(backing, refreshInterval=3600)
+        assert registry.load('123', 'profile 1') == attributes('AlbanyNY')
+        os.remove(backing.getFilename('123', 'profile 1'))
+        assert registry.load('123', 'profile 1') == attributes('AlbanyNY')
+        assert registry.stats['loaded'] == 1
+
+    def test_ProfileRegistry_ReturnsCopies(self, tmp_path):
+        registry = ProfileRegistry(jsonStore(tmp_path))
+        registry.save('123', 'profile 1', attributes('AlbanyNY'))
+        registry.load('123', 'profile 1')['DURATION'] = 5
+        assert registry.load('123', 'profile 1')['DURATION'] == 2
+
+    def test_ProfileRegistry_WriteThrough(self, tmp_path):
+        backing = jsonStore(tmp_path)
+        registry = ProfileRegistry(backing, refreshInterval=3600)
+        registry.save('123', 'profile 1', attributes('AlbanyNY'))
+        assert backing.load('123', 'profile 1') == attributes('AlbanyNY')
+        assert registry.delete('123', 'profile 1')
+        assert backing.listAll() == []
+        assert registry.listForLocation('AlbanyNY') == []
+
+    def test_ProfileRegistry_ReloadsOnlyChanged(self, tmp_path):
+        backing = jsonStore(tmp_path)
+        backing.save('1', 'a', attributes('AlbanyNY'))
+        backing.save('2', 'b', attributes('AlbanyNY'))
+        backing.save('3', 'c', attributes('AlbanyNY'))
+        registry = ProfileRegistry(backing, refreshInterval=3600)
+        assert len(registry.listAll()) == 3
+        time.sleep(0.01)
+        backing.save('1', 'a', attributes('BttlRvr0AB'))
+        backing.delete('2', 'b')
+        backing.save('4', 'd', attributes('AlbanyNY'))
+        assert len(registry.listForLocation('AlbanyNY')) == 3
+        registry.refresh(force=True)
+        assert [name for _, name, _ in registry.listForLocation('AlbanyNY')] == ['c', 'd']
+        assert [name for _, name, _ in registry.listForLocation('BttlRvr0AB')] == ['a']
+        assert registry.stats == {'loaded': 3, 'reloaded': 2, 'dropped': 1}
+
+    def test_ProfileRegistry_LoadMissFallsThrough(self, tmp_path):
+        backing = jsonStore(tmp_path)
+        registry = ProfileRegistry(backing, refreshInterval=3600)
+        assert registry.listAll() == []
+        backing.save('123', 'profile 1', attributes('AlbanyNY'))
+        assert registry.load('123', 'profile 1') == attributes('AlbanyNY')
+
+class SlowStore(JsonProfileStore):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.release = threading.Event()
+        self.saves = []
+
+    def save(self, username, name, attributes):
+        self.release.wait(5)
+        self.saves.append(attributes['DURATION'])
+        super().save(username, name, attributes)
+
+class TestAsyncProfileStore:
+    def test_AsyncProfileStore_RoundTrip(self, tmp_path):
+        async def run():
+            store = AsyncProfileStore(jsonStore(tmp_path))
+            await store.save('123', 'profile 1', attributes('AlbanyNY'))
+            assert await store.load('123', 'profile 1') == attributes('AlbanyNY')
+            assert [name for _, name, _ in await store.listForUser('123')] == ['profile 1']
+            assert await store.delete('123', 'profile 1')
+            assert not await store.delete('123', 'profile 1')
+        asyncio.run(run())
+
+    def test_AsyncProfileStore_CoalescesWrites(self, tmp_path):
+        async def run():
+            backing = SlowStore(str(tmp_path / 'AlertProfiles'))
+            store = AsyncProfileStore(backing)
+            first = asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 1}))
+            await asyncio.sleep(0.05)
+            rest = [asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': i}))
+                    for i in range(2, 6)]
+            await asyncio.sleep(0)
+            assert (await store.load('123', 'profile 1'))['DURATION'] == 5
+            backing.release.set()
+            await asyncio.gather(first, *rest)
+            assert backing.saves == [1, 5]
+            assert store.stats == {'requested': 5, 'written': 2}
+            assert backing.load('123', 'profile 1')['DURATION'] == 5
+        asyncio.run(run())
+
+    def test_AsyncProfileStore_PendingDelete(self, tmp_path):
+        async def run():
+            backing = SlowStore(str(tmp_path / 'AlertProfiles'))
+            store = AsyncProfileStore(backing)
+            save = asyncio.ensure_future(store.save('123', 'profile 1', attributes('AlbanyNY')))
+            await asyncio.sleep(0.05)
+            delete = asyncio.ensure_future(store.delete('123', 'profile 1'))
+            await asyncio.sleep(0)
+            with pytest.raises(FileNotFoundError):
+                await store.load('123', 'profile 1')
+            backing.release.set()
+            await save
+            assert await delete
+            assert backing.listAll() == []
+        asyncio.run(run())
+
+    def test_AsyncProfileStore_FailedWrite(self, tmp_path):
+        class FailingStore(SlowStore):
+            def save(self, username, name, attributes):
+                if attributes['DURATION'] == 2:
+                    self.release.wait(5)
+                    raise OSError('Disk full')
+                super().save(username, name, attributes)
+        async def run():
+            backing = FailingStore(str(tmp_path / 'AlertProfiles'))
+            store = AsyncProfileStore(backing)
+            failing = asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 2}))
+            await asyncio.sleep(0.05)
+            later = asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 3}))
+            await asyncio.sleep(0)
+            backing.release.set()
+            with pytest.raises(OSError):
+                await failing
+            # The write queued behind the failed one still runs, for its own caller
+            assert await later is None
+            assert backing.saves == [3]
+            assert (await store.load('123', 'profile 1'))['DURATION'] == 3
+            assert store.stats == {'requested': 2, 'written': 1}
+            with pytest.raises(OSError):
+                await store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 2})
+            # Nothing unwritten is served after a failed write
+            assert (await store.load('123', 'profile 1'))['DURATION'] == 3
+        asyncio.run(run())
+
+    def test_AsyncProfileStore_DeleteBehindSave(self, tmp_path):
+        async def run():
+            backing = SlowStore(str(tmp_path / 'AlertProfiles'))
+            store = AsyncProfileStore(backing)
+            first = asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 1}))
+            await asyncio.sleep(0.05)
+            second = asyncio.ensure_future(store.save('123', 'profile 1', {'LOCATION': 'AlbanyNY', 'DURATION': 2}))
+            delete = asyncio.ensure_future(store.delete('123', 'profile 1'))
+            await asyncio.sleep(0)
+            backing.release.set()
+            assert await asyncio.gather(first, second, delete) == [None, None, True]
+            assert backing.saves == [1, 2]
+            assert backing.listAll() == []
+        asyncio.run(run())
+
+class TestMigrate:
+    def test_Migrate_JsonToSqlite(self, tmp_path):
+        source = jsonStore(tmp_path)
+        source.save('1', 'a', attributes('AlbanyNY'))
+        source.save('2', 'b', attributes('BttlRvr0AB'))
+        destination = sqliteStore(tmp_path)
+        assert migrate(source, destination) == 2
+        assert destination.listAll() == source.listAll()
+
+class TestAlertProfileStore:
+    def test_AlertProfile_SqliteStore(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(AlertProfile, 'store', sqliteStore(tmp_path))
+        profile = AlertProfile('123', 'profile 1', 'AlbanyNY')
+        profile.add(WeatherAttribute.TRANSPARENCY, Transparency.POOR)
+        profile.save()
+        AlertProfile('456', 'profile 2', 'BttlRvr0AB').save()
+        loaded = AlertProfile.getAllForLocation('AlbanyNY')
+        assert [str(profile) for profile in loaded] == ['profile 1 by 123']
+        assert loaded[0].get(WeatherAttribute.TRANSPARENCY) == Transparency.POOR
+        assert [profile.name for profile in AlertProfile.getAllForUser(456)] == ['profile 2']
+
+    def test_AlertProfile_Async(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(AlertProfile, 'store', ProfileRegistry(jsonStore(tmp_path)))
+        async def run():
+            profile = AlertProfile('123', 'profile 1', 'AlbanyNY')
+            profile.add(WeatherAttribute.TRANSPARENCY, Transparency.POOR)
+            await profile.asave()
+            loaded = AlertProfile('123', 'profile 1')
+            await loaded.aload()
+            assert loaded.get(WeatherAttribute.TRANSPARENCY) == Transparency.POOR
+            assert [profile.name for profile in await AlertProfile.agetAllForUser(123)] == ['profile 1']
+            assert await loaded.adelete()
+            with pytest.raises(FileNotFoundError):
+                await loaded.aload()
+        asyncio.run(run())
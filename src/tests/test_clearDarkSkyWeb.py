@@ -1,10 +1,19 @@
 import pytest
+import asyncio
 import math
 import datetime
+import os
+import threading
 
 from bs4 import BeautifulSoup
 
 import clearDarkSkyWeb
+from clearDarkSkyArchive import ForecastArchive
+from clearDarkSkyCache import ForecastCache
+from clearDarkSkyRetry import CircuitBreakers
+from clearDarkSkyEnums import WeatherAttribute
+from clearDarkSkyConstants import PARSER_SOUP
+from tests.sampleData import readSamplePage
 
 class TestValidateLocationKey:
     def test_validateLocationKey_Valid(self):
@@ -40,4 +49,216 @@ class TestExtractWeatherData:
         assert len(data) >= 1
 
     def test_extractWeatherData_Invalid(self):
-        assert clearDarkSkyWeb.extractWeatherData('foo') == None
\ No newline at end of file
+        assert clearDarkSkyWeb.extractWeatherData('foo') == None
+
+class TestParseWeatherData:
+    def test_parseWeatherData_Sample(self):
+        data = clearDarkSkyWeb.parseWeatherData(readSamplePage())
+        hours = list(data.keys())
+        assert len(data) == 84
+        assert hours[0] == datetime.datetime(2023, 5, 25, 13, 0)
+        assert hours[-1] == datetime.datetime(2023, 5, 29, 0, 0)
+        assert len(data[hours[0]].data) == 8
+        assert len(data[hours[0]].data[WeatherAttribute.DARKNESS]) == 4
+        assert WeatherAttribute.SMOKE not in data[hours[-1]].data
+
+    def test_parseWeatherData_NoMap(self):
+        with pytest.raises(AttributeError):
+            clearDarkSkyWeb.parseWeatherData('<html><body></body></html>')
+
+def assertSameWeatherData(first, second):
+    assert list(first.keys()) == list(second.keys())
+    for timestamp in first:
+        assert first[timestamp].timestamp == second[timestamp].timestamp
+        assert first[timestamp].data == second[timestamp].data
+
+class TestParseWeatherDataFast:
+    def test_parseWeatherDataFast_SameAsSoup(self):
+        content = readSamplePage()
+        assertSameWeatherData(clearDarkSkyWeb.parseWeatherDataFast(content),
+                              clearDarkSkyWeb.parseWeatherDataSoup(content))
+
+    def test_parseWeatherDataFast_Default(self):
+        content = readSamplePage()
+        assertSameWeatherData(clearDarkSkyWeb.parseWeatherData(content),
+                              clearDarkSkyWeb.parseWeatherData(content, PARSER_SOUP))
+
+    def test_parseWeatherDataFast_AttributeForms(self):
+        html = '<FONT size=-1>Last updated 2023-05-25 13:12:13.</FONT>' \
+            '<map name=other><area coords="134,77,145,92" title="13:00: Overcast"></map>' \
+            "<MAP id='x' name='ckmap'><area shape=rect href='/a>b' title='13:00: &gt;45 mph (00Z+13hr)' COORDS=134,189,145,204>" \
+            '<area coords="134,77,145,92"><area title="ignored" coords="134,77,145,92" title="13:00: Clear">' \
+            '<area coords="146,77,157,92" title="14:00: 10% covered"></MAP>' \
+            '<map name="ckmap"><area coords="134,77,145,92" title="13:00: Overcast"></map>'
+        fast = clearDarkSkyWeb.parseWeatherDataFast(html)
+        assertSameWeatherData(fast, clearDarkSkyWeb.parseWeatherDataSoup(html))
+        start = datetime.datetime(2023, 5, 25, 13, 0)
+        assert fast[start].data == {WeatherAttribute.WIND: (45, math.inf), WeatherAttribute.CLOUD_COVER: 0}
+        assert fast[start + datetime.timedelta(hours=1)].data == {WeatherAttribute.CLOUD_COVER: 10}
+
+    def test_parseWeatherDataFast_NoDate(self):
+        html = '<p>Last updated 2023-05-25</p><map name="ckmap"><area coords="134,77,145,92" title="13:00: Clear"></map>'
+        assert list(clearDarkSkyWeb.parseWeatherDataFast(html).keys()) == [datetime.datetime(1970, 1, 1, 13, 0)]
+        assertSameWeatherData(clearDarkSkyWeb.parseWeatherDataFast(html), clearDarkSkyWeb.parseWeatherDataSoup(html))
+
+    def test_parseWeatherDataFast_NoMap(self):
+        with pytest.raises(AttributeError):
+            clearDarkSkyWeb.parseWeatherDataFast('<html><map name="ckmapx"></map></html>')
+
+class TestExtractLastUpdated:
+    def test_extractLastUpdated_Sample(self):
+        assert clearDarkSkyWeb.extractLastUpdated(readSamplePage()) == '2023-05-25 13:12:13'
+
+    def test_extractLastUpdated_Missing(self):
+        assert clearDarkSkyWeb.extractLastUpdated('<html></html>') is None
+
+class TestAsyncFetch:
+    def test_extractWeatherDataAsync_Valid(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        data = asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY'), cache))
+        assert len(data) == 84
+        assert cache.stats['misses'] == 1
+
+    def test_extractWeatherDataAsync_Invalid(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        assert asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('foo'), cache)) is None
+
+    def test_extractWeatherDataAsync_Cached(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        async def fetchTwice():
+            first = await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            second = await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            return first, second
+        first, second = asyncio.run(sampleServer(fetchTwice(), cache))
+        assert first is second
+        assert cache.stats['hits'] == 1
+
+    def test_extractWeatherDataAsync_NotModified(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path), ttl=-1)
+        async def fetchTwice():
+            first = await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            second = await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            return first, second
+        first, second = asyncio.run(sampleServer(fetchTwice(), cache))
+        assert first is second
+        assert cache.stats['revalidated'] == 1
+        assert cache.stats['misses'] == 1
+
+    def test_extractWeatherDataAsync_Archived(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path / 'cache'), ttl=-1)
+        archive = ForecastArchive(str(tmp_path / 'archive'))
+        async def fetchTwice():
+            await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            return await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+        data = asyncio.run(sampleServer(fetchTwice(), cache, archive=archive))
+        # The revalidated page is the same forecast, so it is archived once
+        [(_, frame)] = archive.covering('AlbanyNY', next(iter(data)))
+        assert list(frame.keys()) == list(data.keys())
+        archive.close()
+
+    def test_extractWeatherDataAsync_ArchiveFails(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        threads = []
+        class FailingArchive:
+            def append(self, location, data, lastUpdated):
+                threads.append(threading.get_ident())
+                raise ValueError('Bad "Last updated" stamp')
+        data = asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY'), cache, archive=FailingArchive()))
+        assert len(data) == 84
+        assert cache.lookup('AlbanyNY') is data
+        # Archived off the event loop thread
+        assert len(threads) == 1 and threads[0] != threading.get_ident()
+
+    def test_extractWeatherDataAsync_CacheOffLoop(self, sampleServer, tmp_path):
+        threads = []
+        class RecordingCache(ForecastCache):
+            def lookup(self, location):
+                threads.append(threading.get_ident())
+                return super().lookup(location)
+            def store(self, location, data, lastUpdated, headers=None):
+                threads.append(threading.get_ident())
+                super().store(location, data, lastUpdated, headers)
+        cache = RecordingCache(str(tmp_path))
+        data = asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY'), cache))
+        assert len(data) == 84
+        # Looked up and stored on the thread pool, not the event loop thread
+        assert len(threads) == 2 and threading.get_ident() not in threads
+
+    def test_validateLocationKeyAsync_Valid(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        assert asyncio.run(sampleServer(clearDarkSkyWeb.validateLocationKeyAsync('AlbanyNY'), cache))
+
+    def test_validateLocationKeyAsync_Invalid(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        assert not asyncio.run(sampleServer(clearDarkSkyWeb.validateLocationKeyAsync('foo'), cache))
+
+    def test_extractWeatherDataAsync_Retried(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        requested = []
+        assert asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('down'), cache, requested)) is None
+        assert requested == ['down', 'down']
+
+    def test_extractWeatherDataAsync_CircuitOpen(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        requested = []
+        breakers = CircuitBreakers(failureThreshold=2, resetTimeout=60)
+        async def fetch():
+            first = await clearDarkSkyWeb.extractWeatherDataAsync('down')
+            # One failing page does not open the circuit for the others
+            openAfterOne = clearDarkSkyWeb.hostBreaker().isOpen()
+            await clearDarkSkyWeb.extractWeatherDataAsync('down')
+            open = clearDarkSkyWeb.hostBreaker().isOpen()
+            second = await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+            return first, openAfterOne, open, second
+        result = asyncio.run(sampleServer(fetch(), cache, requested, breakers))
+        assert result == (None, False, True, None)
+        assert requested == ['down', 'down', 'down', 'down']
+
+    def test_extractWeatherDataAsync_NotFoundNotCounted(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        breakers = CircuitBreakers(failureThreshold=2, resetTimeout=60)
+        async def fetch():
+            for _ in range(3):
+                assert await clearDarkSkyWeb.extractWeatherDataAsync('foo') is None
+            return clearDarkSkyWeb.hostBreaker().failures, clearDarkSkyWeb.hostBreaker().isOpen()
+        assert asyncio.run(sampleServer(fetch(), cache, breakers=breakers)) == (0, False)
+
+    def test_validateLocationKeyAsync_Cached(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        requested = []
+        async def validate():
+            results = []
+            for location in ['AlbanyNY', 'foo', 'AlbanyNY', 'foo']:
+                results.append(await clearDarkSkyWeb.validateLocationKeyAsync(location))
+            return results
+        results = asyncio.run(sampleServer(validate(), cache, requested))
+        assert results == [True, False, True, False]
+        assert requested == ['AlbanyNY', 'foo']
+
+    def test_validateLocationKeyAsync_Malformed(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path / 'cache'))
+        requested = []
+        async def validate():
+            return [await clearDarkSkyWeb.validateLocationKeyAsync(location)
+                    for location in ['../AlbanyNY', 'Albany NY', '']]
+        assert asyncio.run(sampleServer(validate(), cache, requested)) == [False, False, False]
+        assert requested == []
+        assert clearDarkSkyWeb.locationKeyCache.lookup('../AlbanyNY') is None
+        assert not os.path.exists(tmp_path / 'cache')
+
+    def test_validateLocationKeyAsync_WarmsForecast(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        requested = []
+        async def validateAndFetch():
+            assert await clearDarkSkyWeb.validateLocationKeyAsync('AlbanyNY')
+            return await clearDarkSkyWeb.extractWeatherDataAsync('AlbanyNY')
+        data = asyncio.run(sampleServer(validateAndFetch(), cache, requested))
+        assert len(data) == 84
+        assert requested == ['AlbanyNY']
+        assert cache.stats == {'hits': 1, 'revalidated': 0, 'unchanged': 0, 'misses': 1}
+
+    def test_extractWeatherDataAsync_NotFoundNotRetried(self, sampleServer, tmp_path):
+        cache = ForecastCache(str(tmp_path))
+        requested = []
+        assert asyncio.run(sampleServer(clearDarkSkyWeb.extractWeatherDataAsync('foo'), cache, requested)) is None
+        assert requested == ['foo']